@@ -0,0 +1,140 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import random
+import threading
+import time
+from collections import deque
+
+LEAST_OUTSTANDING = 'least_outstanding'
+POWER_OF_TWO = 'p2c'
+
+class _EndpointState:
+    def __init__(self, name, window):
+        self.name = name
+        self.inFlight = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+        self.latency = None
+        self.outcomes = deque(maxlen=window)
+        self.ejectedUntil = 0.0
+        self.probing = False
+
+    def errorRate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+class EndpointPool:
+    """Client-side load balancer over endpoints that serve the same model.
+
+    Endpoints are picked by least outstanding requests or by power of two
+    random choices. An endpoint whose recent error rate passes the threshold
+    is ejected for a while and then gets a single probe request; it rejoins
+    the pool only if the probe succeeds. If every endpoint is ejected the
+    pool routes to all of them rather than failing outright.
+    """
+
+    def __init__(self, endpoints, policy=LEAST_OUTSTANDING, error_threshold=0.5, min_requests=10,
+                 window=50, ejection_time=30.0, latency_decay=0.2):
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        if policy not in (LEAST_OUTSTANDING, POWER_OF_TWO):
+            raise ValueError(f"Unsupported load balancing policy {policy}")
+        self._policy = policy
+        self._error_threshold = error_threshold
+        self._min_requests = min_requests
+        self._ejection_time = ejection_time
+        self._latency_decay = latency_decay
+        self._lock = threading.Lock()
+        self._endpoints = [_EndpointState(name, window) for name in endpoints]
+
+    @staticmethod
+    def parse(value):
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    @property
+    def endpoints(self):
+        return [state.name for state in self._endpoints]
+
+    def _state(self, name):
+        return next(s for s in self._endpoints if s.name == name)
+
+    def _available(self, now, exclude):
+        available = []
+        for state in self._endpoints:
+            if state.name in exclude:
+                continue
+            if state.ejectedUntil > now:
+                continue
+            if state.ejectedUntil and state.probing:
+                # One probe at a time for an endpoint coming back from ejection
+                continue
+            available.append(state)
+        return available
+
+    def choose(self, exclude=()):
+        """Picks an endpoint by the pool's policy without counting a request."""
+        with self._lock:
+            now = time.monotonic()
+            candidates = self._available(now, exclude)
+            if not candidates:
+                candidates = [s for s in self._endpoints if s.name not in exclude] or self._endpoints
+            if self._policy == POWER_OF_TWO and len(candidates) > 2:
+                candidates = random.sample(candidates, 2)
+            state = min(candidates, key=lambda s: (s.inFlight, s.latency or 0.0, random.random()))
+            return state.name
+
+    def acquire(self, name):
+        """Counts a request to the endpoint as in flight."""
+        with self._lock:
+            state = self._state(name)
+            if state.ejectedUntil and state.ejectedUntil <= time.monotonic():
+                state.probing = True
+            state.inFlight = state.inFlight + 1
+            state.requests = state.requests + 1
+
+    def release(self, name, latency=None, ok=True):
+        """Records the outcome of a request started with acquire()."""
+        with self._lock:
+            state = self._state(name)
+            state.inFlight = max(0, state.inFlight - 1)
+            if latency is not None and ok:
+                if state.latency is None:
+                    state.latency = latency
+                else:
+                    state.latency = (1 - self._latency_decay) * state.latency + self._latency_decay * latency
+            state.outcomes.append(bool(ok))
+            if not ok:
+                state.failures = state.failures + 1
+            if state.probing:
+                state.probing = False
+                if ok:
+                    state.ejectedUntil = 0.0
+                    state.outcomes.clear()
+                else:
+                    self._eject(state)
+            elif not state.ejectedUntil and len(state.outcomes) >= self._min_requests \
+                    and state.errorRate() >= self._error_threshold:
+                self._eject(state)
+
+    def _eject(self, state):
+        state.ejectedUntil = time.monotonic() + self._ejection_time
+        state.ejections = state.ejections + 1
+        print(f"Ejecting endpoint {state.name} for {self._ejection_time}s, error rate {state.errorRate():.2f}")
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                state.name: {
+                    'inFlight': state.inFlight,
+                    'requests': state.requests,
+                    'failures': state.failures,
+                    'ejections': state.ejections,
+                    'errorRate': state.errorRate(),
+                    'latencyEwma': state.latency,
+                    'ejected': state.ejectedUntil > now,
+                } for state in self._endpoints
+            }
@@ -0,0 +1,151 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import hashlib
+import json
+import os
+import uuid
+import numpy as np
+
+CHECKPOINT = 'checkpoint.json'
+# Checkpoints from an older shard layout are ignored and their shards dropped
+SHARD_FORMAT = 2
+KEYS_SUFFIX = '.keys.npy'
+
+def _keys_path(path):
+    return path[:-len('.npy')] + KEYS_SUFFIX
+
+def _write_atomic(path, write):
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class EmbeddingCache:
+    """Embeddings of chunk text keyed by a hash of the endpoint and the text.
+
+    New embeddings are buffered and written as shards every flush_every
+    chunks: a .npy file of vectors and a .keys.npy file of their keys.
+    checkpoint.json lists the complete shards. Both are replaced atomically,
+    so a job that stops part way resumes from its last flush and only embeds
+    what is still missing. Written shards are memory mapped, so only the
+    keys and the unflushed vectors are held in memory.
+    """
+
+    def __init__(self, directory, endpoint_name, flush_every=512):
+        self._directory = directory
+        self._endpoint_name = endpoint_name
+        self._flush_every = flush_every
+        self._index = {}
+        self._arrays = {}
+        self._pending = {}
+        self._used = set()
+        self._shards = []
+        os.makedirs(directory, exist_ok=True)
+        checkpoint = self._read_checkpoint()
+        if checkpoint and checkpoint['endpoint'] == endpoint_name and checkpoint.get('format') == SHARD_FORMAT:
+            for shard in checkpoint['shards']:
+                self._open_shard(shard)
+            self._shards = checkpoint['shards']
+            print(f"Loaded {len(self._index)} cached embeddings from {len(self._shards)} shards")
+
+    def _read_checkpoint(self):
+        try:
+            with open(os.path.join(self._directory, CHECKPOINT)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _open_shard(self, shard):
+        path = os.path.join(self._directory, shard)
+        self._arrays[shard] = np.load(path, mmap_mode='r')
+        for row, key in enumerate(np.load(_keys_path(path)).tolist()):
+            self._index[key] = (shard, row)
+
+    def _write_shard(self, keys, rows):
+        """Writes a shard of keys and their vectors, which rows yields in the same order."""
+        shard = f"shard-{uuid.uuid4().hex}.npy"
+        path = os.path.join(self._directory, shard)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        first = next(rows)
+        vectors = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32, shape=(len(keys), len(first)))
+        vectors[0] = first
+        for row, vector in enumerate(rows, 1):
+            vectors[row] = vector
+        vectors.flush()
+        del vectors
+        with open(tmp, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        _write_atomic(_keys_path(path), lambda f: np.save(f, np.array(keys)))
+        return shard
+
+    def key(self, text):
+        return hashlib.sha256(f"{self._endpoint_name}\0{text}".encode('utf-8')).hexdigest()
+
+    def __len__(self):
+        return len(self._index) + len(self._pending)
+
+    def get(self, text):
+        """Returns the text's embedding or None, and marks it as used by the current document."""
+        key = self.key(text)
+        vector = self._pending.get(key)
+        if vector is None:
+            location = self._index.get(key)
+            if location is None:
+                return None
+            shard, row = location
+            vector = self._arrays[shard][row]
+        self._used.add(key)
+        return vector
+
+    def put(self, texts, vectors):
+        """Adds embeddings; returns True if this completed a checkpoint."""
+        for text, vector in zip(texts, vectors):
+            key = self.key(text)
+            self._pending[key] = np.asarray(vector, dtype=np.float32)
+            self._used.add(key)
+        if len(self._pending) >= self._flush_every:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        if not self._pending:
+            return
+        keys = list(self._pending)
+        shard = self._write_shard(keys, (self._pending[k] for k in keys))
+        self._write_checkpoint(self._shards + [shard])
+        self._open_shard(shard)
+        self._pending = {}
+
+    def compact(self):
+        """Rewrites the cache as one shard holding only the embeddings used since it was opened."""
+        self.flush()
+        keys = [k for k in self._index if k in self._used]
+        shards = []
+        if keys:
+            shards = [self._write_shard(keys, (self._arrays[s][r] for s, r in map(self._index.get, keys)))]
+        self._index = {}
+        self._arrays = {}
+        for shard in shards:
+            self._open_shard(shard)
+        self._write_checkpoint(shards)
+        # Also drops shards written by jobs that stopped before their checkpoint
+        keep = set(shards) | {_keys_path(shard) for shard in shards}
+        for name in os.listdir(self._directory):
+            if name != CHECKPOINT and name not in keep:
+                os.remove(os.path.join(self._directory, name))
+
+    def _write_checkpoint(self, shards):
+        checkpoint = {
+            'endpoint': self._endpoint_name,
+            'format': SHARD_FORMAT,
+            'shards': shards,
+            'chunks': len(self._index) + len(self._pending),
+        }
+        _write_atomic(os.path.join(self._directory, CHECKPOINT),
+                      lambda f: f.write(json.dumps(checkpoint).encode('utf-8')))
+        self._shards = shards
@@ -0,0 +1,218 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Builds and publishes a document's vector stores. Used by the embedding
+# worker, and by the summarization worker when it runs both stages at once.
+
+import os
+import shutil
+import time
+import uuid
+from decimal import Decimal
+from typing import List
+import json
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.vectorstores import Chroma
+from langchain.embeddings.base import Embeddings
+from pydantic import BaseModel
+from invoker import EndpointInvoker
+from vector_index import IndexSpool
+from publish import MANIFEST, directory_size, publish
+from embedcache import EmbeddingCache
+from s3stream import split_stream
+import pipelinestate
+
+invoker = EndpointInvoker.from_env()
+
+# Stores are built on local scratch disk and published to EFS as a new version,
+# unless build_in_place is set, which writes straight to <docId>/db as before
+build_in_place = os.environ.get('build_in_place', 'false').lower() == 'true'
+scratch_dir = os.environ.get('scratch_dir', '/tmp/build')
+publish_keep_versions = int(os.environ.get('publish_keep_versions', 2))
+
+embed_chunk_size = 500
+embed_batch_size = int(os.environ.get('embed_batch_size', 32))
+embed_checkpoint_chunks = int(os.environ.get('embed_checkpoint_chunks', 512))
+# Chunks are written to Chroma and the ANN spool this many at a time
+store_batch_size = 1000
+
+ann_index = os.environ.get('ann_index', '')
+ann_min_chunks = int(os.environ.get('ann_min_chunks', 5000))
+ann_params = {
+    'hnsw': {'M': 'hnsw_m', 'ef_construction': 'hnsw_ef_construction', 'ef_search': 'hnsw_ef_search'},
+    'ivf': {'nlist': 'ivf_nlist', 'nprobe': 'ivf_nprobe'},
+    'flat': {'compression': 'flat_compression', 'rerank': 'flat_rerank'},
+}
+
+class SMEndpointEmbeddings(BaseModel, Embeddings):
+    endpoint_name: str
+
+    def embed_documents(
+        self, texts: List[str], chunk_size: int = 64
+    ) -> List[List[float]]:
+        results = []
+        for start in range(0, len(texts), chunk_size):
+            results.extend(self.embed_batch(texts[start:start + chunk_size]))
+        return results
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        payload = {'text_inputs': texts}
+        payload = json.dumps(payload).encode('utf-8')
+        response = invoker.invoke(self.endpoint_name, payload)
+
+        model_predictions = json.loads(response)
+        return model_predictions['embedding']
+
+def embed_chunks(embeddings, cache, texts, on_checkpoint, on_batch):
+    """Embeds chunks as they arrive, only calling the endpoint for text not in the cache.
+
+    Chunks are handed to on_batch(texts, vectors) in document order, up to
+    store_batch_size at a time, as soon as their embeddings are known.
+    Returns (chunks, chunks reused, chunks computed).
+    """
+    ready = []
+    batch = []
+    count = 0
+    reused = 0
+    computed = 0
+
+    def embed():
+        nonlocal computed
+        computed = computed + len(batch)
+        checkpointed = cache.put(batch, embeddings.embed_batch(batch))
+        batch.clear()
+        return checkpointed
+
+    def store():
+        if batch and embed():
+            on_checkpoint(reused, computed)
+        on_batch(ready, [cache.get(t) for t in ready])
+        ready.clear()
+
+    for text in texts:
+        count = count + 1
+        ready.append(text)
+        if text in batch or cache.get(text) is not None:
+            reused = reused + 1
+        else:
+            batch.append(text)
+            if len(batch) >= embed_batch_size and embed():
+                on_checkpoint(reused, computed)
+        if len(ready) >= store_batch_size:
+            store()
+    if ready:
+        store()
+    cache.flush()
+    return count, reused, computed
+
+def record_progress(table, docId, jobId, reused, computed, total=None):
+    values = {
+        ':reusedValue': reused,
+        ':computedValue': computed,
+    }
+    expression = 'SET chunksReused = :reusedValue, chunksComputed = :computedValue'
+    # The total is only known once the whole input has streamed in
+    if total is not None:
+        values[':totalValue'] = total
+        expression = expression + ', chunksTotal = :totalValue'
+    table.update_item(
+            Key = { "documentId": docId, "jobId": jobId },
+            UpdateExpression = expression,
+            ExpressionAttributeValues = values
+        )
+
+def build_ann_index(spool):
+    """Builds an approximate nearest neighbor index next to the Chroma store for large documents."""
+    if spool is None:
+        return None
+    if spool.count < ann_min_chunks:
+        print(f"Skipping {ann_index} index for {spool.count} chunks")
+        spool.discard()
+        return None
+    params = {k: os.environ[v] for k, v in ann_params.get(ann_index, {}).items() if v in os.environ}
+    meta = spool.build(index_type=ann_index, **params)
+    print(f"Built {ann_index} index: {json.dumps(meta)}")
+    return meta
+
+def build_index(texts, endpoint_name, doc_dir, table, docId, jobId, source):
+    """Splits and embeds a stream of document text, then publishes the vector stores.
+
+    Progress and the final build figures are written to the embedding job in table.
+    """
+    if build_in_place:
+        build_dir = doc_dir
+        # A published version would otherwise keep shadowing the in-place store
+        if os.path.exists(os.path.join(doc_dir, MANIFEST)):
+            os.remove(os.path.join(doc_dir, MANIFEST))
+        # QA would keep loading an index built from the previous chunks
+        shutil.rmtree(os.path.join(doc_dir, 'ann'), ignore_errors=True)
+    else:
+        build_dir = os.path.join(scratch_dir, docId)
+        shutil.rmtree(build_dir, ignore_errors=True)
+        os.makedirs(build_dir)
+    persist_directory = os.path.join(build_dir, 'db')
+    if not os.path.exists(persist_directory):
+        os.mkdir(persist_directory)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size = embed_chunk_size,
+                                                    chunk_overlap  = 0)
+
+    embeddings = SMEndpointEmbeddings(
+        endpoint_name=endpoint_name,
+    )
+    start = time.time()
+    # Kept on EFS so a restarted job resumes from the last checkpoint
+    cache = EmbeddingCache(os.path.join(doc_dir, 'embeddings'), endpoint_name,
+                           flush_every=embed_checkpoint_chunks)
+    stream = split_stream(texts, text_splitter, ["\n\n", "\n"], window=8 * embed_chunk_size)
+    vectordb = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+    # The ANN index is built from the same batches, spooled to disk as they are stored
+    spool = IndexSpool(os.path.join(build_dir, 'ann')) if ann_index else None
+
+    def store(batch, vectors):
+        metadatas = [{'source': source} for _ in batch]
+        vectordb._collection.add(ids=[str(uuid.uuid1()) for _ in batch],
+                                 embeddings=[v.tolist() for v in vectors],
+                                 documents=list(batch),
+                                 metadatas=metadatas)
+        if spool is not None:
+            spool.add(vectors, batch, metadatas)
+
+    count, reused, computed = embed_chunks(
+        embeddings, cache, stream,
+        lambda reused, computed: record_progress(table, docId, jobId, reused, computed),
+        store)
+    print(f"Number of splits: {count}, reused: {reused}, computed: {computed}")
+    record_progress(table, docId, jobId, reused, computed, total=count)
+    vectordb.persist()
+    ann_meta = build_ann_index(spool)
+    build_seconds = time.time() - start
+
+    if build_in_place:
+        manifest = {'version': 'in-place', 'publishSeconds': 0,
+                    'bytes': sum(directory_size(os.path.join(build_dir, d)) for d in ('db', 'ann'))}
+    else:
+        manifest = publish(build_dir, doc_dir, keep=publish_keep_versions)
+        shutil.rmtree(build_dir, ignore_errors=True)
+    print(f"Built in {build_seconds:.1f}s, published version {manifest['version']} "
+          f"({manifest['bytes']} bytes) in {manifest['publishSeconds']}s")
+    # Only the current chunks are worth keeping for the next run
+    cache.compact()
+
+    table.update_item(
+            Key = { "documentId": docId, "jobId": jobId },
+            UpdateExpression = 'SET jobStatus = :jobstatusValue, annIndex = :annIndexValue, ' +
+                               'indexVersion = :versionValue, buildSeconds = :buildValue, ' +
+                               'publishSeconds = :publishValue, bytesPublished = :bytesValue',
+            ExpressionAttributeValues = {
+                ':jobstatusValue': "Complete",
+                ':annIndexValue': ann_meta['indexType'] if ann_meta else "none",
+                ':versionValue': manifest['version'],
+                ':buildValue': Decimal(str(round(build_seconds, 3))),
+                ':publishValue': Decimal(str(manifest['publishSeconds'])),
+                ':bytesValue': manifest['bytes'],
+            }
+        )
+    pipelinestate.advance(docId, ["Summarizing", "Embedding"], "Queryable")
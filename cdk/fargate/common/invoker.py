@@ -0,0 +1,424 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as BotoConnectionError
+import metrics
+from balancer import EndpointPool
+
+THROTTLING_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+}
+
+RETRYABLE_ERROR_CODES = THROTTLING_ERROR_CODES | {
+    'InternalFailure',
+    'InternalServerError',
+    'ServiceUnavailable',
+    'ServiceUnavailableException',
+    'ModelNotReadyException',
+}
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class EndpointUnavailableError(Exception):
+    """Raised without calling the endpoint when its circuit breaker is open."""
+
+class DeadlineExceededError(Exception):
+    """Raised when an endpoint call does not finish within its deadline."""
+
+def _error_code(e):
+    if isinstance(e, ClientError):
+        error = e.response.get('Error', {})
+        status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        return error.get('Code'), status
+    # SDK wrappers (ai21, cohere) surface the HTTP status under various names
+    status = getattr(e, 'status_code', None) or getattr(e, 'http_status', None)
+    return None, status
+
+def is_throttle(e):
+    code, status = _error_code(e)
+    return code in THROTTLING_ERROR_CODES or status == 429
+
+def is_retryable(e):
+    if isinstance(e, (BotoConnectionError, HTTPClientError)):
+        return True
+    code, status = _error_code(e)
+    return code in RETRYABLE_ERROR_CODES or status in RETRYABLE_STATUS_CODES
+
+class LatencyStats:
+    """Counters and a sliding window of successful call latencies."""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._counters = {
+            'calls': 0,
+            'errors': 0,
+            'throttles': 0,
+            'retries': 0,
+            'timeouts': 0,
+            'hedges': 0,
+            'hedgeWins': 0,
+            'rejected': 0,
+        }
+
+    def record(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def percentile(self, q, min_samples=1):
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < min_samples or not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            snapshot = dict(self._counters)
+        n = len(latencies)
+        snapshot['samples'] = n
+        for name, q in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+            snapshot[name] = latencies[min(n - 1, int(q * n))] if n else None
+        snapshot['max'] = latencies[-1] if n else None
+        return snapshot
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets one probe through after a cool-down."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CircuitBreaker.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow(self):
+        with self._lock:
+            if self._state == CircuitBreaker.OPEN:
+                if time.monotonic() - self._opened_at < self._reset_timeout:
+                    return False
+                self._state = CircuitBreaker.HALF_OPEN
+                self._probing = False
+            if self._state == CircuitBreaker.HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = CircuitBreaker.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures = self._failures + 1
+            if self._state == CircuitBreaker.HALF_OPEN or self._failures >= self._failure_threshold:
+                self._state = CircuitBreaker.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+class EndpointInvoker:
+    """Shared invocation layer for SageMaker endpoint calls.
+
+    Every call gets a deadline, retries throttling and transient errors with
+    full-jitter exponential backoff, and goes through a per-endpoint circuit
+    breaker. With hedging enabled, a duplicate request is sent when the first
+    one has not answered after the endpoint's recent p95 latency; whichever
+    answers first wins.
+
+    The target of a call is an endpoint name or a comma separated list of
+    endpoint names serving the same model. Each attempt is routed through an
+    EndpointPool, and retries and hedged requests prefer a different endpoint
+    from the one that failed or is slow.
+    """
+
+    def __init__(self, client=None, deadline=60.0, max_attempts=4, base_backoff=0.2, max_backoff=5.0,
+                 hedge=False, hedge_quantile=0.95, min_hedge_delay=0.05, hedge_min_samples=20,
+                 failure_threshold=5, reset_timeout=30.0, max_workers=32, pool_options=None):
+        self._client = client
+        self._deadline = deadline
+        self._max_attempts = max_attempts
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._hedge = hedge
+        self._hedge_quantile = hedge_quantile
+        self._min_hedge_delay = min_hedge_delay
+        self._hedge_min_samples = hedge_min_samples
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._stats = {}
+        self._breakers = {}
+        self._pools = {}
+        self._pool_options = pool_options or {}
+
+    @classmethod
+    def from_env(cls, client=None):
+        env = os.environ
+        return cls(client=client,
+                   deadline=float(env.get('invoke_deadline', 60)),
+                   max_attempts=int(env.get('invoke_max_attempts', 4)),
+                   base_backoff=float(env.get('invoke_base_backoff', 0.2)),
+                   max_backoff=float(env.get('invoke_max_backoff', 5)),
+                   hedge=env.get('invoke_hedge', 'false').lower() == 'true',
+                   hedge_quantile=float(env.get('invoke_hedge_quantile', 0.95)),
+                   failure_threshold=int(env.get('breaker_failure_threshold', 5)),
+                   reset_timeout=float(env.get('breaker_reset_timeout', 30)),
+                   pool_options={
+                       'policy': env.get('lb_policy', 'least_outstanding'),
+                       'error_threshold': float(env.get('lb_error_threshold', 0.5)),
+                       'ejection_time': float(env.get('lb_ejection_time', 30)),
+                   })
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    # Retries and timeouts are owned by this class, not botocore
+                    config = Config(read_timeout=self._deadline,
+                                    connect_timeout=min(self._deadline, 10),
+                                    retries={'mode': 'standard', 'total_max_attempts': 1})
+                    self._client = boto3.client('runtime.sagemaker', config=config)
+        return self._client
+
+    def stats_for(self, endpoint_name):
+        with self._lock:
+            if endpoint_name not in self._stats:
+                self._stats[endpoint_name] = LatencyStats()
+            return self._stats[endpoint_name]
+
+    def breaker_for(self, endpoint_name):
+        with self._lock:
+            if endpoint_name not in self._breakers:
+                self._breakers[endpoint_name] = CircuitBreaker(self._failure_threshold, self._reset_timeout)
+            return self._breakers[endpoint_name]
+
+    def pool(self, target):
+        """Returns the shared EndpointPool for an endpoint name or comma separated list."""
+        if isinstance(target, EndpointPool):
+            return target
+        with self._lock:
+            if target not in self._pools:
+                self._pools[target] = EndpointPool(EndpointPool.parse(target), **self._pool_options)
+            return self._pools[target]
+
+    def stats(self):
+        with self._lock:
+            names = list(self._stats.keys())
+            pools = list(self._pools.values())
+        result = {}
+        for name in names:
+            snapshot = self.stats_for(name).snapshot()
+            snapshot['breaker'] = self.breaker_for(name).state
+            result[name] = snapshot
+        for pool in pools:
+            for name, counters in pool.stats().items():
+                result.setdefault(name, {}).update(counters)
+        return result
+
+    def emit_stats(self):
+        for name, snapshot in self.stats().items():
+            snapshot.pop('breaker', None)
+            snapshot['ejected'] = int(snapshot.get('ejected', False))
+            metrics.emit(snapshot, dimensions={'Endpoint': name})
+
+    def invoke(self, endpoint_name, body, content_type='application/json', deadline=None):
+        """Calls invoke_endpoint and returns the raw response body bytes."""
+        def send(name):
+            response = self.client.invoke_endpoint(EndpointName=name,
+                                                   ContentType=content_type,
+                                                   Body=body)
+            return response['Body'].read()
+        return self.call(endpoint_name, send, deadline=deadline)
+
+    def close(self):
+        """Waits for requests still running after their caller returned, such as hedge losers."""
+        with self._lock:
+            executor = self._executor if self._executor_pid == os.getpid() else None
+            self._executor = None
+            self._executor_pid = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def call(self, target, fn, deadline=None):
+        """Runs fn(endpoint_name) with deadline, retries, hedging and circuit breaking.
+
+        fn must be safe to run more than once since retries and hedged
+        requests repeat it, possibly against different endpoints.
+        """
+        expires = time.monotonic() + (deadline or self._deadline)
+        pool = self.pool(target)
+        failed = set()
+        attempt = 0
+        while True:
+            endpoint_name = self._select(pool, failed)
+            stats = self.stats_for(endpoint_name)
+            stats.incr('calls')
+            try:
+                return self._attempt(pool, endpoint_name, fn, expires, stats)
+            except Exception as e:
+                # The breaker outcome is recorded when the request itself completes
+                stats.incr('errors')
+                retryable = is_retryable(e)
+                if retryable or isinstance(e, DeadlineExceededError):
+                    failed.add(endpoint_name)
+                if is_throttle(e):
+                    stats.incr('throttles')
+                attempt = attempt + 1
+                if not retryable or attempt >= self._max_attempts:
+                    raise
+                backoff = random.uniform(0, min(self._max_backoff, self._base_backoff * (2 ** attempt)))
+                if time.monotonic() + backoff >= expires:
+                    raise
+                stats.incr('retries')
+                time.sleep(backoff)
+
+    def _select(self, pool, failed):
+        """Picks an endpoint whose breaker admits a request, preferring ones that have not failed."""
+        rejected = set()
+        for avoid in (failed, set()):
+            while len(rejected | avoid) < len(pool.endpoints):
+                candidate = pool.choose(exclude=rejected | avoid)
+                if self.breaker_for(candidate).allow():
+                    return candidate
+                self.stats_for(candidate).incr('rejected')
+                rejected.add(candidate)
+        raise EndpointUnavailableError(f"Circuit breaker open for endpoints {','.join(pool.endpoints)}")
+
+    def _select_hedge(self, pool, endpoint_name):
+        """Picks an endpoint for a hedged request, preferring one other than the primary.
+
+        Returns None when no endpoint's breaker admits another request.
+        """
+        rejected = {endpoint_name}
+        while len(rejected) < len(pool.endpoints):
+            candidate = pool.choose(exclude=rejected)
+            if self.breaker_for(candidate).allow():
+                return candidate
+            self.stats_for(candidate).incr('rejected')
+            rejected.add(candidate)
+        if self.breaker_for(endpoint_name).allow():
+            return endpoint_name
+        return None
+
+    def _get_executor(self):
+        if self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                        thread_name_prefix='invoke')
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _hedge_delay(self, stats):
+        if not self._hedge:
+            return None
+        delay = stats.percentile(self._hedge_quantile, min_samples=self._hedge_min_samples)
+        if delay is None:
+            return None
+        return max(self._min_hedge_delay, delay)
+
+    def _attempt(self, pool, endpoint_name, fn, expires, stats):
+        executor = self._get_executor()
+
+        def tracked(name):
+            # Pool counters follow the real request, even after the caller gave up on it
+            sent = time.monotonic()
+            try:
+                result = fn(name)
+            except Exception as e:
+                pool.release(name, time.monotonic() - sent, ok=not is_retryable(e))
+                raise
+            pool.release(name, time.monotonic() - sent, ok=True)
+            return result
+
+        def recorded(name):
+            # Every request records its own breaker outcome when it completes,
+            # so a half-open probe is settled even when a hedge answered first
+            breaker = self.breaker_for(name)
+            try:
+                result = tracked(name)
+            except Exception as e:
+                if is_retryable(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                raise
+            if time.monotonic() >= expires:
+                # Answered after the caller gave up on it
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            return result
+
+        targets = {}
+
+        def submit(name):
+            pool.acquire(name)
+            future = executor.submit(recorded, name)
+            targets[future] = name
+            return future
+
+        start = time.monotonic()
+        primary = submit(endpoint_name)
+        pending = {primary}
+        hedge_delay = self._hedge_delay(stats)
+        hedge_at = start + hedge_delay if hedge_delay is not None else None
+        error = None
+        while pending:
+            now = time.monotonic()
+            if now >= expires:
+                break
+            wake_at = expires if hedge_at is None else min(expires, hedge_at)
+            done, pending = wait(pending, timeout=max(0, wake_at - now), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # Latency belongs to the endpoint that answered
+                    self.stats_for(targets[future]).record(time.monotonic() - start)
+                    if future is not primary:
+                        stats.incr('hedgeWins')
+                    return future.result()
+                error = future.exception()
+            if hedge_at is not None and pending and time.monotonic() >= hedge_at:
+                hedge_at = None
+                # Send the duplicate to another endpoint whose breaker admits it
+                hedge_name = self._select_hedge(pool, endpoint_name)
+                if hedge_name is not None:
+                    stats.incr('hedges')
+                    self.stats_for(hedge_name).incr('calls')
+                    pending.add(submit(hedge_name))
+        if error is not None and not pending:
+            raise error
+        stats.incr('timeouts')
+        raise DeadlineExceededError(f"Endpoint {endpoint_name} did not respond before the deadline")
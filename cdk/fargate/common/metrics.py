@@ -0,0 +1,71 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import os
+import threading
+import time
+import traceback
+
+NAMESPACE = os.environ.get('metrics_namespace', 'FsiQaSummarization')
+
+def emit(values, dimensions=None, namespace=None):
+    """Writes metric values to stdout in CloudWatch embedded metric format.
+
+    The awslogs driver ships container output to CloudWatch Logs, which turns
+    these records into CloudWatch metrics without extra API calls.
+    """
+    values = {k: v for k, v in values.items() if v is not None}
+    if not values:
+        return
+    dimensions = dimensions or {}
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace or NAMESPACE,
+                'Dimensions': [list(dimensions.keys())],
+                'Metrics': [{'Name': k} for k in values.keys()]
+            }]
+        }
+    }
+    record.update(dimensions)
+    record.update(values)
+    print(json.dumps(record), flush=True)
+
+class MetricsReporter:
+    """Periodically calls registered reporters from a background thread.
+
+    The thread is started lazily by ensure_started, once per process.
+    """
+
+    def __init__(self, interval=60):
+        self._interval = interval
+        self._reporters = []
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def register(self, reporter):
+        self._reporters.append(reporter)
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            thread = threading.Thread(target=self._run, name='metrics-reporter', daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def report(self):
+        for reporter in self._reporters:
+            try:
+                reporter()
+            except Exception:
+                print(traceback.format_exc())
+
+    def _run(self):
+        while True:
+            time.sleep(self._interval)
+            self.report()
@@ -0,0 +1,83 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Stage tracking for documents in pipeline mode. The ingest Lambdas move a
+# document from Extracting to Summarizing; the workers take it the rest of
+# the way to Queryable, or to Failed.
+
+import os
+import time
+from decimal import Decimal
+import boto3
+from botocore.exceptions import ClientError
+import metrics
+
+documents_table = os.environ.get('documents_table', '')
+
+_table = None
+
+def _documents():
+    global _table
+    if _table is None:
+        _table = boto3.resource('dynamodb', region_name=os.environ.get('region')).Table(documents_table)
+    return _table
+
+def advance(docId, from_stages, to_stage):
+    """Moves a document to to_stage if it is in one of from_stages.
+
+    The update is conditional, so a document that is not in pipeline mode,
+    or that another task has already moved on, is left alone and False is
+    returned. Reaching Queryable also records the seconds since upload.
+    """
+    if not documents_table:
+        return False
+    now = Decimal(str(round(time.time(), 3)))
+    stage_at = to_stage[0].lower() + to_stage[1:] + 'At'
+    expression = f'SET pipelineStage = :stageValue, {stage_at} = :nowValue'
+    if to_stage == 'Queryable':
+        expression = expression + ', secondsToQueryable = :nowValue - uploadedAt'
+    values = {':stageValue': to_stage, ':nowValue': now}
+    for i, stage in enumerate(from_stages):
+        values[f':fromValue{i}'] = stage
+    try:
+        response = _documents().update_item(
+                Key = { "documentId": docId },
+                UpdateExpression = expression,
+                ConditionExpression = f"pipelineStage IN ({', '.join(f':fromValue{i}' for i in range(len(from_stages)))})",
+                ExpressionAttributeValues = values,
+                ReturnValues = 'ALL_NEW'
+            )
+    except ClientError as e:
+        if e.response['Error']['Code'] == "ConditionalCheckFailedException":
+            return False
+        raise
+    print(f"Document {docId} is {to_stage}")
+    item = response['Attributes']
+    if 'secondsToQueryable' in item:
+        metrics.emit({'secondsToQueryable': float(item['secondsToQueryable'])}, dimensions={'IngestPath': item.get('ingestPath', 'async')})
+    return True
+
+def record(docId, attribute):
+    """Records when a pipeline mode document passed a step that does not change its stage."""
+    if not documents_table:
+        return
+    try:
+        _documents().update_item(
+                Key = { "documentId": docId },
+                UpdateExpression = f'SET {attribute} = :nowValue',
+                ConditionExpression = 'attribute_exists(pipelineStage)',
+                ExpressionAttributeValues = { ':nowValue': Decimal(str(round(time.time(), 3))) }
+            )
+    except ClientError as e:
+        if e.response['Error']['Code'] != "ConditionalCheckFailedException":
+            raise
+
+def mark_failed(table, docId, jobId):
+    """Marks a summary or embedding job Failed, whether or not the document is in pipeline mode."""
+    table.update_item(
+            Key = { "documentId": docId, "jobId": jobId },
+            UpdateExpression = 'SET jobStatus = :jobstatusValue',
+            ExpressionAttributeValues = {
+                ':jobstatusValue': "Failed"
+            }
+        )
@@ -0,0 +1,86 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import os
+import shutil
+import time
+import uuid
+
+MANIFEST = 'CURRENT.json'
+VERSIONS = 'versions'
+
+def directory_size(directory):
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            total = total + os.path.getsize(os.path.join(root, name))
+    return total
+
+def read_manifest(doc_dir):
+    try:
+        with open(os.path.join(doc_dir, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def resolve(doc_dir):
+    """Returns (directory, version) of a document's published stores.
+
+    Documents built before versioned publishing have their stores directly
+    in the document directory and no version.
+    """
+    manifest = read_manifest(doc_dir)
+    if manifest is None:
+        return doc_dir, None
+    return os.path.join(doc_dir, manifest['path']), manifest['version']
+
+def publish(local_dir, doc_dir, keep=2):
+    """Copies a finished local build to a new version under doc_dir and makes it current.
+
+    The copy goes to a temporary name and is renamed into place, then the
+    manifest is replaced in one atomic step, so readers see either the old
+    or the new version and never a partial one. Returns the new manifest.
+    """
+    now = time.time()
+    version = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))}.{int(now * 1e6) % 1000000:06d}-{uuid.uuid4().hex[:8]}"
+    versions_dir = os.path.join(doc_dir, VERSIONS)
+    os.makedirs(versions_dir, exist_ok=True)
+    tmp = os.path.join(versions_dir, f".tmp-{version}")
+    start = time.time()
+    shutil.copytree(local_dir, tmp)
+    os.rename(tmp, os.path.join(versions_dir, version))
+
+    manifest = {
+        'version': version,
+        'path': os.path.join(VERSIONS, version),
+        'bytes': directory_size(local_dir),
+        'publishedAt': int(time.time()),
+    }
+    tmp_manifest = os.path.join(doc_dir, f".{MANIFEST}.{uuid.uuid4().hex}")
+    with open(tmp_manifest, 'w') as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_manifest, os.path.join(doc_dir, MANIFEST))
+    manifest['publishSeconds'] = round(time.time() - start, 3)
+
+    collect_garbage(doc_dir, keep)
+    return manifest
+
+def collect_garbage(doc_dir, keep=2):
+    """Removes all but the newest keep versions; the current version is always kept."""
+    versions_dir = os.path.join(doc_dir, VERSIONS)
+    current = (read_manifest(doc_dir) or {}).get('version')
+    names = os.listdir(versions_dir)
+    # Left behind by publishes that did not finish
+    for name in names:
+        path = os.path.join(versions_dir, name)
+        if name.startswith('.tmp-') and time.time() - os.path.getmtime(path) > 3600:
+            shutil.rmtree(path, ignore_errors=True)
+    # Version names start with a UTC timestamp, so they sort by age
+    versions = sorted(v for v in names if not v.startswith('.'))
+    for version in versions[:-keep] if keep > 0 else versions:
+        if version != current:
+            print(f"Removing old version {version}")
+            shutil.rmtree(os.path.join(versions_dir, version), ignore_errors=True)
@@ -0,0 +1,78 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import codecs
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+def iter_object(s3, bucket, key, part_size=8 * 2**20, max_parallel=4):
+    """Yields an S3 object's bytes in order without holding the whole object.
+
+    Objects larger than part_size are fetched as ranged GETs, up to
+    max_parallel at a time, so at most part_size * max_parallel bytes are
+    buffered however large the object is.
+    """
+    size = s3.head_object(Bucket=bucket, Key=key)['ContentLength']
+    if size <= part_size or max_parallel <= 1:
+        body = s3.get_object(Bucket=bucket, Key=key)['Body']
+        for chunk in body.iter_chunks(chunk_size=2**20):
+            yield chunk
+        return
+
+    def fetch(start):
+        end = min(start + part_size, size) - 1
+        return s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")['Body'].read()
+
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        starts = iter(range(0, size, part_size))
+        pending = deque()
+        for start in starts:
+            pending.append(executor.submit(fetch, start))
+            if len(pending) >= max_parallel:
+                break
+        while pending:
+            data = pending.popleft().result()
+            start = next(starts, None)
+            if start is not None:
+                pending.append(executor.submit(fetch, start))
+            yield data
+
+def iter_text(chunks, encoding='utf-8'):
+    """Decodes a stream of bytes, keeping multi-byte characters split across chunks intact."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+def split_stream(texts, splitter, separators, window):
+    """Yields the splitter's chunks of a text stream as soon as enough text has arrived.
+
+    Once window characters are buffered, the buffer is cut before the last
+    occurrence of the highest priority separator in it. Everything before
+    the cut is split, and the rest is carried over to the next piece of the
+    stream. Only the chunks on either side of a cut can differ from
+    splitting the whole text at once.
+    """
+    buffer = ''
+    for text in texts:
+        buffer = buffer + text
+        if len(buffer) < window:
+            continue
+        cut = 0
+        for separator in separators:
+            cut = buffer.rfind(separator)
+            if cut > 0:
+                break
+        if cut <= 0:
+            # No separator at all; cut anyway so the buffer stays bounded
+            if len(buffer) < 4 * window:
+                continue
+            cut = len(buffer) - window
+        head, buffer = buffer[:cut], buffer[cut:]
+        yield from splitter.split_text(head)
+    if buffer.strip():
+        yield from splitter.split_text(buffer)
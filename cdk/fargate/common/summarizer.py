@@ -0,0 +1,137 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Summarization models behind SageMaker endpoints. Used by the summarization
+# worker, and by the small document worker Lambda.
+
+from typing import Optional, List
+import gzip
+import hashlib
+import json
+import os
+import boto3
+from langchain.llms.base import LLM
+import ai21
+from invoker import EndpointInvoker
+
+invoker = EndpointInvoker.from_env()
+
+# Larger summaries go to S3, so the job item stays well under DynamoDB's 400 KB limit
+summary_inline_max_bytes = int(os.environ.get('summary_inline_max_bytes', 16384))
+
+def query_endpoint_with_json_payload(encoded_json, endpoint_name):
+    return invoker.invoke(endpoint_name, encoded_json)
+    
+def parse_response_multiple_texts(query_response):
+    model_predictions = json.loads(query_response)
+    generated_text = model_predictions["generated_texts"]
+    return generated_text
+
+def query_endpoint(encoded_text, endpoint_name):
+    return invoker.invoke(endpoint_name, encoded_text, content_type="application/x-text")
+
+
+def parse_response(query_response):
+    model_predictions = json.loads(query_response)
+    generated_text = model_predictions["generated_text"]
+    return generated_text
+
+class SageMakerLLMAI21(LLM):
+
+    endpoint_name: str
+    
+    @property
+    def _llm_type(self) -> str:
+        return "summarize"
+    
+    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+        response = invoker.call(self.endpoint_name,
+                                lambda name: ai21.Summarize.execute(
+                                    source=prompt,
+                                    sourceType="TEXT",
+                                    sm_endpoint=name
+                                ))
+        return response.summary
+
+class SageMakerLLMFlanT5(LLM):
+
+    endpoint_name: str
+    max_length: int
+    num_beams: int
+    top_k: int
+    top_p: float
+    temperature: float
+    
+    @property
+    def _llm_type(self) -> str:
+        return "summarize"
+    
+    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+        parameters = {
+            "max_length": self.max_length,
+            "num_return_sequences": 1,
+            #"num_beams": self.num_beams,
+            "top_k": self.top_k,
+            "top_p": self.top_p,
+            "temperature": self.temperature,
+            "do_sample": True,
+        }
+        payload = {"text_inputs": f"Summarize this article:\n\n{prompt}", **parameters}
+        query_response = query_endpoint_with_json_payload(
+            json.dumps(payload).encode("utf-8"), endpoint_name=self.endpoint_name
+        )
+        generated_texts = parse_response_multiple_texts(query_response)
+        
+        return generated_texts[0]
+
+def summarize(llm, texts, progress=None):
+    """Summarizes each chunk in turn and joins the summaries.
+
+    Returns the summary and the number of chunks. progress, if given, is
+    called with the number of chunks summarized so far.
+    """
+    responses = []
+    for t in texts:
+        responses.append(llm(t))
+        if progress:
+            progress(len(responses))
+    print(f"Number of splits: {len(responses)}")
+    return "\n".join(responses), len(responses)
+
+def store_summary(table, docId, jobId, summary, count, bucket, key):
+    """Marks the summary job Complete with its summary.
+
+    Summaries up to summary_inline_max_bytes are kept in the item's
+    summaryText. Larger ones are written gzip-compressed to s3://bucket/key,
+    and the item holds only their location, size and SHA-256.
+    """
+    data = summary.encode('utf-8')
+    values = {
+        ':jobstatusValue': "Complete",
+        ':countValue': count,
+        ':bytesValue': len(data)
+    }
+    if len(data) <= summary_inline_max_bytes:
+        expression = 'SET jobStatus = :jobstatusValue, summaryText = :outputValue, chunksSummarized = :countValue, ' \
+                     'summaryBytes = :bytesValue REMOVE summaryBucket, summaryLocation, summaryStoredBytes, summarySha256'
+        values[':outputValue'] = summary
+    else:
+        body = gzip.compress(data)
+        # Served with Content-Encoding, so browsers fetching a presigned URL get the text back
+        boto3.client('s3').put_object(Bucket=bucket, Key=key, Body=body,
+                                      ContentType='text/plain; charset=utf-8', ContentEncoding='gzip')
+        expression = 'SET jobStatus = :jobstatusValue, chunksSummarized = :countValue, summaryBytes = :bytesValue, ' \
+                     'summaryBucket = :bucketValue, summaryLocation = :locationValue, summaryStoredBytes = :storedValue, ' \
+                     'summarySha256 = :shaValue REMOVE summaryText'
+        values.update({
+            ':bucketValue': bucket,
+            ':locationValue': key,
+            ':storedValue': len(body),
+            ':shaValue': hashlib.sha256(data).hexdigest()
+        })
+        print(f"Summary of {len(data)} bytes written to s3://{bucket}/{key} as {len(body)} bytes")
+    table.update_item(
+            Key = { "documentId": docId, "jobId": jobId },
+            UpdateExpression = expression,
+            ExpressionAttributeValues = values
+        )
@@ -0,0 +1,381 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import os
+import time
+import numpy as np
+
+FORMAT_VERSION = 1
+HNSW = 'hnsw'
+IVF = 'ivf'
+FLAT = 'flat'
+
+COMPRESSIONS = ('float32', 'float16', 'int8')
+
+META_FILE = 'meta.json'
+CHUNKS_FILE = 'chunks.jsonl'
+
+def squared_l2(vectors, query, norms=None):
+    """Squared L2 distance from query to every row of vectors."""
+    if norms is None:
+        norms = np.einsum('ij,ij->i', vectors, vectors)
+    return norms - 2 * (vectors @ query) + float(query @ query)
+
+def _top_k(distances, k):
+    k = min(k, len(distances))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(distances, k - 1)[:k]
+    return idx[np.argsort(distances[idx])]
+
+def _save_rows(path, vectors, rows, block=65536):
+    """Saves vectors[rows] as float32 a block at a time, so vectors may be a memory map."""
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(len(rows), vectors.shape[1]))
+    for start in range(0, len(rows), block):
+        out[start:start + block] = vectors[rows[start:start + block]]
+    out.flush()
+
+def compress(vectors, compression):
+    """Returns the vectors as stored for a compression, and the per-vector scales for int8."""
+    if compression == 'float16':
+        return vectors.astype(np.float16), None
+    if compression == 'int8':
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return vectors, None
+
+class _HnswIndex:
+    FILE = 'hnsw.bin'
+
+    def __init__(self, index):
+        self._index = index
+
+    @staticmethod
+    def _hnswlib():
+        try:
+            import hnswlib
+        except ImportError:
+            raise RuntimeError("The hnsw index type needs the hnswlib package")
+        return hnswlib
+
+    @classmethod
+    def build(cls, directory, vectors, params):
+        hnswlib = cls._hnswlib()
+        params = {
+            'M': int(params.get('M', 16)),
+            'ef_construction': int(params.get('ef_construction', 200)),
+            'ef_search': int(params.get('ef_search', 64)),
+        }
+        index = hnswlib.Index(space='l2', dim=vectors.shape[1])
+        index.init_index(max_elements=len(vectors), M=params['M'], ef_construction=params['ef_construction'])
+        index.add_items(vectors, np.arange(len(vectors)))
+        index.save_index(os.path.join(directory, cls.FILE))
+        return params
+
+    @classmethod
+    def load(cls, directory, meta):
+        hnswlib = cls._hnswlib()
+        index = hnswlib.Index(space='l2', dim=meta['dim'])
+        index.load_index(os.path.join(directory, cls.FILE), max_elements=meta['count'])
+        index.set_ef(meta['params']['ef_search'])
+        return cls(index)
+
+    def search(self, query, k):
+        k = min(k, self._index.get_current_count())
+        labels, distances = self._index.knn_query(query.reshape(1, -1), k=k, num_threads=1)
+        return labels[0].astype(np.int64), distances[0]
+
+class _IvfIndex:
+    """Inverted file index: vectors are grouped by their nearest k-means
+    centroid and a query scans only the nprobe closest groups."""
+
+    def __init__(self, centroids, vectors, norms, ids, offsets, nprobe):
+        self._centroids = centroids
+        self._vectors = vectors
+        self._norms = norms
+        self._ids = ids
+        self._offsets = offsets
+        self._nprobe = nprobe
+
+    @staticmethod
+    def _assign(vectors, centroids, batch=8192):
+        centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), batch):
+            block = vectors[start:start + batch]
+            distances = centroid_norms[None, :] - 2 * (block @ centroids.T)
+            assignment[start:start + batch] = distances.argmin(axis=1)
+        return assignment
+
+    @classmethod
+    def _kmeans(cls, vectors, nlist, iterations, seed):
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = cls._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=nlist)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        return centroids
+
+    @classmethod
+    def build(cls, directory, vectors, params):
+        n = len(vectors)
+        params = {
+            'nlist': int(params.get('nlist', max(1, min(n, int(4 * np.sqrt(n)))))),
+            'nprobe': int(params.get('nprobe', 0)),
+            'iterations': int(params.get('iterations', 10)),
+            'seed': int(params.get('seed', 0)),
+        }
+        # An ivf_nlist sized for larger documents cannot have more lists than vectors
+        if params['nlist'] > n or params['nlist'] < 1:
+            print(f"Clamping ivf nlist {params['nlist']} to the {n} vectors in the index")
+            params['nlist'] = max(1, min(n, params['nlist']))
+        if params['nprobe'] <= 0:
+            params['nprobe'] = max(16, params['nlist'] // 8)
+        centroids = cls._kmeans(vectors, params['nlist'], params['iterations'], params['seed'])
+        assignment = cls._assign(vectors, centroids)
+        ids = np.argsort(assignment, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=params['nlist']))])
+        np.save(os.path.join(directory, 'ivf_centroids.npy'), centroids.astype(np.float32))
+        _save_rows(os.path.join(directory, 'ivf_vectors.npy'), vectors, ids)
+        np.save(os.path.join(directory, 'ivf_ids.npy'), ids.astype(np.int64))
+        np.save(os.path.join(directory, 'ivf_offsets.npy'), offsets.astype(np.int64))
+        return params
+
+    @classmethod
+    def load(cls, directory, meta):
+        # Memory mapped so pre-forked workers share the pages
+        load = lambda name: np.load(os.path.join(directory, name), mmap_mode='r')
+        vectors = load('ivf_vectors.npy')
+        norms = np.einsum('ij,ij->i', vectors, vectors)
+        return cls(load('ivf_centroids.npy'), vectors, norms, load('ivf_ids.npy'),
+                   load('ivf_offsets.npy'), meta['params']['nprobe'])
+
+    def search(self, query, k):
+        probes = _top_k(squared_l2(self._centroids, query), self._nprobe)
+        candidates = []
+        distances = []
+        for probe in probes:
+            start, end = int(self._offsets[probe]), int(self._offsets[probe + 1])
+            if start == end:
+                continue
+            candidates.append(np.arange(start, end))
+            distances.append(squared_l2(self._vectors[start:end], query, self._norms[start:end]))
+        if not candidates:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        candidates = np.concatenate(candidates)
+        distances = np.concatenate(distances)
+        best = _top_k(distances, k)
+        return np.asarray(self._ids[candidates[best]]), distances[best]
+
+class _FlatIndex:
+    """Exhaustive search over vectors stored as float32, float16, or int8
+    with a per-vector scale.
+
+    Compression only shrinks the files. The vectors are dequantized to
+    float32 once when the index is loaded, since scoring in float16 or int8
+    is several times slower than a float32 product in numpy. With
+    compression and rerank > 0, the rerank * k best candidates of the
+    compressed pass are re-scored against full precision vectors. Those are
+    memory mapped on first use and only the candidates' rows are read.
+    """
+
+    BLOCK = 65536
+
+    def __init__(self, directory, vectors, scales, rerank):
+        self._directory = directory
+        self._rerank = rerank
+        self._full = None
+        if vectors.dtype == np.float32 and scales is None:
+            self._vectors = vectors
+        else:
+            self._vectors = np.empty(vectors.shape, dtype=np.float32)
+            # Dequantized a block at a time to bound the temporary copies
+            for start in range(0, len(vectors), self.BLOCK):
+                block = self._vectors[start:start + self.BLOCK]
+                block[:] = vectors[start:start + self.BLOCK]
+                if scales is not None:
+                    block *= scales[start:start + self.BLOCK, None]
+        self._norms = np.einsum('ij,ij->i', self._vectors, self._vectors)
+
+    @classmethod
+    def build(cls, directory, vectors, params):
+        params = {
+            'compression': params.get('compression', 'float32'),
+            'rerank': int(params.get('rerank', 0)),
+        }
+        if params['compression'] not in COMPRESSIONS:
+            raise ValueError(f"Unsupported compression {params['compression']}")
+        if params['compression'] == 'float32':
+            params['rerank'] = 0
+        dtype = np.dtype(params['compression'])
+        stored = np.lib.format.open_memmap(os.path.join(directory, 'flat_vectors.npy'), mode='w+',
+                                           dtype=dtype, shape=vectors.shape)
+        scales = np.empty(len(vectors), dtype=np.float32) if dtype == np.int8 else None
+        for start in range(0, len(vectors), cls.BLOCK):
+            block, block_scales = compress(np.asarray(vectors[start:start + cls.BLOCK]), params['compression'])
+            stored[start:start + len(block)] = block
+            if scales is not None:
+                scales[start:start + len(block)] = block_scales
+        stored.flush()
+        del stored
+        if scales is not None:
+            np.save(os.path.join(directory, 'flat_scales.npy'), scales)
+        if params['rerank'] > 0:
+            np.save(os.path.join(directory, 'full_vectors.npy'), vectors)
+        return params
+
+    @classmethod
+    def load(cls, directory, meta):
+        scales_path = os.path.join(directory, 'flat_scales.npy')
+        scales = np.load(scales_path) if os.path.exists(scales_path) else None
+        # Memory mapped: float32 vectors are shared by pre-forked workers, and
+        # compressed ones are only read once to dequantize them
+        return cls(directory, np.load(os.path.join(directory, 'flat_vectors.npy'), mmap_mode='r'), scales,
+                   meta['params']['rerank'])
+
+    def _full_vectors(self):
+        if self._full is None:
+            self._full = np.load(os.path.join(self._directory, 'full_vectors.npy'), mmap_mode='r')
+        return self._full
+
+    def search(self, query, k):
+        distances = squared_l2(self._vectors, query, self._norms)
+        if self._rerank <= 0:
+            best = _top_k(distances, k)
+            return best, distances[best]
+        # Sorted so the reads from the mapped file go in file order
+        candidates = np.sort(_top_k(distances, k * self._rerank))
+        exact = squared_l2(np.asarray(self._full_vectors()[candidates]), query)
+        best = _top_k(exact, k)
+        return candidates[best], exact[best]
+
+_INDEX_TYPES = {
+    HNSW: _HnswIndex,
+    IVF: _IvfIndex,
+    FLAT: _FlatIndex,
+}
+
+class VectorIndex:
+    """Approximate nearest neighbor index stored next to a document's Chroma store.
+
+    A directory holds meta.json with the index type, size and build
+    parameters, chunks.jsonl with the text and metadata of each chunk in id
+    order, and the index files themselves. Distances are squared L2, the
+    same as Chroma's default, so scores from either store compare directly.
+    """
+
+    def __init__(self, directory, meta, texts, metadatas, impl):
+        self.directory = directory
+        self.meta = meta
+        self._texts = texts
+        self._metadatas = metadatas
+        self._impl = impl
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, META_FILE))
+
+    @staticmethod
+    def build(directory, vectors, texts, metadatas=None, index_type=HNSW, **params):
+        """Builds an index over vectors and writes it to directory; returns its metadata."""
+        if index_type not in _INDEX_TYPES:
+            raise ValueError(f"Unsupported index type {index_type}")
+        metadatas = metadatas or [{}] * len(texts)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, CHUNKS_FILE), 'w') as f:
+            for text, metadata in zip(texts, metadatas):
+                f.write(json.dumps({'text': text, 'metadata': metadata or {}}) + '\n')
+        return VectorIndex._build(directory, np.ascontiguousarray(vectors, dtype=np.float32), index_type, params)
+
+    @staticmethod
+    def _build(directory, vectors, index_type, params):
+        start = time.time()
+        params = _INDEX_TYPES[index_type].build(directory, vectors, params)
+        meta = {
+            'formatVersion': FORMAT_VERSION,
+            'indexType': index_type,
+            'space': 'l2',
+            'dim': int(vectors.shape[1]),
+            'count': int(len(vectors)),
+            'params': params,
+            'buildSeconds': round(time.time() - start, 3),
+            'builtAt': int(time.time()),
+        }
+        with open(os.path.join(directory, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2)
+        return meta
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+        texts = []
+        metadatas = []
+        with open(os.path.join(directory, CHUNKS_FILE)) as f:
+            for line in f:
+                chunk = json.loads(line)
+                texts.append(chunk['text'])
+                metadatas.append(chunk['metadata'])
+        impl = _INDEX_TYPES[meta['indexType']].load(directory, meta)
+        return cls(directory, meta, texts, metadatas, impl)
+
+    def search(self, embedding, k=4):
+        """Returns (text, metadata, squared L2 distance) for the k nearest chunks."""
+        ids, distances = self._impl.search(np.asarray(embedding, dtype=np.float32), k)
+        return [(self._texts[i], self._metadatas[i], float(d)) for i, d in zip(ids, distances)]
+
+class IndexSpool:
+    """Collects the vectors and chunks of an index build in directory a batch
+    at a time, so the build never holds a whole document in memory.
+
+    Vectors are appended to a raw float32 file and chunks to chunks.jsonl.
+    build() memory maps the vectors to build the index and then deletes them.
+    """
+
+    FILE = 'spool_vectors.f32'
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.count = 0
+        self._dim = None
+        os.makedirs(directory, exist_ok=True)
+        self._vectors = open(os.path.join(directory, self.FILE), 'wb')
+        self._chunks = open(os.path.join(directory, CHUNKS_FILE), 'w')
+
+    def add(self, vectors, texts, metadatas):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self._dim = vectors.shape[1]
+        self._vectors.write(vectors.tobytes())
+        for text, metadata in zip(texts, metadatas):
+            self._chunks.write(json.dumps({'text': text, 'metadata': metadata or {}}) + '\n')
+        self.count = self.count + len(vectors)
+
+    def _close(self):
+        self._vectors.close()
+        self._chunks.close()
+
+    def build(self, index_type=HNSW, **params):
+        """Builds the index from the spooled vectors; returns its metadata."""
+        if index_type not in _INDEX_TYPES:
+            raise ValueError(f"Unsupported index type {index_type}")
+        self._close()
+        path = os.path.join(self.directory, self.FILE)
+        vectors = np.memmap(path, dtype=np.float32, mode='r', shape=(self.count, self._dim))
+        try:
+            return VectorIndex._build(self.directory, vectors, index_type, params)
+        finally:
+            del vectors
+            os.remove(path)
+
+    def discard(self):
+        self._close()
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
@@ -0,0 +1,107 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import metrics
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed because the wait queue is full or the wait timed out."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """Bounds in-flight work and the number of requests allowed to wait for it.
+
+    At most max_concurrency requests run at once and at most max_queue more
+    wait for a slot. Anything beyond that, or anything that waits longer than
+    queue_timeout seconds, is rejected with a suggested Retry-After based on
+    recent service times.
+    """
+
+    def __init__(self, max_concurrency=16, max_queue=32, queue_timeout=30.0, name='qa'):
+        self._max_concurrency = max_concurrency
+        self._max_queue = max_queue
+        self._queue_timeout = queue_timeout
+        self._name = name
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._max_waiting = 0
+        self._waits = deque(maxlen=1000)
+        self._service_times = deque(maxlen=100)
+        self._counters = {
+            'admitted': 0,
+            'rejected': 0,
+            'timeouts': 0,
+        }
+        self._reported = dict(self._counters)
+
+    def retry_after(self):
+        """Seconds until a slot is likely to free up for a new request."""
+        if self._service_times:
+            service_time = sum(self._service_times) / len(self._service_times)
+        else:
+            service_time = 1.0
+        return max(1, math.ceil(service_time * (self._waiting + 1) / self._max_concurrency))
+
+    @contextmanager
+    def admit(self):
+        queued = time.monotonic()
+        with self._cond:
+            if self._active >= self._max_concurrency:
+                if self._waiting >= self._max_queue:
+                    self._counters['rejected'] += 1
+                    raise AdmissionRejected("Too many requests", self.retry_after())
+                self._waiting += 1
+                self._max_waiting = max(self._max_waiting, self._waiting)
+                try:
+                    expires = queued + self._queue_timeout
+                    while self._active >= self._max_concurrency:
+                        remaining = expires - time.monotonic()
+                        if remaining <= 0:
+                            self._counters['timeouts'] += 1
+                            raise AdmissionRejected("Timed out waiting for capacity", self.retry_after())
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._active += 1
+            self._counters['admitted'] += 1
+            started = time.monotonic()
+            self._waits.append(started - queued)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._service_times.append(time.monotonic() - started)
+                self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            waits = sorted(self._waits)
+            stats = dict(self._counters)
+            stats['inFlight'] = self._active
+            stats['queueDepth'] = self._waiting
+            stats['queueDepthMax'] = self._max_waiting
+        n = len(waits)
+        stats['queueWaitP50'] = waits[int(0.50 * n)] if n else None
+        stats['queueWaitP99'] = waits[min(n - 1, int(0.99 * n))] if n else None
+        return stats
+
+    def emit_stats(self):
+        """Emits gauges plus counter deltas since the last call, for autoscaling."""
+        stats = self.stats()
+        with self._cond:
+            for name in self._counters:
+                stats[name] = self._counters[name] - self._reported[name]
+            self._reported = dict(self._counters)
+            self._max_waiting = self._waiting
+            self._waits.clear()
+        stats['concurrencyUtilization'] = stats['inFlight'] / self._max_concurrency
+        metrics.emit(stats, dimensions={'Admission': self._name})
@@ -2,35 +2,104 @@
 # SPDX-License-Identifier: MIT-0
 
 import os
+import functools
+import threading
+import time
 import traceback
+from collections import OrderedDict
 from typing import List
 import json
 import boto3
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from langchain.vectorstores import Chroma
-from langchain.embeddings.base import Embeddings
-from pydantic import BaseModel
+from langchain.docstore.document import Document
 from langchain.embeddings.base import Embeddings
 from pydantic import BaseModel
 from cohere_sagemaker import Client
 import numpy as np
+from invoker import EndpointInvoker
+from vector_index import VectorIndex
+from metrics import MetricsReporter
+from batcher import MicroBatcher
+from singleflight import SingleFlight
+from admission import AdmissionController, AdmissionRejected
+from localcache import LocalDiskCache
+from publish import resolve
 
 app = Flask(__name__)
 CORS(app)
 
+invoker = EndpointInvoker.from_env()
+# Created at import time; under a pre-forking server the reporter thread is
+# started in each worker process on its first request, not in the master.
+reporter = MetricsReporter(interval=int(os.environ.get('metrics_interval', 60)))
+reporter.register(invoker.emit_stats)
+
+cohere_clients = {}
+cohere_clients_lock = threading.Lock()
+
+embed_batchers = {}
+embed_batchers_lock = threading.Lock()
+embed_batch_max_size = int(os.environ.get('embed_batch_max_size', 16))
+embed_batch_max_wait = float(os.environ.get('embed_batch_max_wait_ms', 5)) / 1000
+
+def emit_batcher_stats():
+    for batcher in list(embed_batchers.values()):
+        batcher.emit_stats()
+
+reporter.register(emit_batcher_stats)
+
+questions = SingleFlight(name='questions')
+question_timeout = float(os.environ.get('singleflight_timeout', 120))
+reporter.register(questions.emit_stats)
+
+admission = AdmissionController(max_concurrency=int(os.environ.get('admission_max_concurrency', 16)),
+                                max_queue=int(os.environ.get('admission_max_queue', 32)),
+                                queue_timeout=float(os.environ.get('admission_queue_timeout', 30)))
+reporter.register(admission.emit_stats)
+
+# Set local_cache_dir to an empty string to open stores directly on EFS
+local_cache = None
+if os.environ.get('local_cache_dir', '/tmp/vector-cache'):
+    local_cache = LocalDiskCache(os.environ.get('local_cache_dir', '/tmp/vector-cache'),
+                                 max_bytes=int(float(os.environ.get('local_cache_max_gb', 10)) * 2**30),
+                                 check_interval=float(os.environ.get('local_cache_check_interval', 30)))
+    reporter.register(local_cache.emit_stats)
+
 def query_endpoint_with_json_payload(encoded_json, endpoint_name):
-    client = boto3.client("runtime.sagemaker")
-    response = client.invoke_endpoint(
-        EndpointName=endpoint_name, ContentType="application/json", Body=encoded_json
-    )
-    return response
+    return invoker.invoke(endpoint_name, encoded_json)
 
 def parse_response_multiple_texts(query_response):
-    generated_text = []
-    model_predictions = json.loads(query_response["Body"].read())
+    model_predictions = json.loads(query_response)
     return model_predictions[0]
 
+def get_cohere_client(endpoint_name):
+    # boto3 client creation is not thread safe, so hedged calls share one client
+    with cohere_clients_lock:
+        if endpoint_name not in cohere_clients:
+            cohere_clients[endpoint_name] = Client(endpoint_name=endpoint_name)
+        return cohere_clients[endpoint_name]
+
+def embed_texts(endpoint_name, texts):
+    payload = {'text_inputs': texts}
+    payload = json.dumps(payload).encode('utf-8')
+    response = invoker.invoke(endpoint_name, payload)
+    model_predictions = json.loads(response)
+    return model_predictions['embedding']
+
+def get_embed_batcher(endpoint_name):
+    with embed_batchers_lock:
+        if endpoint_name not in embed_batchers:
+            embed_batchers[endpoint_name] = MicroBatcher(lambda texts: embed_texts(endpoint_name, texts),
+                                                         max_batch_size=embed_batch_max_size,
+                                                         max_wait=embed_batch_max_wait,
+                                                         name='embed')
+        return embed_batchers[endpoint_name]
+
+def normalize_question(question):
+    return ' '.join(question.lower().split()).strip('?!. ')
+
 class SMEndpointEmbeddings(BaseModel, Embeddings):
     endpoint_name: str
         
@@ -44,16 +113,174 @@ class SMEndpointEmbeddings(BaseModel, Embeddings):
         return results
 
     def embed_query(self, text: str) -> List[float]:
-        payload = {'text_inputs': [text]}
-        payload = json.dumps(payload).encode('utf-8')
-        client = boto3.client("runtime.sagemaker")
-        response = client.invoke_endpoint(EndpointName=self.endpoint_name, 
-                                                ContentType='application/json',  
-                                                Body=payload)
-    
-        model_predictions = json.loads(response['Body'].read())
-        embedding = model_predictions['embedding'][0]
-        return embedding
+        # Concurrent questions share one batched endpoint call
+        if embed_batch_max_size <= 1:
+            return embed_texts(self.endpoint_name, [text])[0]
+        return get_embed_batcher(self.endpoint_name)(text)
+
+class VectorStore:
+    """An open Chroma store kept across requests.
+
+    The question is embedded outside the lock so concurrent questions can
+    still share embedding batches; only the store query itself is serialized
+    because the underlying database connection is not thread safe.
+    """
+
+    def __init__(self, persist_directory, endpoint_embed):
+        self.embeddings = SMEndpointEmbeddings(
+            endpoint_name=endpoint_embed
+        )
+        self.vectordb = Chroma(persist_directory=persist_directory, embedding_function=self.embeddings)
+        self.lock = threading.Lock()
+
+    def similarity_search_with_score(self, question, k=4):
+        embedding = self.embeddings.embed_query(question)
+        with self.lock:
+            return self.vectordb.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+
+class AnnStore:
+    """An approximate nearest neighbor index built next to a large document's Chroma store."""
+
+    def __init__(self, index_directory, endpoint_embed):
+        self.embeddings = SMEndpointEmbeddings(
+            endpoint_name=endpoint_embed
+        )
+        self.index = VectorIndex.load(index_directory)
+        print(f"Loaded {self.index.meta['indexType']} index of {self.index.meta['count']} chunks")
+
+    def similarity_search_with_score(self, question, k=4):
+        embedding = self.embeddings.embed_query(question)
+        return [(Document(page_content=text, metadata=metadata), distance)
+                for text, metadata, distance in self.index.search(embedding, k)]
+
+manifests = {}
+manifest_check_interval = float(os.environ.get('manifest_check_interval', 5))
+
+def resolve_version(doc_dir):
+    """Resolves the document's current published version, re-reading the manifest every few seconds."""
+    now = time.monotonic()
+    cached = manifests.get(doc_dir)
+    if cached and now - cached[0] < manifest_check_interval:
+        return cached[1]
+    resolved = resolve(doc_dir)
+    manifests[doc_dir] = (now, resolved)
+    return resolved
+
+def store_source(doc_dir):
+    """Returns (directory, version) of the document's store, preferring the ANN index when one was built."""
+    root, version = resolve_version(doc_dir)
+    index_directory = os.path.join(root, 'ann')
+    if VectorIndex.exists(index_directory):
+        return index_directory, version
+    persist_directory = os.path.join(root, 'db')
+    if os.path.exists(persist_directory):
+        return persist_directory, version
+    return None, None
+
+def open_store(directory, endpoint_embed):
+    if local_cache:
+        local_cache.opened(directory)
+    if VectorIndex.exists(directory):
+        return AnnStore(directory, endpoint_embed)
+    return VectorStore(directory, endpoint_embed)
+
+vector_stores = OrderedDict()
+vector_stores_lock = threading.Lock()
+vector_store_cache_size = int(os.environ.get('vector_store_cache_size', 32))
+
+def get_vector_store(source, version, endpoint_embed):
+    # Keyed by the local copy, so a new version of the source opens a new store
+    directory = local_cache.get(source, version) if local_cache else source
+    with vector_stores_lock:
+        if directory in vector_stores:
+            vector_stores.move_to_end(directory)
+            return vector_stores[directory]
+    store = open_store(directory, endpoint_embed)
+    with vector_stores_lock:
+        store = vector_stores.setdefault(directory, store)
+        while len(vector_stores) > vector_store_cache_size:
+            evicted, _ = vector_stores.popitem(last=False)
+            if local_cache:
+                local_cache.release(evicted)
+    return store
+
+preloaded = []
+
+def warm_page_cache(directory):
+    """Reads every file under directory so later opens are served from the page cache."""
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            with open(os.path.join(root, name), 'rb') as f:
+                while f.read(1 << 20):
+                    pass
+
+def preload_vector_stores():
+    """Stages the stores named in preload_docs, or all of them for '*'.
+
+    Run at import time, so under a pre-forking server it runs once in the
+    master. Only the files are prepared there: they are copied into the
+    local cache and read into the page cache, which the workers share. The
+    stores themselves hold database connections that must not cross a fork,
+    so each worker opens them in open_preloaded_stores after forking.
+    """
+    preload_docs = os.environ.get('preload_docs', '')
+    if not preload_docs:
+        return
+    mntpnt = os.environ['mountpoint']
+    if preload_docs == '*':
+        docIds = sorted(os.listdir(mntpnt))
+    else:
+        docIds = [d.strip() for d in preload_docs.split(',') if d.strip()]
+    for docId in docIds[:vector_store_cache_size]:
+        source, version = store_source(os.path.join(mntpnt, docId))
+        if source:
+            print(f"Preloading vector store files for {docId}")
+            warm_page_cache(local_cache.get(source, version) if local_cache else source)
+            preloaded.append((source, version))
+
+def open_preloaded_stores():
+    """Opens the stores staged by preload_vector_stores in this process."""
+    endpoint_embed = os.environ['endpoint_embed']
+    for source, version in preloaded:
+        get_vector_store(source, version, endpoint_embed)
+
+def generate_answer(source, version, question, endpoint_embed, endpoint_qa):
+    vectordb = get_vector_store(source, version, endpoint_embed)
+
+    docs = vectordb.similarity_search_with_score(question)
+
+    scores = []
+    for t in docs:
+        scores.append(t[1])
+
+    score_array = np.asarray(scores)
+    high_score_idx = score_array.argmax()
+    print(f"High score {score_array[high_score_idx]}")
+    context = docs[high_score_idx][0].page_content.replace("\n", "")
+    qa_prompt = f'Context={context}\nQuestion={question}\nAnswer='
+    response = invoker.call(endpoint_qa,
+                            lambda name: get_cohere_client(name).generate(prompt=qa_prompt,
+                                                                          max_tokens=512,
+                                                                          temperature=0.25,
+                                                                          return_likelihoods='GENERATION'))
+    answer = response.generations[0].text.strip().replace('\n', '')
+    return answer
+
+def admitted(view):
+    """Runs the view under admission control, shedding load with 429 when saturated."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        reporter.ensure_started()
+        try:
+            with admission.admit():
+                return view(*args, **kwargs)
+        except AdmissionRejected as e:
+            print(f"Shedding request: {str(e)}")
+            resp = jsonify(error=str(e), code=429)
+            resp.status_code = 429
+            resp.headers['Retry-After'] = str(e.retry_after)
+            return resp
+    return wrapper
 
 @app.route("/health")
 def health():
@@ -61,7 +288,18 @@ def health():
     resp.status_code = 200
     return resp
 
+@app.route("/metrics")
+def endpoint_metrics():
+    resp = jsonify(endpoints=invoker.stats(),
+                   batchers={name: b.stats() for name, b in list(embed_batchers.items())},
+                   singleflight=questions.stats(),
+                   admission=admission.stats(),
+                   cache=local_cache.stats() if local_cache else None)
+    resp.status_code = 200
+    return resp
+
 @app.route("/", methods=['POST'])
+@admitted
 def answerquestion():
     content_type = request.headers.get('Content-Type')
     if (content_type == 'application/json'):
@@ -87,35 +325,18 @@ def answerquestion():
     try:
         # Create LLM chain
         doc_dir = os.path.join(mntpnt, docId)
-        persist_directory = os.path.join(doc_dir, 'db')
-        if not os.path.exists(persist_directory):
+        source, version = store_source(doc_dir)
+        if not source:
             return {
                 'error': f"Could not find Chroma database for {docId}",
                 'code': 400
             }
 
-        embeddings = SMEndpointEmbeddings(
-            endpoint_name=endpoint_embed
-        )
-        vectordb = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
-
-        cohere_client = Client(endpoint_name=endpoint_qa)
-        docs = vectordb.similarity_search_with_score(question)
-
-        scores = []
-        for t in docs:
-            scores.append(t[1])
-
-        score_array = np.asarray(scores)
-        high_score_idx = score_array.argmax()
-        print(f"High score {score_array[high_score_idx]}")
-        context = docs[high_score_idx][0].page_content.replace("\n", "")
-        qa_prompt = f'Context={context}\nQuestion={question}\nAnswer='
-        response = cohere_client.generate(prompt=qa_prompt, 
-                                        max_tokens=512, 
-                                        temperature=0.25, 
-                                        return_likelihoods='GENERATION')
-        answer = response.generations[0].text.strip().replace('\n', '')
+        # Identical questions about the same document share one answer
+        key = (docId, normalize_question(question))
+        answer = questions.do(key,
+                              lambda: generate_answer(source, version, question, endpoint_embed, endpoint_qa),
+                              timeout=question_timeout)
 
         return {
             'answer': answer,
@@ -131,6 +352,9 @@ def answerquestion():
             'code': 400
         }
 
+preload_vector_stores()
+
 if __name__ == "__main__":
+    open_preloaded_stores()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port)
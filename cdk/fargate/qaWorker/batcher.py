@@ -0,0 +1,127 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+import metrics
+
+class MicroBatcher:
+    """Coalesces concurrent single-item requests into batched calls.
+
+    Items submitted from request threads wait at most max_wait seconds, or
+    until max_batch_size items are collected, and are then passed together to
+    process_batch, which must return one result per item in the same order.
+    Up to max_concurrent_batches batches run at once; while they are all busy
+    new items keep collecting, so batches grow with load instead of queueing.
+    """
+
+    def __init__(self, process_batch, max_batch_size=16, max_wait=0.005, max_concurrent_batches=4, name='batcher'):
+        self._process_batch = process_batch
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._max_concurrent_batches = max_concurrent_batches
+        self._name = name
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._executor = None
+        self._slots = None
+        self._sizes = Counter()
+        self._waits = []
+
+    def submit(self, item):
+        """Queues an item and returns a Future for its result."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future, time.monotonic()))
+        return future
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._slots = threading.Semaphore(self._max_concurrent_batches)
+            self._executor = ThreadPoolExecutor(max_workers=self._max_concurrent_batches,
+                                                thread_name_prefix=self._name)
+            thread = threading.Thread(target=self._collect, name=f"{self._name}-collector", daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def _drain(self, batch, block_until):
+        while len(batch) < self._max_batch_size:
+            try:
+                if block_until is None:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    remaining = block_until - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            self._drain(batch, time.monotonic() + self._max_wait)
+            self._slots.acquire()
+            # Top up with anything that arrived while waiting for a free slot
+            self._drain(batch, None)
+            self._executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        try:
+            dispatched = time.monotonic()
+            with self._lock:
+                self._sizes[len(batch)] += 1
+                self._waits.extend(dispatched - queued for _, _, queued in batch)
+                if len(self._waits) > 10000:
+                    self._waits = self._waits[-1000:]
+            try:
+                results = self._process_batch([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise ValueError(f"Batch of {len(batch)} items returned {len(results)} results")
+            except Exception as e:
+                print(traceback.format_exc())
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                return
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            sizes = dict(self._sizes)
+            waits = sorted(self._waits)
+        batches = sum(sizes.values())
+        items = sum(size * count for size, count in sizes.items())
+        n = len(waits)
+        return {
+            'batches': batches,
+            'items': items,
+            'batchSizeMean': items / batches if batches else None,
+            'batchSizeMax': max(sizes) if sizes else None,
+            'batchSizeHistogram': {str(size): sizes[size] for size in sorted(sizes)},
+            'queueWaitP50': waits[int(0.50 * n)] if n else None,
+            'queueWaitP99': waits[min(n - 1, int(0.99 * n))] if n else None,
+        }
+
+    def emit_stats(self):
+        stats = self.stats()
+        histogram = stats.pop('batchSizeHistogram')
+        metrics.emit(stats, dimensions={'Batcher': self._name})
+        for size, count in histogram.items():
+            metrics.emit({'batchCount': count}, dimensions={'Batcher': self._name, 'BatchSize': size})
@@ -0,0 +1,37 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Production serving settings for the QA worker. The app module, with its
+# heavy imports and the files of any preloaded vector stores, is imported
+# once in the master and shared copy-on-write by the forked workers.
+
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+worker_class = 'gthread'
+workers = int(os.environ.get('qa_workers', len(os.sched_getaffinity(0))))
+# Admission control runs per worker. Each worker gets a few more threads than
+# the requests it admits or queues, so requests beyond the queue still reach
+# the app and are shed with 429. gthread would otherwise hold every accepted
+# connection in its own queue, so accepted connections are capped at the
+# thread count; any more wait in the listen backlog.
+admission_slots = int(os.environ.get('admission_max_concurrency', 16)) + int(os.environ.get('admission_max_queue', 32))
+threads = int(os.environ.get('qa_threads', admission_slots + int(os.environ.get('qa_shed_threads', 4))))
+worker_connections = int(os.environ.get('qa_worker_connections', threads))
+preload_app = os.environ.get('qa_preload', 'true').lower() == 'true'
+timeout = int(os.environ.get('qa_worker_timeout', 300))
+graceful_timeout = 30
+keepalive = 75
+accesslog = '-'
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's generations so
+    # garbage collection in the workers does not touch, and copy, those pages.
+    gc.freeze()
+    server.log.info(f"Serving with {workers} workers x {threads} threads, preload={preload_app}")
+
+def post_worker_init(worker):
+    # Vector stores are opened after the fork, so no database connection is shared between workers
+    import app
+    app.open_preloaded_stores()
@@ -0,0 +1,225 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import metrics
+from publish import directory_size
+
+MARKER = '.cache.json'
+LOCK = '.cache.lock'
+
+def version_stamp(directory):
+    """Hash of every file's relative path, size and mtime under directory.
+
+    Only needs metadata calls, so it is cheap to check against EFS compared
+    with reading the files.
+    """
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            st = os.stat(path)
+            digest.update(f"{os.path.relpath(path, directory)}:{st.st_size}:{st.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+class LocalDiskCache:
+    """Read-through copy of EFS directories on local ephemeral storage.
+
+    get() returns a local copy of a source directory, copying it on first
+    use. Copies are named by the source's version stamp. The stamp is
+    re-checked against EFS at most every check_interval seconds, and a
+    changed source is copied again under a new name. Worker processes share
+    the copies. A directory's mtime records its last use, and least recently
+    used copies are evicted once the cache holds more than max_bytes.
+
+    A process holds a shared lock on every copy get() returned to it until
+    release() is called for that copy, and eviction skips copies that any
+    process still holds.
+
+    A published version never changes once written, so when get() is given
+    its version it is used as the stamp and EFS is not checked again.
+    """
+
+    def __init__(self, root, max_bytes, check_interval=30.0, name='vectors'):
+        self._root = root
+        self._max_bytes = max_bytes
+        self._check_interval = check_interval
+        self._name = name
+        self._lock = threading.Lock()
+        self._source_locks = {}
+        self._entries = {}
+        self._held = {}
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'evictions': 0,
+            'evictionsSkipped': 0,
+            'efsBytesRead': 0,
+            'localBytesRead': 0,
+        }
+
+    def _source_lock(self, source):
+        with self._lock:
+            return self._source_locks.setdefault(source, threading.Lock())
+
+    def _incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def _path_for(self, source, stamp):
+        return os.path.join(self._root, f"{hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]}-{stamp[:16]}")
+
+    def get(self, source, version=None):
+        """Returns the local copy of source, or source itself if it could not be copied consistently."""
+        with self._source_lock(source):
+            entry = self._entries.get(source)
+            now = time.monotonic()
+            if entry and (version is not None or now - entry['checked'] < self._check_interval) \
+                    and self._hold(entry['path']):
+                self._touch(entry['path'])
+                self._incr('hits')
+                return entry['path']
+
+            if version is not None:
+                stamp = hashlib.sha1(version.encode('utf-8')).hexdigest()
+            else:
+                stamp = version_stamp(source)
+            path = self._path_for(source, stamp)
+            if self._hold(path):
+                self._incr('hits')
+            else:
+                self._incr('refreshes' if entry else 'misses')
+                if not self._copy(source, stamp, path, immutable=version is not None) or not self._hold(path):
+                    return source
+                self._evict()
+            self._entries[source] = {'path': path, 'checked': now}
+            self._touch(path)
+            return path
+
+    def release(self, path):
+        """Drops this process's hold on a copy returned by get(), letting it be evicted."""
+        with self._lock:
+            fd = self._held.pop(path, None)
+        if fd is not None:
+            os.close(fd)
+
+    def _hold(self, path):
+        """Takes a shared lock on a copy for this process; False if the copy does not exist."""
+        with self._lock:
+            if path in self._held:
+                return True
+        try:
+            fd = os.open(os.path.join(path, LOCK), os.O_RDWR | os.O_CREAT)
+        except (FileNotFoundError, NotADirectoryError):
+            return False
+        # Waits while another process is evicting the copy, which then no longer exists
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        if not os.path.exists(os.path.join(path, MARKER)):
+            os.close(fd)
+            return False
+        with self._lock:
+            if path in self._held:
+                os.close(fd)
+            else:
+                self._held[path] = fd
+        return True
+
+    def opened(self, path):
+        """Counts the bytes of a store opened from the cache, or from EFS for an uncached source."""
+        try:
+            with open(os.path.join(path, MARKER)) as f:
+                self._incr('localBytesRead', json.load(f)['bytes'])
+        except FileNotFoundError:
+            self._incr('efsBytesRead', directory_size(path))
+
+    def _copy(self, source, stamp, path, immutable=False):
+        os.makedirs(self._root, exist_ok=True)
+        tmp = os.path.join(self._root, f".tmp-{uuid.uuid4().hex}")
+        try:
+            shutil.copytree(source, tmp)
+            size = directory_size(tmp)
+            self._incr('efsBytesRead', size)
+            # The source changed while copying, so this copy may be inconsistent
+            if not immutable and version_stamp(source) != stamp:
+                print(f"{source} changed while caching, reading it from EFS")
+                return False
+            open(os.path.join(tmp, LOCK), 'w').close()
+            with open(os.path.join(tmp, MARKER), 'w') as f:
+                json.dump({'source': source, 'stamp': stamp, 'bytes': size}, f)
+            try:
+                os.rename(tmp, path)
+            except OSError:
+                # Another worker process published the same version first
+                if not os.path.exists(path):
+                    raise
+            print(f"Cached {source} ({size} bytes) in {path}")
+            return True
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        copies = []
+        for name in os.listdir(self._root):
+            path = os.path.join(self._root, name)
+            try:
+                with open(os.path.join(path, MARKER)) as f:
+                    size = json.load(f)['bytes']
+                copies.append((os.path.getmtime(path), size, path))
+            except (FileNotFoundError, NotADirectoryError, ValueError):
+                continue
+        total = sum(size for _, size, _ in copies)
+        for last_used, size, path in sorted(copies):
+            if total <= self._max_bytes:
+                break
+            with self._lock:
+                if path in self._held:
+                    continue
+            if not self._remove(path):
+                self._incr('evictionsSkipped')
+                continue
+            total = total - size
+            self._incr('evictions')
+            print(f"Evicted {path} from the local cache")
+
+    def _remove(self, path):
+        """Deletes a copy unless a process holds it, keeping it locked while it is deleted."""
+        try:
+            fd = os.open(os.path.join(path, LOCK), os.O_RDWR | os.O_CREAT)
+        except (FileNotFoundError, NotADirectoryError):
+            return False
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            # Removing the marker first makes waiting holders see the copy is gone
+            os.remove(os.path.join(path, MARKER))
+            shutil.rmtree(path, ignore_errors=True)
+            return True
+        finally:
+            os.close(fd)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        if os.path.exists(self._root):
+            stats['diskBytes'] = directory_size(self._root)
+        return stats
+
+    def emit_stats(self):
+        metrics.emit(self.stats(), dimensions={'Cache': self._name})
@@ -0,0 +1,69 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import metrics
+
+class SingleFlightTimeout(Exception):
+    """Raised when a coalesced request gives up waiting for the leader's result."""
+
+class SingleFlight:
+    """Runs one call per key at a time and shares its outcome with duplicates.
+
+    The first request for a key does the work. Requests for the same key that
+    arrive while it is running wait for its result, or its exception, instead
+    of repeating the work. Once the call finishes the key is forgotten, so
+    results are never served after the fact.
+    """
+
+    def __init__(self, name='singleflight'):
+        self._name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counters = {
+            'leaders': 0,
+            'coalesced': 0,
+            'timeouts': 0,
+        }
+
+    def do(self, key, fn, timeout=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = Future()
+                self._calls[key] = call
+                self._counters['leaders'] += 1
+            else:
+                self._counters['coalesced'] += 1
+
+        if not leader:
+            try:
+                return call.result(timeout)
+            except FutureTimeoutError:
+                with self._lock:
+                    self._counters['timeouts'] += 1
+                raise SingleFlightTimeout(f"Timed out after {timeout}s waiting for an identical request")
+
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['inFlight'] = len(self._calls)
+        return stats
+
+    def emit_stats(self):
+        metrics.emit(self.stats(), dimensions={'SingleFlight': self._name})
@@ -0,0 +1,80 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Lambda handler that summarizes and embeds a small document in one
+# invocation, instead of two Fargate tasks.
+
+import os
+import posixpath
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from summarizer import summarize, store_summary, SageMakerLLMAI21
+import summarizer
+import indexbuilder
+import pipelinestate
+
+chunk_size = int(os.environ.get('chunk_size', 10000))
+chunk_overlap = int(os.environ.get('chunk_overlap', 1000))
+
+# Inputs: document id and s3 location of the extracted text, from the ingest processor
+def handler(event, context):
+
+    print(f"event: {event}")
+    docId = event['docId']
+    bucket = event['bucket']
+    name = event['name']
+    region = os.environ['region']
+    endpoint_name = os.environ['endpoint']
+    endpoint_embed = os.environ['endpoint_embed']
+    mntpnt = os.environ['mountpoint']
+
+    ddb = boto3.resource('dynamodb', region_name=region)
+    table = ddb.Table(os.environ['table'])
+    embed_table = ddb.Table(os.environ['embed_table'])
+
+    summarized = False
+    embedding = None
+    try:
+        # Small enough to read at once
+        text = boto3.client('s3').get_object(Bucket=bucket, Key=name)['Body'].read().decode('utf-8')
+        doc_dir = os.path.join(mntpnt, docId)
+        os.makedirs(doc_dir, exist_ok=True)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # The document is queryable as soon as its index is published, so that starts first
+            embedding = executor.submit(indexbuilder.build_index, [text], endpoint_embed, doc_dir,
+                                        embed_table, docId, docId, f"s3://{bucket}/{name}")
+
+            try:
+                text_splitter = RecursiveCharacterTextSplitter(separators = ["<CHUNK>", "<PAGE>", "\n"],
+                                                               chunk_size = chunk_size,
+                                                               chunk_overlap  = chunk_overlap)
+                llm = SageMakerLLMAI21(endpoint_name = endpoint_name)
+                summary, count = summarize(llm, text_splitter.split_text(text))
+                store_summary(table, docId, docId, summary, count, bucket, posixpath.join(posixpath.dirname(name), f"summary-{docId}.txt.gz"))
+                summarized = True
+                pipelinestate.record(docId, 'summarizedAt')
+            except Exception:
+                # A build that has not started is dropped; leaving the executor waits for a running one
+                embedding.cancel()
+                raise
+
+            embedding.result()
+
+    except Exception as e:
+        trc = traceback.format_exc()
+        print(trc)
+        print(str(e))
+        try:
+            if embedding is None or embedding.cancelled() or embedding.exception() is not None:
+                pipelinestate.mark_failed(embed_table, docId, docId)
+            if not summarized:
+                pipelinestate.mark_failed(table, docId, docId)
+        except Exception:
+            print(traceback.format_exc())
+        pipelinestate.advance(docId, ["Summarizing", "Embedding"], "Failed")
+
+    summarizer.invoker.emit_stats()
+    indexbuilder.invoker.emit_stats()
@@ -2,87 +2,111 @@
 # SPDX-License-Identifier: MIT-0
 
 import os
+import posixpath
+import queue
+import threading
 import traceback
-from typing import Optional, List 
 import json
 import boto3
 from langchain.docstore.document import Document
-from langchain.llms.base import LLM
 from langchain.chains.summarize import load_summarize_chain
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-import ai21
-
-def query_endpoint_with_json_payload(encoded_json, endpoint_name):
-    client = boto3.client("runtime.sagemaker")
-    response = client.invoke_endpoint(
-        EndpointName=endpoint_name, ContentType="application/json", Body=encoded_json
-    )
-    return response
-    
-def parse_response_multiple_texts(query_response):
-    model_predictions = json.loads(query_response["Body"].read())
-    generated_text = model_predictions["generated_texts"]
-    return generated_text
-
-def query_endpoint(encoded_text, endpoint_name):
-    client = boto3.client("runtime.sagemaker")
-    response = client.invoke_endpoint(
-        EndpointName=endpoint_name, ContentType="application/x-text", Body=encoded_text
+from summarizer import invoker, summarize, store_summary, SageMakerLLMAI21, SageMakerLLMFlanT5
+from s3stream import iter_object, iter_text, split_stream
+import indexbuilder
+import pipelinestate
+
+stream_part_size = int(float(os.environ.get('stream_part_mb', 8)) * 2**20)
+stream_parallel = int(os.environ.get('stream_parallel', 4))
+pipeline_queue_size = int(os.environ.get('pipeline_queue_size', 64))
+progress_every = int(os.environ.get('progress_every', 10))
+# Set for documents in pipeline mode that are embedded after summarization rather than with it
+embed_queue_url = os.environ.get('embed_queue_url', '')
+
+class StageAborted(Exception):
+    """Raised in the embedding thread when the summarization it was fed from failed."""
+
+class EmbeddingStage:
+    """Builds the document's vector stores in a background thread from the text being summarized.
+
+    Text read for summarization is also put on a bounded queue that the
+    embedding thread consumes, so both stages run over one read of the
+    input. If embedding falls pipeline_queue_size pieces behind, reading
+    waits for it.
+    """
+
+    def __init__(self, maxsize):
+        self._queue = queue.Queue(maxsize)
+        self._failed = threading.Event()
+        self._aborted = threading.Event()
+        self._thread = None
+        self.error = None
+
+    def start(self, *args):
+        self._thread = threading.Thread(target=self._run, args=args, daemon=True)
+        self._thread.start()
+
+    def _texts(self):
+        while True:
+            # Fails the build, so stores holding part of the document are never published
+            if self._aborted.is_set():
+                raise StageAborted("Summarization failed before the whole document was read")
+            try:
+                text = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if text is None:
+                return
+            yield text
+
+    def _run(self, *args):
+        try:
+            indexbuilder.build_index(self._texts(), *args)
+        except Exception as e:
+            print(traceback.format_exc())
+            self.error = e
+            self._failed.set()
+
+    def _put(self, text):
+        # Stop feeding a failed stage rather than blocking on its full queue
+        while not self._failed.is_set():
+            try:
+                self._queue.put(text, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def tee(self, texts):
+        """Passes texts through, also sending each one to the embedding thread."""
+        for text in texts:
+            self._put(text)
+            yield text
+        self._put(None)
+
+    def join(self):
+        self._thread.join()
+        return self.error
+
+    def abort(self):
+        """Stops the embedding thread without publishing anything, and waits for it."""
+        self._aborted.set()
+        return self.join()
+
+def queue_embedding(ddb, docId, bucket, name):
+    """Queues the embedding job for a pipeline mode document whose summary is done."""
+    if not embed_queue_url or not pipelinestate.advance(docId, ["Summarizing"], "Embedding"):
+        return
+    embed_table = os.environ['embed_table']
+    ddb.Table(embed_table).put_item(Item={'documentId': docId, 'jobId': docId, 'jobStatus': "Started"})
+    boto3.client('sqs').send_message(
+        QueueUrl=embed_queue_url,
+        MessageBody=json.dumps({'documentId': docId,
+                                'bucketName': bucket,
+                                'objectName': name,
+                                'jobId': docId,
+                                'jobTable': embed_table})
     )
-    return response
-
-
-def parse_response(query_response):
-    model_predictions = json.loads(query_response["Body"].read())
-    generated_text = model_predictions["generated_text"]
-    return generated_text
-
-class SageMakerLLMAI21(LLM):
-
-    endpoint_name: str
-    
-    @property
-    def _llm_type(self) -> str:
-        return "summarize"
-    
-    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
-        response = ai21.Summarize.execute(
-                          source=prompt,
-                          sourceType="TEXT",
-                          sm_endpoint=self.endpoint_name
-        )
-        return response.summary
-
-class SageMakerLLMFlanT5(LLM):
-
-    endpoint_name: str
-    max_length: int
-    num_beams: int
-    top_k: int
-    top_p: float
-    temperature: float
-    
-    @property
-    def _llm_type(self) -> str:
-        return "summarize"
-    
-    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
-        parameters = {
-            "max_length": self.max_length,
-            "num_return_sequences": 1,
-            #"num_beams": self.num_beams,
-            "top_k": self.top_k,
-            "top_p": self.top_p,
-            "temperature": self.temperature,
-            "do_sample": True,
-        }
-        payload = {"text_inputs": f"Summarize this article:\n\n{prompt}", **parameters}
-        query_response = query_endpoint_with_json_payload(
-            json.dumps(payload).encode("utf-8"), endpoint_name=self.endpoint_name
-        )
-        generated_texts = parse_response_multiple_texts(query_response)
-        
-        return generated_texts[0]
+    print(f"Queued embedding of s3://{bucket}/{name}")
 
 # Inputs: document id and s3 location of output
 def main():
@@ -132,22 +156,31 @@ def main():
     else:
         temperature = 0.5
 
-    name_parts = name.split('/')
-    local_path = os.path.join ('/tmp', name_parts[-1])
+    pipeline = os.environ.get('pipeline', 'false').lower() == 'true'
+    print(f"pipeline: {pipeline}")
 
+    stage = None
+    summarized = False
     try:
         s3 = boto3.client('s3')
-        print(f"Downloading s3://{bucket}/{name} to {local_path}")
-        s3.download_file(bucket, name, local_path)
-
-        text_splitter = RecursiveCharacterTextSplitter(separators = ["<CHUNK>", "<PAGE>", "\n"],
+        ddb = boto3.resource('dynamodb', region_name=region)
+        table = ddb.Table(table_name)
+        separators = ["<CHUNK>", "<PAGE>", "\n"]
+        text_splitter = RecursiveCharacterTextSplitter(separators = separators,
                                                         chunk_size = int(chunk_size),
                                                         chunk_overlap  = int(chunk_overlap))
 
-        with open(local_path) as f:
-            doc = f.read()
-        texts = text_splitter.split_text(doc)
-        print(f"Number of splits: {len(texts)}")
+        # Chunks are summarized as they stream in from S3
+        print(f"Streaming s3://{bucket}/{name}")
+        stream = iter_text(iter_object(s3, bucket, name, stream_part_size, stream_parallel))
+        if pipeline:
+            doc_dir = os.path.join(os.environ['mountpoint'], docId)
+            os.makedirs(doc_dir, exist_ok=True)
+            embed_table = ddb.Table(os.environ['embed_table'])
+            stage = EmbeddingStage(pipeline_queue_size)
+            stage.start(os.environ['endpoint_embed'], doc_dir, embed_table, docId, jobId, f"s3://{bucket}/{name}")
+            stream = stage.tee(stream)
+        texts = split_stream(stream, text_splitter, separators, window=8 * int(chunk_size))
 
         #docs = [Document(page_content=t) for t in texts]
 
@@ -161,27 +194,49 @@ def main():
 
         #chain = load_summarize_chain(llm, chain_type="map_reduce", verbose=False)
         #summary = chain({"input_documents": docs}, return_only_outputs=True)
-        responses = []
-        for t in texts:
-            r = llm(t)
-            responses.append(r)
-        summary = "\n".join(responses)
-
-        ddb = boto3.resource('dynamodb', region_name=region)
-        table = ddb.Table(table_name)
-        table.update_item(
-                Key = { "documentId": docId, "jobId": jobId },
-                UpdateExpression = 'SET jobStatus = :jobstatusValue, summaryText = :outputValue',
-                ExpressionAttributeValues = {
-                    ':jobstatusValue': "Complete",
-                    ':outputValue': summary
-                }
-            )
+        def progress(count):
+            if count % progress_every == 0:
+                table.update_item(
+                        Key = { "documentId": docId, "jobId": jobId },
+                        UpdateExpression = 'SET chunksSummarized = :countValue',
+                        ExpressionAttributeValues = {
+                            ':countValue': count
+                        }
+                    )
+        summary, count = summarize(llm, texts, progress)
+
+        store_summary(table, docId, jobId, summary, count, bucket, posixpath.join(posixpath.dirname(name), f"summary-{jobId}.txt.gz"))
+        summarized = True
+
+        pipelinestate.record(docId, 'summarizedAt')
+
+        if pipeline:
+            error = stage.join()
+            stage = None
+            if error:
+                print(f"Embedding failed: {str(error)}")
+                pipelinestate.mark_failed(embed_table, docId, jobId)
+                pipelinestate.advance(docId, ["Summarizing"], "Failed")
+        else:
+            queue_embedding(ddb, docId, bucket, name)
 
     except Exception as e:
         trc = traceback.format_exc()
         print(trc)
         print(str(e))
+        try:
+            if stage is not None:
+                stage.abort()
+                pipelinestate.mark_failed(embed_table, docId, jobId)
+            if not summarized:
+                pipelinestate.mark_failed(table, docId, jobId)
+        except Exception:
+            print(traceback.format_exc())
+        pipelinestate.advance(docId, ["Summarizing"], "Failed")
+
+    invoker.emit_stats()
+    if pipeline:
+        indexbuilder.invoker.emit_stats()
 
 if __name__ == "__main__":
     main()
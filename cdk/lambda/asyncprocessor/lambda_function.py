@@ -3,34 +3,8 @@
 
 import json
 import os
-from helper import AwsHelper
 import traceback
-import datastore
-
-def processRequest(documentId, bucketName, objectName, snsRole, snsTopic):
-
-    print("Starting job with documentId: {}, bucketName: {}, objectName: {}".format(documentId, bucketName, objectName))
-
-    response = None
-    client = AwsHelper().getClient('textract')
-    response = client.start_document_text_detection(
-        ClientRequestToken  = documentId,
-        DocumentLocation={
-            'S3Object': {
-                'Bucket': bucketName,
-                'Name': objectName
-                }
-        },
-        NotificationChannel= {
-            "RoleArn": snsRole,
-            "SNSTopicArn": snsTopic
-        },
-        JobTag = documentId
-    )
-
-    return response["JobId"]
-
-
+from ingest import startDocument
 
 def respond(err, res=None):
     return {
@@ -56,17 +30,12 @@ def lambda_handler(event, context):
         docId = payload['docId']
         bucket = payload['bucket']
         name = payload['name']
-        snsTopic = os.environ['SNS_TOPIC_ARN']
-        snsRole = os.environ['SNS_ROLE_ARN']
-        outputTable = os.environ['OUTPUT_TABLE']
-        documentsTable = os.environ['DOCUMENTS_TABLE']
+        # In pipeline mode the document is summarized and embedded as soon as text extraction finishes
+        autoPipeline = payload.get('autoPipeline', os.environ.get('AUTO_PIPELINE', 'false').lower() == 'true')
 
         try:
-            jobId = processRequest(docId, bucket, name, snsRole, snsTopic)
-            print(f"Started textract job {jobId}")
-            ds = datastore.DocumentStore(documentsTable, outputTable)
-            ds.createDocument(docId, bucket, name, "Started", jobId)
-            return respond(None, {'msg': "Job started", 'jobId': jobId})
+            started = startDocument(docId, bucket, name, autoPipeline)
+            return respond(None, {'msg': "Job started", **started})
         except Exception as e:
             trc = traceback.format_exc()
             print(f"Error starting textract job: {str(e)} - {trc}")
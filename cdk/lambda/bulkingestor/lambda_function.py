@@ -0,0 +1,53 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import os
+import traceback
+from helper import MetricsHelper, TextractHelper
+from ingest import startDocument
+import datastore
+
+# Inputs: batches of documents queued by the bulk processor. Documents that
+# hit the Textract rate limit are returned to the queue to be tried again.
+def lambda_handler(event, context):
+
+    bulkJobs = datastore.BulkJobStore(os.environ['BULK_TABLE'])
+    failures = []
+    counts = {}
+
+    for record in event['Records']:
+        message = json.loads(record['body'])
+        bulkId = message['bulkId']
+        count = counts.setdefault(bulkId, {'started': 0, 'skipped': 0, 'throttled': 0, 'failed': 0, 'handedOff': 0})
+        try:
+            started = startDocument(message['docId'], message['bucket'], message['name'], message['autoPipeline'], bulkId)
+            # The ingest processor counts the documents it is handed once it starts them
+            if(started['skipped']):
+                count['skipped'] += 1
+            elif(started['handedOff']):
+                count['handedOff'] += 1
+            else:
+                count['started'] += 1
+        except Exception as e:
+            if(TextractHelper.isThrottle(e)):
+                print("Throttled starting {}: {}".format(message['name'], str(e)))
+                count['throttled'] += 1
+                failures.append({'itemIdentifier': record['messageId']})
+            else:
+                trc = traceback.format_exc()
+                print("Error starting {}: {} - {}".format(message['name'], str(e), trc))
+                # Redelivered until the DLQ takes it; only counted once it gets there
+                failures.append({'itemIdentifier': record['messageId']})
+                if(int(record['attributes'].get('ApproximateReceiveCount', 1)) >= int(os.environ.get('MAX_RECEIVE_COUNT', 5))):
+                    count['failed'] += 1
+
+    for bulkId, count in counts.items():
+        bulkJobs.countBulkJob(bulkId, **count)
+        MetricsHelper.emit({'DocumentsStarted': count['started'], 'TextractThrottles': count['throttled']})
+
+    print("Started: {}, handed off: {}, throttled: {}".format(sum(c['started'] for c in counts.values()),
+                                                              sum(c['handedOff'] for c in counts.values()),
+                                                              sum(c['throttled'] for c in counts.values())))
+
+    return {'batchItemFailures': failures}
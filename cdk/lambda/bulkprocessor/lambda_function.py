@@ -0,0 +1,195 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import os
+import time
+import uuid
+import traceback
+from helper import AwsHelper, FileHelper, S3Helper
+import datastore
+
+documentTypes = ['pdf', 'png', 'jpg', 'jpeg', 'tif', 'tiff']
+# Keys queued per step when reading a manifest, like one page of a prefix listing
+manifestPageSize = 1000
+
+def respond(err, res=None, statusCode='200'):
+    return {
+        'statusCode': '400' if err else statusCode,
+        'body': str(err) if err else json.dumps(res),
+        'headers': {
+            'Content-Type': 'application/json',
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Credentials": 'true'
+        },
+    }
+
+def readManifest(bucket, manifest):
+
+    # A JSON list of keys, or one key per line
+    content = S3Helper.readFromS3(bucket, manifest).strip()
+    if(content.startswith('[')):
+        return json.loads(content)
+    return [line.strip() for line in content.splitlines() if line.strip()]
+
+def queueDocuments(client, queueUrl, bulkId, bucket, names, autoPipeline):
+
+    entries = []
+    for name in names:
+        # The same object always gets the same document id, so queuing it twice starts it once
+        docId = str(uuid.uuid5(uuid.NAMESPACE_URL, "s3://{}/{}".format(bucket, name)))
+        entries.append({'Id': str(len(entries)),
+                        'MessageBody': json.dumps({'bulkId': bulkId, 'docId': docId, 'bucket': bucket,
+                                                   'name': name, 'autoPipeline': autoPipeline})})
+
+    for start in range(0, len(entries), 10):
+        batch = entries[start:start + 10]
+        attempt = 0
+        while(batch):
+            response = client.send_message_batch(QueueUrl=queueUrl, Entries=batch)
+            failed = set(f['Id'] for f in response.get('Failed', []))
+            batch = [e for e in batch if e['Id'] in failed]
+            attempt = attempt + 1
+            if(batch and attempt >= 5):
+                raise Exception("Could not queue {} documents".format(len(batch)))
+            if(batch):
+                time.sleep(0.1 * 2 ** attempt)
+
+def listPage(client, bucket, prefix, continuationToken):
+
+    if(continuationToken):
+        response = client.list_objects_v2(Bucket=bucket, Prefix=prefix, ContinuationToken=continuationToken)
+    else:
+        response = client.list_objects_v2(Bucket=bucket, Prefix=prefix)
+    names = [doc['Key'] for doc in response.get('Contents', [])
+             if FileHelper.getFileExtenstion(doc['Key']).lower() in documentTypes]
+    return names, response.get('NextContinuationToken') if response['IsTruncated'] else None
+
+def listDocuments(event, context):
+
+    # Queues the source a page at a time and hands the rest to a new invocation before
+    # this one runs out of time, so a large prefix is never cut short by a timeout
+    bulkId = event['bulkId']
+    bucket = event['bucket']
+    bulkJobs = datastore.BulkJobStore(os.environ['BULK_TABLE'])
+    sqs = AwsHelper().getClient('sqs')
+    maxPages = int(os.environ.get('MAX_LIST_PAGES', 100))
+    marginMillis = int(os.environ.get('LIST_MARGIN_SECONDS', 60)) * 1000
+    pagesListed = event.get('pagesListed', 0)
+    continuationToken = event.get('continuationToken')
+    offset = event.get('offset', 0)
+    manifest = readManifest(bucket, event['manifest']) if 'manifest' in event else None
+
+    try:
+        while(True):
+            if(manifest is not None):
+                names = manifest[offset:offset + manifestPageSize]
+                offset = offset + len(names)
+                more = offset < len(manifest)
+            else:
+                names, continuationToken = listPage(AwsHelper().getClient('s3'), bucket, event.get('prefix', ''), continuationToken)
+                more = continuationToken is not None
+            queueDocuments(sqs, os.environ['INGEST_QUEUE_URL'], bulkId, bucket, names, event['autoPipeline'])
+            pagesListed = pagesListed + 1
+            bulkJobs.countQueued(bulkId, len(names), 1)
+
+            if(not more):
+                bulkJobs.finishListing(bulkId, "Complete")
+                print("Listed {} pages for bulk job {}".format(pagesListed, bulkId))
+                return
+            if(manifest is None and pagesListed >= maxPages):
+                bulkJobs.finishListing(bulkId, "Complete", truncated=True)
+                print("Stopped listing bulk job {} at MAX_LIST_PAGES ({}); later keys were not queued".format(bulkId, maxPages))
+                return
+            if(context.get_remaining_time_in_millis() < marginMillis):
+                break
+    except Exception as e:
+        trc = traceback.format_exc()
+        print(f"Error listing bulk job {bulkId}: {str(e)} - {trc}")
+        bulkJobs.finishListing(bulkId, "Failed", error=str(e))
+        return
+
+    event = dict(event, pagesListed=pagesListed, continuationToken=continuationToken, offset=offset)
+    AwsHelper().getClient('lambda').invoke(FunctionName=context.function_name, InvocationType='Event',
+                                           Payload=json.dumps(event))
+    print("Continuing bulk job {} after {} pages".format(bulkId, pagesListed))
+
+def getStatus(bulkId):
+
+    job = datastore.BulkJobStore(os.environ['BULK_TABLE']).getBulkJob(bulkId)
+    if(not job):
+        return None
+
+    started = int(job.get('documentsStarted', 0))
+    status = {
+        'bulkId': bulkId,
+        'listingStatus': job.get('listingStatus', "Complete"),
+        'pagesListed': int(job.get('pagesListed', 0)),
+        'truncated': bool(job.get('truncated', False)),
+        'documentsQueued': int(job['documentsQueued']),
+        'documentsStarted': started,
+        'documentsSkipped': int(job.get('documentsSkipped', 0)),
+        'documentsHandedOff': int(job.get('documentsHandedOff', 0)),
+        'documentsFailed': int(job.get('documentsFailed', 0)),
+        'textractThrottles': int(job.get('textractThrottles', 0))
+    }
+    if(job.get('listingError')):
+        status['listingError'] = job['listingError']
+    # Start rate over the run so far, or over the whole run once it is done
+    if(started):
+        end = float(job['lastStartedAt'])
+        if(status['listingStatus'] == "Listing" or
+           started + status['documentsSkipped'] + status['documentsFailed'] < status['documentsQueued']):
+            end = time.time()
+        elapsed = max(end - float(job['createdAt']), 1)
+        status['docsPerMinute'] = round(started / elapsed * 60, 2)
+
+    return status
+
+# Inputs: POST with a bucket and either a prefix or a manifest of keys; GET with a bulkId.
+# POST returns once the job is created, and the listing runs in asynchronous invocations of this function.
+def lambda_handler(event, context):
+
+    print("Received event: " + json.dumps(event, indent=2))
+    if('httpMethod' not in event):
+        return listDocuments(event, context)
+    operation = event['httpMethod']
+
+    if operation == "GET":
+        bulkId = (event.get('queryStringParameters') or {}).get('bulkId')
+        if(not bulkId):
+            return respond(ValueError('bulkId is required'))
+        status = getStatus(bulkId)
+        if(not status):
+            return respond(ValueError('Bulk job {} not found'.format(bulkId)))
+        return respond(None, status)
+    elif operation != "POST":
+        return respond(ValueError('Unsupported method "{}"'.format(operation)))
+
+    payload = json.loads(event['body'])
+    bucket = payload['bucket']
+    autoPipeline = payload.get('autoPipeline', os.environ.get('AUTO_PIPELINE', 'false').lower() == 'true')
+    maxPages = int(os.environ.get('MAX_LIST_PAGES', 100))
+
+    try:
+        bulkId = str(uuid.uuid4())
+        listing = {'bulkId': bulkId, 'bucket': bucket, 'autoPipeline': autoPipeline}
+        if('manifest' in payload):
+            source = "s3://{}/{}".format(bucket, payload['manifest'])
+            listing['manifest'] = payload['manifest']
+        else:
+            source = "s3://{}/{}".format(bucket, payload.get('prefix', ''))
+            listing['prefix'] = payload.get('prefix', '')
+
+        # Created first, so ingestors never count against a missing job
+        datastore.BulkJobStore(os.environ['BULK_TABLE']).createBulkJob(bulkId, bucket, source, autoPipeline)
+        AwsHelper().getClient('lambda').invoke(FunctionName=context.function_name, InvocationType='Event',
+                                               Payload=json.dumps(listing))
+        print("Started listing {} as bulk job {}".format(source, bulkId))
+
+        return respond(None, {'msg': "Bulk ingestion started", 'bulkId': bulkId, 'listingStatus': "Listing",
+                              'maxListPages': maxPages}, '202')
+    except Exception as e:
+        trc = traceback.format_exc()
+        print(f"Error starting bulk ingestion: {str(e)} - {trc}")
+        return respond(ValueError(f"Could not start bulk ingestion: {str(e)}"))
@@ -5,6 +5,8 @@ import boto3
 from botocore.exceptions import ClientError
 from helper import AwsHelper
 import  datetime
+import time
+from decimal import Decimal
 
 class DocumentStore:
 
@@ -66,24 +68,37 @@ class DocumentStore:
 
         return err
 
-    def createDocument(self, documentId, bucketName, objectName, jobStatus, jobId):
+    def createDocument(self, documentId, bucketName, objectName, jobStatus, jobId, uploadedAt = None, pipelineStage = None, ingestPath = None):
 
         err = None
 
         dynamodb = AwsHelper().getResource("dynamodb")
         table = dynamodb.Table(self._documentsTableName)
 
+        updateExpression = 'SET bucketName = :bucketNameValue, objectName = :objectNameValue, jobStatus = :jobstatusValue, jobId = :jobIdValue'
+        values = {
+            ':bucketNameValue': bucketName,
+            ':objectNameValue': objectName,
+            ':jobstatusValue': jobStatus,
+            ':jobIdValue': jobId
+        }
+        if uploadedAt is not None:
+            updateExpression = updateExpression + ', uploadedAt = :uploadedAtValue'
+            values[':uploadedAtValue'] = Decimal(str(round(uploadedAt, 3)))
+        # Only documents created in pipeline mode have a stage
+        if pipelineStage is not None:
+            updateExpression = updateExpression + ', pipelineStage = :stageValue'
+            values[':stageValue'] = pipelineStage
+        if ingestPath is not None:
+            updateExpression = updateExpression + ', ingestPath = :ingestPathValue'
+            values[':ingestPathValue'] = ingestPath
+
         try:
             table.update_item(
                 Key = { "documentId": documentId },
-                UpdateExpression = 'SET bucketName = :bucketNameValue, objectName = :objectNameValue, jobStatus = :jobstatusValue, jobId = :jobIdValue',
+                UpdateExpression = updateExpression,
                 ConditionExpression = 'attribute_not_exists(documentId)',
-                ExpressionAttributeValues = {
-                    ':bucketNameValue': bucketName,
-                    ':objectNameValue': objectName,
-                    ':jobstatusValue': jobStatus,
-                    ':jobIdValue': jobId
-                }
+                ExpressionAttributeValues = values
             )
         except ClientError as e:
             print(e)
@@ -120,6 +135,113 @@ class DocumentStore:
 
         return err
 
+    def updateDocumentIngest(self, documentId, ingestPath, jobId):
+
+        err = None
+
+        dynamodb = AwsHelper().getResource("dynamodb")
+        table = dynamodb.Table(self._documentsTableName)
+
+        try:
+            table.update_item(
+                Key = { 'documentId': documentId },
+                UpdateExpression = 'SET ingestPath = :ingestPathValue, jobId = :jobIdValue',
+                ConditionExpression = 'attribute_exists(documentId)',
+                ExpressionAttributeValues = {
+                    ':ingestPathValue': ingestPath,
+                    ':jobIdValue': jobId
+                }
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == "ConditionalCheckFailedException":
+                print(e.response['Error']['Message'])
+                err  = {'Error' : 'Document does not exist.'}
+            else:
+                raise
+
+        return err
+
+    def updateDocumentRouting(self, documentId, routingPath, pagesNative, pagesScanned, nativeSeconds, secondsSaved):
+
+        dynamodb = AwsHelper().getResource("dynamodb")
+        table = dynamodb.Table(self._documentsTableName)
+
+        table.update_item(
+            Key = { 'documentId': documentId },
+            UpdateExpression = 'SET pageRouting = :routingValue, pagesNative = :nativeValue, pagesScanned = :scannedValue, ' +
+                               'nativeSeconds = :secondsValue, secondsSaved = :savedValue',
+            ExpressionAttributeValues = {
+                ':routingValue': routingPath,
+                ':nativeValue': pagesNative,
+                ':scannedValue': pagesScanned,
+                ':secondsValue': Decimal(str(round(nativeSeconds, 3))),
+                ':savedValue': Decimal(str(round(secondsSaved, 3)))
+            }
+        )
+
+    def updateDocumentParts(self, documentId, partsPath, partsTotal):
+
+        dynamodb = AwsHelper().getResource("dynamodb")
+        table = dynamodb.Table(self._documentsTableName)
+
+        table.update_item(
+            Key = { 'documentId': documentId },
+            UpdateExpression = 'SET textractParts = :partsValue, partsTotal = :totalValue REMOVE partsCompleted',
+            ExpressionAttributeValues = {
+                ':partsValue': partsPath,
+                ':totalValue': partsTotal
+            }
+        )
+
+    def completeDocumentPart(self, documentId, part):
+
+        dynamodb = AwsHelper().getResource("dynamodb")
+        table = dynamodb.Table(self._documentsTableName)
+
+        # A set, so a redelivered completion is only counted once
+        response = table.update_item(
+            Key = { 'documentId': documentId },
+            UpdateExpression = 'ADD partsCompleted :partValue',
+            ExpressionAttributeValues = {
+                ':partValue': set([str(part)])
+            },
+            ReturnValues = 'UPDATED_NEW'
+        )
+
+        return len(response['Attributes']['partsCompleted'])
+
+    def advancePipelineStage(self, documentId, fromStages, toStage):
+
+        err = None
+
+        dynamodb = AwsHelper().getResource("dynamodb")
+        table = dynamodb.Table(self._documentsTableName)
+
+        now = Decimal(str(round(time.time(), 3)))
+        # e.g. summarizingAt; the condition makes a redelivered message a no-op
+        stageAt = toStage[0].lower() + toStage[1:] + 'At'
+        values = { ':stageValue': toStage, ':nowValue': now }
+        fromValues = []
+        for i, stage in enumerate(fromStages):
+            values[':fromValue{}'.format(i)] = stage
+            fromValues.append(':fromValue{}'.format(i))
+
+        try:
+            table.update_item(
+                Key = { 'documentId': documentId },
+                UpdateExpression = 'SET pipelineStage = :stageValue, {} = :nowValue'.format(stageAt),
+                ConditionExpression = 'pipelineStage IN ({})'.format(', '.join(fromValues)),
+                ExpressionAttributeValues = values
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == "ConditionalCheckFailedException":
+                print(e.response['Error']['Message'])
+                err  = {'Error' : 'Document is not in stage {}.'.format(' or '.join(fromStages))}
+            else:
+                raise
+
+        return err
+
     def getDocument(self, documentId):
 
         dynamodb = AwsHelper().getClient("dynamodb")
@@ -137,6 +259,10 @@ class DocumentStore:
                              'objectName' : ddbGetItemResponse['Item']['objectName']['S'],
                              'jobId' : ddbGetItemResponse['Item']['jobId']['S'],
                              'jobStatus' : ddbGetItemResponse['Item']['jobStatus']['S'] }
+            if('pageRouting' in ddbGetItemResponse['Item']):
+                itemToReturn['pageRouting'] = ddbGetItemResponse['Item']['pageRouting']['S']
+            if('textractParts' in ddbGetItemResponse['Item']):
+                itemToReturn['textractParts'] = ddbGetItemResponse['Item']['textractParts']['S']
 
         return itemToReturn
 
@@ -180,3 +306,100 @@ class DocumentStore:
             documents["nextToken"] = nextToken
 
         return documents
+
+class BulkJobStore:
+
+    def __init__(self, bulkTableName):
+        self._bulkTableName = bulkTableName
+
+    def createBulkJob(self, bulkId, bucketName, source, autoPipeline):
+
+        dynamodb = AwsHelper().getResource("dynamodb")
+        table = dynamodb.Table(self._bulkTableName)
+
+        # Documents are counted as they are queued, while the source is listed
+        table.update_item(
+            Key = { 'bulkId': bulkId },
+            UpdateExpression = 'SET bucketName = :bucketNameValue, #source = :sourceValue, documentsQueued = :queuedValue, ' +
+                               'autoPipeline = :pipelineValue, createdAt = :nowValue, listingStatus = :listingValue, ' +
+                               'pagesListed = :pagesValue, truncated = :truncatedValue',
+            ExpressionAttributeNames = { '#source': 'source' },
+            ExpressionAttributeValues = {
+                ':bucketNameValue': bucketName,
+                ':sourceValue': source,
+                ':queuedValue': 0,
+                ':pipelineValue': autoPipeline,
+                ':nowValue': Decimal(str(round(time.time(), 3))),
+                ':listingValue': "Listing",
+                ':pagesValue': 0,
+                ':truncatedValue': False
+            }
+        )
+
+    def countQueued(self, bulkId, queued, pagesListed):
+
+        dynamodb = AwsHelper().getResource("dynamodb")
+        table = dynamodb.Table(self._bulkTableName)
+
+        table.update_item(
+            Key = { 'bulkId': bulkId },
+            UpdateExpression = 'ADD documentsQueued :queuedValue, pagesListed :pagesValue',
+            ExpressionAttributeValues = {
+                ':queuedValue': queued,
+                ':pagesValue': pagesListed
+            }
+        )
+
+    def finishListing(self, bulkId, listingStatus, truncated=False, error=None):
+
+        dynamodb = AwsHelper().getResource("dynamodb")
+        table = dynamodb.Table(self._bulkTableName)
+
+        updateExpression = 'SET listingStatus = :listingValue, truncated = :truncatedValue, listedAt = :nowValue'
+        values = {
+            ':listingValue': listingStatus,
+            ':truncatedValue': truncated,
+            ':nowValue': Decimal(str(round(time.time(), 3)))
+        }
+        if error:
+            updateExpression = updateExpression + ', listingError = :errorValue'
+            values[':errorValue'] = error
+
+        table.update_item(
+            Key = { 'bulkId': bulkId },
+            UpdateExpression = updateExpression,
+            ExpressionAttributeValues = values
+        )
+
+    def countBulkJob(self, bulkId, started=0, skipped=0, throttled=0, failed=0, handedOff=0):
+
+        dynamodb = AwsHelper().getResource("dynamodb")
+        table = dynamodb.Table(self._bulkTableName)
+
+        # ADD keeps concurrent ingestors from overwriting each other's counts
+        updateExpression = 'ADD documentsStarted :startedValue, documentsSkipped :skippedValue, ' + \
+                           'textractThrottles :throttledValue, documentsFailed :failedValue, ' + \
+                           'documentsHandedOff :handedOffValue'
+        values = {
+            ':startedValue': started,
+            ':skippedValue': skipped,
+            ':throttledValue': throttled,
+            ':failedValue': failed,
+            ':handedOffValue': handedOff
+        }
+        if started:
+            updateExpression = updateExpression + ' SET lastStartedAt = :nowValue'
+            values[':nowValue'] = Decimal(str(round(time.time(), 3)))
+
+        table.update_item(
+            Key = { 'bulkId': bulkId },
+            UpdateExpression = updateExpression,
+            ExpressionAttributeValues = values
+        )
+
+    def getBulkJob(self, bulkId):
+
+        dynamodb = AwsHelper().getResource("dynamodb")
+        table = dynamodb.Table(self._bulkTableName)
+
+        return table.get_item(Key = { 'bulkId': bulkId }).get('Item')
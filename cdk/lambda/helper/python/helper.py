@@ -3,9 +3,13 @@
 
 import boto3
 from botocore.client import Config
+from botocore.exceptions import ClientError
 import os
 import csv
-import io
+import json
+import random
+import time
+from decimal import Decimal
 from boto3.dynamodb.conditions import Key
 
 class DynamoDBHelper:
@@ -76,6 +80,182 @@ class AwsHelper:
         else:
             return boto3.resource(name, config=config)
 
+class ThrottledError(Exception):
+    pass
+
+class TokenBucket:
+    # A rate limit shared by every Lambda, kept as one item in a DynamoDB table.
+    # Tokens are refilled from the time since the last update, and a token is
+    # taken with a conditional write, so concurrent callers never overspend.
+
+    def __init__(self, tableName, bucketId, rate, capacity=None):
+        self._tableName = tableName
+        self._bucketId = bucketId
+        self._rate = rate
+        self._capacity = capacity or rate
+
+    @staticmethod
+    def forApi(api):
+        # Configured with TOKEN_BUCKET_TABLE and, e.g. for StartDocumentTextDetection, TPS_STARTDOCUMENTTEXTDETECTION
+        tableName = os.environ.get('TOKEN_BUCKET_TABLE')
+        if(not tableName):
+            return None
+        return TokenBucket(tableName, api, float(os.environ.get('TPS_{}'.format(api.upper()), 1)))
+
+    def tryAcquire(self):
+        # Returns 0 if a token was taken, otherwise roughly how long to wait for one
+        table = AwsHelper().getResource("dynamodb").Table(self._tableName)
+        now = time.time()
+        item = table.get_item(Key={'bucketId': self._bucketId}, ConsistentRead=True).get('Item')
+        if(item):
+            tokens = min(self._capacity, float(item['tokens']) + (now - float(item['updatedAt'])) * self._rate)
+        else:
+            tokens = self._capacity
+        if(tokens < 1):
+            return (1 - tokens) / self._rate
+
+        values = {
+            ':tokensValue': Decimal(str(round(tokens - 1, 6))),
+            ':nowValue': Decimal(str(round(now, 6)))
+        }
+        if(item):
+            condition = 'updatedAt = :oldValue'
+            values[':oldValue'] = item['updatedAt']
+        else:
+            condition = 'attribute_not_exists(bucketId)'
+        try:
+            table.update_item(
+                Key = { 'bucketId': self._bucketId },
+                UpdateExpression = 'SET tokens = :tokensValue, updatedAt = :nowValue',
+                ConditionExpression = condition,
+                ExpressionAttributeValues = values
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == "ConditionalCheckFailedException":
+                # Another caller got there first; try again shortly
+                return random.uniform(0.01, 0.05)
+            raise
+        return 0
+
+    def acquire(self, timeout=30):
+        start = time.time()
+        while True:
+            wait = self.tryAcquire()
+            if(wait == 0):
+                return time.time() - start
+            if(time.time() - start + wait > timeout):
+                raise ThrottledError("No {} token within {}s".format(self._bucketId, timeout))
+            time.sleep(wait)
+
+class TextractHelper:
+    @staticmethod
+    def isThrottle(error):
+        return (isinstance(error, ThrottledError) or
+                (isinstance(error, ClientError) and error.response['Error']['Code'] in
+                 ['LimitExceededException', 'ProvisionedThroughputExceededException', 'ThrottlingException']))
+
+    @staticmethod
+    def acquire(api):
+        tokens = TokenBucket.forApi(api)
+        if(tokens):
+            waited = tokens.acquire(float(os.environ.get('TOKEN_WAIT_SECONDS', 30)))
+            if(waited > 1):
+                print("Waited {:.1f}s for a {} token".format(waited, api))
+
+    @staticmethod
+    def detectText(documentBytes):
+        TextractHelper.acquire('DetectDocumentText')
+        return AwsHelper().getClient('textract').detect_document_text(Document={'Bytes': documentBytes})
+
+    @staticmethod
+    def startTextDetection(documentId, bucketName, objectName, snsRole, snsTopic, requestToken=None, tokenHeld=False):
+
+        print("Starting job with documentId: {}, bucketName: {}, objectName: {}".format(documentId, bucketName, objectName))
+
+        # tokenHeld is set when the caller already took this call's token
+        if(not tokenHeld):
+            TextractHelper.acquire('StartDocumentTextDetection')
+        client = AwsHelper().getClient('textract')
+        response = client.start_document_text_detection(
+            ClientRequestToken  = requestToken or documentId,
+            DocumentLocation={
+                'S3Object': {
+                    'Bucket': bucketName,
+                    'Name': objectName
+                    }
+            },
+            NotificationChannel= {
+                "RoleArn": snsRole,
+                "SNSTopicArn": snsTopic
+            },
+            JobTag = documentId
+        )
+
+        return response["JobId"]
+
+class S3StreamWriter:
+    # A file-like object that uploads to S3 as it is written. Text and bytes are
+    # buffered up to partSize and sent as parts of a multipart upload, so memory
+    # stays at one part however large the object gets. An object smaller than
+    # one part is sent with a single put. Use it as a context manager; an error
+    # inside the block aborts the upload.
+
+    minPartSize = 5 * 1024 * 1024
+
+    def __init__(self, bucketName, s3FileName, partSize=8 * 1024 * 1024, client=None, awsRegion=None):
+        self._bucketName = bucketName
+        self._s3FileName = s3FileName
+        self._partSize = max(partSize, S3StreamWriter.minPartSize)
+        self._client = client or AwsHelper().getClient('s3', awsRegion)
+        self._buffer = bytearray()
+        self._uploadId = None
+        self._parts = []
+        self.bytesWritten = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if(excType):
+            self.abort()
+        else:
+            self.close()
+
+    def write(self, data):
+        if(isinstance(data, str)):
+            data = data.encode('utf-8')
+        self._buffer.extend(data)
+        self.bytesWritten = self.bytesWritten + len(data)
+        while(len(self._buffer) >= self._partSize):
+            with memoryview(self._buffer) as view:
+                part = bytes(view[:self._partSize])
+            del self._buffer[:self._partSize]
+            self._uploadPart(part)
+        return len(data)
+
+    def _uploadPart(self, body):
+        if(self._uploadId is None):
+            self._uploadId = self._client.create_multipart_upload(Bucket=self._bucketName, Key=self._s3FileName)['UploadId']
+        partNumber = len(self._parts) + 1
+        response = self._client.upload_part(Bucket=self._bucketName, Key=self._s3FileName, UploadId=self._uploadId,
+                                            PartNumber=partNumber, Body=body)
+        self._parts.append({'ETag': response['ETag'], 'PartNumber': partNumber})
+
+    def close(self):
+        if(self._uploadId is None):
+            self._client.put_object(Bucket=self._bucketName, Key=self._s3FileName, Body=bytes(self._buffer))
+        else:
+            if(self._buffer):
+                self._uploadPart(bytes(self._buffer))
+            self._client.complete_multipart_upload(Bucket=self._bucketName, Key=self._s3FileName, UploadId=self._uploadId,
+                                                   MultipartUpload={'Parts': self._parts})
+        self._buffer = bytearray()
+
+    def abort(self):
+        if(self._uploadId is not None):
+            self._client.abort_multipart_upload(Bucket=self._bucketName, Key=self._s3FileName, UploadId=self._uploadId)
+        self._buffer = bytearray()
+
 class S3Helper:
     @staticmethod
     def getS3BucketRegion(bucketName):
@@ -110,8 +290,9 @@ class S3Helper:
                 continuationToken = listObjectsResponse['NextContinuationToken']
             else:
                 hasMoreContent = False
+            currentPage = currentPage + 1
 
-            for doc in listObjectsResponse['Contents']:
+            for doc in listObjectsResponse.get('Contents', []):
                 docName = doc['Key']
                 docExt = FileHelper.getFileExtenstion(docName)
                 docExtLower = docExt.lower()
@@ -132,32 +313,74 @@ class S3Helper:
         obj = s3.Object(bucketName, s3FileName)
         return obj.get()['Body'].read().decode('utf-8')
 
+    @staticmethod
+    def readRangeFromS3(bucketName, s3FileName, offset, length, awsRegion=None):
+        s3 = AwsHelper().getResource('s3', awsRegion)
+        obj = s3.Object(bucketName, s3FileName)
+        return obj.get(Range='bytes={}-{}'.format(offset, offset + length - 1))['Body'].read()
+
+    @staticmethod
+    def openWriter(bucketName, s3FileName, awsRegion=None):
+        partSize = int(float(os.environ.get('S3_PART_MB', 8)) * 1024 * 1024)
+        return S3StreamWriter(bucketName, s3FileName, partSize, awsRegion=awsRegion)
+
+    @staticmethod
+    def writeJSON(content, bucketName, s3FileName, awsRegion=None):
+        # A list is encoded an item at a time, rather than building the whole string first
+        with S3Helper.openWriter(bucketName, s3FileName, awsRegion) as s3File:
+            if(isinstance(content, list)):
+                s3File.write("[")
+                for i, item in enumerate(content):
+                    s3File.write((", " if i else "") + json.dumps(item))
+                s3File.write("]")
+            else:
+                s3File.write(json.dumps(content))
+        return s3File.bytesWritten
+
     @staticmethod
     def writeCSV(fieldNames, csvData, bucketName, s3FileName, awsRegion=None):
-        csv_file = io.StringIO()
-        #with open(fileName, 'w') as csv_file:
-        writer = csv.DictWriter(csv_file, fieldnames=fieldNames)
-        writer.writeheader()
+        # csvData can be any iterable of rows, so rows can be generated as they are written
+        with S3Helper.openWriter(bucketName, s3FileName, awsRegion) as s3File:
+            writer = csv.DictWriter(s3File, fieldnames=fieldNames)
+            writer.writeheader()
 
-        for item in csvData:
-            i = 0
-            row = {}
-            for value in item:
-                row[fieldNames[i]] = value
-                i = i + 1
-            writer.writerow(row)
-        S3Helper.writeToS3(csv_file.getvalue(), bucketName, s3FileName)
+            for item in csvData:
+                i = 0
+                row = {}
+                for value in item:
+                    row[fieldNames[i]] = value
+                    i = i + 1
+                writer.writerow(row)
+        return s3File.bytesWritten
 
     @staticmethod
     def writeCSVRaw(csvData, bucketName, s3FileName):
-        csv_file = io.StringIO()
-        #with open(fileName, 'w') as csv_file:
-        writer = csv.writer(csv_file)
-        for item in csvData:
-            writer.writerow(item)
-        S3Helper.writeToS3(csv_file.getvalue(), bucketName, s3FileName)
+        with S3Helper.openWriter(bucketName, s3FileName) as s3File:
+            writer = csv.writer(s3File)
+            for item in csvData:
+                writer.writerow(item)
+        return s3File.bytesWritten
 
 
+class MetricsHelper:
+    @staticmethod
+    def emit(values, dimensions=None):
+        # CloudWatch embedded metric format; Lambda's log stream turns these into metrics
+        dimensions = dimensions or {}
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': os.environ.get('METRICS_NAMESPACE', 'FsiQaSummarization'),
+                    'Dimensions': [list(dimensions.keys())],
+                    'Metrics': [{'Name': k} for k in values.keys()]
+                }]
+            }
+        }
+        record.update(dimensions)
+        record.update(values)
+        print(json.dumps(record))
+
 class FileHelper:
     @staticmethod
     def getFileNameAndExtension(filePath):
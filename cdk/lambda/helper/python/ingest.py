@@ -0,0 +1,60 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import os
+from helper import AwsHelper, FileHelper, TextractHelper
+import datastore
+
+def startDocument(docId, bucket, name, autoPipeline, bulkId=None):
+    """Starts text extraction of s3://bucket/name, the way the async processor does.
+
+    A document that already started is skipped, so a redelivered bulk
+    message or a second bulk run over the same prefix starts nothing.
+    Throttling by the Textract token bucket is raised to the caller, before
+    the document is recorded. Documents handed to the ingest processor are
+    returned with handedOff set; it counts them for bulkId once extraction
+    really starts.
+    """
+
+    # Documents up to this size skip async Textract, SQS and Fargate; 0 turns the fast path off
+    smallDocMaxBytes = int(os.environ.get('SMALL_DOC_MAX_BYTES', 0))
+
+    ds = datastore.DocumentStore(os.environ['DOCUMENTS_TABLE'], os.environ['OUTPUT_TABLE'])
+    document = ds.getDocument(docId)
+    if(document and document['jobStatus'] != "FAILED"):
+        print(f"Document {docId} already {document['jobStatus']}, skipping")
+        return {'jobId': document['jobId'], 'autoPipeline': autoPipeline, 'skipped': True}
+    if(document):
+        # A failed document is started again from scratch
+        ds.deleteDocument(docId)
+
+    head = AwsHelper().getClient('s3').head_object(Bucket=bucket, Key=name)
+    uploadedAt = head['LastModified'].timestamp()
+    small = head['ContentLength'] <= smallDocMaxBytes
+    # PDFs also go to the ingest processor, which reads their text layer and splits large ones
+    if small or FileHelper.getFileExtenstion(name).lower() == 'pdf':
+        # Taken here so a bulk run cannot hand off more PDFs than Textract can start.
+        # The ingest processor uses it for its first job.
+        if not small:
+            TextractHelper.acquire('StartDocumentTextDetection')
+        if small:
+            # The fast path always summarizes and embeds, so it is tracked like pipeline mode
+            ds.createDocument(docId, bucket, name, "Started", docId, uploadedAt, "Extracting", "fast")
+        else:
+            ds.createDocument(docId, bucket, name, "Started", docId, uploadedAt,
+                              "Extracting" if autoPipeline else None, "async")
+        AwsHelper().getClient('lambda').invoke(
+            FunctionName = os.environ['INGEST_FUNCTION'],
+            InvocationType = 'Event',
+            Payload = json.dumps({'docId': docId, 'bucket': bucket, 'name': name, 'small': small,
+                                  'startTokenHeld': not small, 'bulkId': bulkId})
+        )
+        print(f"Sent {name} ({head['ContentLength']} bytes) to the ingest processor")
+        return {'jobId': docId, 'autoPipeline': small or autoPipeline, 'skipped': False, 'handedOff': True}
+
+    jobId = TextractHelper.startTextDetection(docId, bucket, name, os.environ['SNS_ROLE_ARN'], os.environ['SNS_TOPIC_ARN'])
+    print(f"Started textract job {jobId}")
+    ds.createDocument(docId, bucket, name, "Started", jobId, uploadedAt,
+                      "Extracting" if autoPipeline else None, "async")
+    return {'jobId': jobId, 'autoPipeline': autoPipeline, 'skipped': False, 'handedOff': False}
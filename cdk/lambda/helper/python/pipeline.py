@@ -0,0 +1,51 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import os
+from helper import AwsHelper
+import datastore
+
+# Summarization settings used for documents in pipeline mode, matching the frontend defaults
+pipelineSummaryParams = {
+    'chunkSize': 10000,
+    'chunkOverlap': 1000,
+    'max_length': 10000,
+    'top_p': 0.9,
+    'top_k': 100,
+    'num_beams': 2,
+    'temperature': 0.5,
+}
+
+def startPipeline(documentId, bucketName, textObjectName):
+
+    ds = datastore.DocumentStore(os.environ['DOCUMENTS_TABLE'], "")
+    # Only the first delivery of the completion message moves the document on
+    if ds.advancePipelineStage(documentId, ["Extracting"], "Summarizing"):
+        print("Document {} is not waiting for extraction".format(documentId))
+        return
+
+    # Overlapped: the summarization task embeds as it reads. Otherwise it queues embedding when done.
+    overlap = os.environ.get('PIPELINE_OVERLAP', 'true').lower() == 'true'
+    jsonMessage = { 'documentId' : documentId,
+        'bucketName': bucketName,
+        'objectName' : textObjectName,
+        'jobId': documentId,
+        'pipeline': overlap,
+        **pipelineSummaryParams}
+
+    try:
+        datastore.DocumentStore("", "", os.environ['JOB_TABLE']).createSummaryJob(documentId, "Started", documentId)
+        if overlap:
+            datastore.DocumentStore("", "", embeddingTableName = os.environ['EMBED_TABLE']).createEmbeddingJob(documentId, "Started", documentId)
+
+        client = AwsHelper().getClient('sqs')
+        client.send_message(
+            QueueUrl=os.environ['SUMMARIZATION_QUEUE_URL'],
+            MessageBody=json.dumps(jsonMessage)
+        )
+    except Exception:
+        # Put the stage back so the redelivered message tries again
+        ds.advancePipelineStage(documentId, ["Summarizing"], "Extracting")
+        raise
+    print("Queued summarization of {}".format(textObjectName))
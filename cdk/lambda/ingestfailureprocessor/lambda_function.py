@@ -0,0 +1,29 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import datastore
+
+# Inputs: on-failure destination records for ingest processor invocations that
+# used up their retries. The original event is under requestPayload.
+def lambda_handler(event, context):
+
+    print("event: {}".format(event))
+
+    payload = event['requestPayload']
+    docId = payload['docId']
+    error = event.get('responsePayload') or {}
+    print("Ingest of {} failed: {}".format(payload['name'], error.get('errorMessage', event['requestContext']['condition'])))
+
+    # A FAILED document is started again by the next upload or bulk run that names it
+    ds = datastore.DocumentStore(os.environ['DOCUMENTS_TABLE'], os.environ['OUTPUT_TABLE'])
+    ds.updateDocumentStatus(docId, "FAILED")
+    ds.advancePipelineStage(docId, ["Extracting"], "Failed")
+
+    if(payload.get('bulkId')):
+        datastore.BulkJobStore(os.environ['BULK_TABLE']).countBulkJob(payload['bulkId'], failed=1)
+
+    return {
+        'statusCode': 200,
+        'body': "Marked {} as failed".format(docId)
+    }
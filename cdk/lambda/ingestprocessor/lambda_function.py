@@ -0,0 +1,242 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import json
+import os
+import io
+import time
+import uuid
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pypdf import PdfReader, PdfWriter
+from helper import AwsHelper, FileHelper, S3Helper, TextractHelper
+from og import OutputGenerator
+import datastore
+from pipeline import startPipeline
+
+imageTypes = ['png', 'jpg', 'jpeg', 'tif', 'tiff']
+
+def hasTextLayer(text, minChars):
+
+    # Scanned pages have no text layer, or only a few characters of noise
+    chars = [c for c in text if not c.isspace()]
+    if(len(chars) < minChars):
+        return False
+    readable = sum(1 for c in chars if c.isprintable() and c != '\ufffd')
+    return readable >= 0.95 * len(chars)
+
+def routePages(reader, minChars):
+
+    nativePages = {}
+    decisions = []
+    p = 1
+    for page in reader.pages:
+        try:
+            text = page.extract_text() or ""
+        except Exception as e:
+            print("Could not read the text layer of page {}: {}".format(p, str(e)))
+            text = ""
+        native = hasTextLayer(text, minChars)
+        if(native):
+            nativePages[p] = text
+        decisions.append({'page': p, 'route': "native" if native else "textract", 'chars': len(text)})
+        p = p + 1
+
+    return nativePages, decisions
+
+def pagesPdf(reader, pageNumbers):
+
+    writer = PdfWriter()
+    for p in pageNumbers:
+        writer.add_page(reader.pages[p - 1])
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+def detectPages(pages, maxParallel):
+
+    with ThreadPoolExecutor(max_workers=maxParallel) as executor:
+        responses = list(executor.map(TextractHelper.detectText, pages))
+
+    # Every response numbers its only page 1
+    p = 1
+    for response in responses:
+        for block in response['Blocks']:
+            block['Page'] = p
+        p = p + 1
+
+    return responses
+
+def recordRouting(ds, docId, bucketName, outputPath, nativePages, decisions, nativeSeconds):
+
+    # The text of native pages is kept for merging with Textract's pages later
+    routingPath = "{}page-routing.json".format(outputPath)
+    S3Helper.writeToS3(json.dumps({'native': nativePages, 'decisions': decisions}), bucketName, routingPath)
+
+    # Estimated from what Textract would have taken for the native pages
+    secondsPerPage = float(os.environ.get('TEXTRACT_SECONDS_PER_PAGE', 1.0))
+    secondsSaved = len(nativePages) * secondsPerPage - nativeSeconds
+    ds.updateDocumentRouting(docId, routingPath, len(nativePages), len(decisions) - len(nativePages),
+                             nativeSeconds, secondsSaved)
+    print("Pages from text layer: {}, for Textract: {}, read in {:.2f}s, about {:.0f}s saved".format(
+        len(nativePages), len(decisions) - len(nativePages), nativeSeconds, secondsSaved))
+
+def startTextractParts(ds, docId, bucketName, reader, scannedPages, outputPath, splitPages, maxParts, tokenHeld):
+
+    partSize = max(splitPages, -(-len(scannedPages) // maxParts))
+    parts = []
+    for start in range(0, len(scannedPages), partSize):
+        parts.append({'name': "{}part-{}.pdf".format(outputPath, len(parts)),
+                      'pages': scannedPages[start:start + partSize]})
+
+    # Recorded before any job starts, so every completion can find its part
+    partsPath = "{}textract-parts.json".format(outputPath)
+    S3Helper.writeToS3(json.dumps({'parts': parts}), bucketName, partsPath)
+    ds.updateDocumentParts(docId, partsPath, len(parts))
+
+    jobIds = []
+    i = 0
+    for part in parts:
+        S3Helper.writeToS3(pagesPdf(reader, part['pages']), bucketName, part['name'])
+        jobIds.append(TextractHelper.startTextDetection(docId, bucketName, part['name'], os.environ['SNS_ROLE_ARN'],
+                                                        os.environ['SNS_TOPIC_ARN'], "{}-{}".format(docId, i),
+                                                        tokenHeld and i == 0))
+        i = i + 1
+    print("Started {} textract jobs of up to {} pages".format(len(jobIds), partSize))
+
+    return jobIds
+
+def startSummaryAndEmbedding(documentId, bucketName, textObjectName):
+
+    datastore.DocumentStore("", "", os.environ['JOB_TABLE']).createSummaryJob(documentId, "Started", documentId)
+    datastore.DocumentStore("", "", embeddingTableName = os.environ['EMBED_TABLE']).createEmbeddingJob(documentId, "Started", documentId)
+
+    AwsHelper().getClient('lambda').invoke(
+        FunctionName = os.environ['WORKER_FUNCTION'],
+        InvocationType = 'Event',
+        Payload = json.dumps({'docId': documentId, 'bucket': bucketName, 'name': textObjectName})
+    )
+    print("Started summarization and embedding of {}".format(textObjectName))
+
+def countStarted(bulkId):
+
+    # Bulk runs count a handed off document once its extraction has really started
+    if(bulkId):
+        datastore.BulkJobStore(os.environ['BULK_TABLE']).countBulkJob(bulkId, started=1)
+
+# Inputs: document id and s3 location, from the async processor. Small documents
+# are extracted synchronously; PDFs are read from their text layer where they have one.
+def lambda_handler(event, context):
+
+    print("event: {}".format(event))
+
+    docId = event['docId']
+    bucket = event['bucket']
+    name = event['name']
+    small = event.get('small', True)
+    # Set when the caller already took the token for the first StartDocumentTextDetection call
+    startTokenHeld = event.get('startTokenHeld', False)
+    bulkId = event.get('bulkId')
+    outputTable = os.environ['OUTPUT_TABLE']
+    documentsTable = os.environ['DOCUMENTS_TABLE']
+    maxPages = int(os.environ.get('SMALL_DOC_MAX_PAGES', 5))
+    maxParallel = int(os.environ.get('SYNC_PARALLEL', 4))
+    nativeText = os.environ.get('NATIVE_TEXT', 'true').lower() == 'true'
+    minChars = int(os.environ.get('NATIVE_MIN_CHARS', 50))
+    # PDFs with more scanned pages than this are split into parts read by concurrent Textract jobs; 0 turns splitting off
+    splitPages = int(os.environ.get('TEXTRACT_SPLIT_PAGES', 0))
+    maxParts = int(os.environ.get('TEXTRACT_MAX_PARTS', 20))
+
+    ds = datastore.DocumentStore(documentsTable, outputTable)
+    outputPath = "{}-analysis/{}/".format(name, docId)
+    ext = FileHelper.getFileExtenstion(name).lower()
+
+    localPath = "/tmp/{}".format(uuid.uuid4().hex)
+    AwsHelper().getClient('s3').download_file(bucket, name, localPath)
+
+    nativePages = {}
+    reader = None
+    if(ext == 'pdf'):
+        start = time.time()
+        reader = PdfReader(localPath)
+        if(nativeText):
+            nativePages, decisions = routePages(reader, minChars)
+            recordRouting(ds, docId, bucket, outputPath, nativePages, decisions, time.time() - start)
+        scannedPages = [p for p in range(1, len(reader.pages) + 1) if p not in nativePages]
+    elif(ext in imageTypes and small):
+        scannedPages = [1]
+    else:
+        scannedPages = None
+
+    responses = None
+    pageCount = len(reader.pages) if reader else 1
+    # A few scanned pages are detected synchronously, but only a document that is
+    # small overall is summarized and embedded by the small document worker
+    syncDetect = small and scannedPages is not None and len(scannedPages) <= maxPages
+    fast = syncDetect and pageCount <= maxPages
+    if(syncDetect or scannedPages == []):
+        try:
+            if(not scannedPages):
+                responses = []
+            elif(reader):
+                responses = detectPages([pagesPdf(reader, [p]) for p in scannedPages], maxParallel)
+            else:
+                with open(localPath, 'rb') as document:
+                    responses = detectPages([document.read()], maxParallel)
+        except Exception as e:
+            trc = traceback.format_exc()
+            print(f"Synchronous text detection failed: {str(e)} - {trc}")
+            responses = None
+    os.remove(localPath)
+
+    if(responses is None and reader and splitPages and len(scannedPages) > splitPages):
+        jobIds = startTextractParts(ds, docId, bucket, reader, scannedPages, outputPath, splitPages, maxParts,
+                                    startTokenHeld)
+        ds.updateDocumentIngest(docId, "async", ",".join(jobIds))
+        countStarted(bulkId)
+        return {
+            'statusCode': 200,
+            'body': "Started {} textract jobs for {}".format(len(jobIds), name)
+        }
+
+    if(responses is None):
+        # Too many scanned pages, or a document synchronous text detection does not take.
+        # Textract only reads the pages without a text layer.
+        textractName = name
+        if(nativePages):
+            textractName = "{}scanned-pages.pdf".format(outputPath)
+            S3Helper.writeToS3(pagesPdf(reader, scannedPages), bucket, textractName)
+        jobId = TextractHelper.startTextDetection(docId, bucket, textractName, os.environ['SNS_ROLE_ARN'],
+                                                  os.environ['SNS_TOPIC_ARN'], tokenHeld=startTokenHeld)
+        print(f"Started textract job {jobId} for {textractName}")
+        ds.updateDocumentIngest(docId, "async", jobId)
+        countStarted(bulkId)
+        return {
+            'statusCode': 200,
+            'body': "Started textract job {} for {}".format(jobId, textractName)
+        }
+
+    ddb = AwsHelper().getResource('dynamodb').Table(outputTable)
+    opg = OutputGenerator(docId, responses, bucket, name, False, False, ddb, nativePages,
+                          bundle=os.environ.get('OUTPUT_BUNDLE', 'false').lower() == 'true')
+    opg.run()
+
+    ds.updateDocumentStatus(docId, "SUCCEEDED")
+    countStarted(bulkId)
+    textObjectName = "{}response.txt".format(opg.outputPath)
+    if(fast):
+        # A retried invocation finds the document already moved on
+        if(not ds.advancePipelineStage(docId, ["Extracting"], "Summarizing")):
+            startSummaryAndEmbedding(docId, bucket, textObjectName)
+    else:
+        ds.updateDocumentIngest(docId, "native", docId)
+        startPipeline(docId, bucket, textObjectName)
+
+    output = "Processed -> Document: {}, Object: {}/{} processed without async Textract.".format(docId, bucket, name)
+
+    print(output)
+
+    return {
+        'statusCode': 200,
+        'body': output
+    }
@@ -5,27 +5,88 @@ import json
 import os
 import boto3
 import time
-from helper import AwsHelper
+from botocore.exceptions import ClientError
+from helper import AwsHelper, S3Helper
 from og import OutputGenerator
 import datastore
+from pipeline import startPipeline
 
-def getJobResults(api, jobId):
+class JobCheckpoint:
+    # Progress of one Textract job's result processing, kept in S3 so a redelivered
+    # message continues where the last attempt stopped. Raw result pages are saved
+    # as they are fetched, with the NextToken for the page after them.
 
-    pages = []
+    def __init__(self, bucketName, jobId):
+        self._bucketName = bucketName
+        self._path = "textract-results/{}/".format(jobId)
+        self._lastSaved = 0
+        self.state = {'resultPages': 0, 'nextToken': None, 'fetched': False, 'rendered': [], 'finished': False}
+        try:
+            self.state.update(json.loads(S3Helper.readFromS3(bucketName, "{}checkpoint.json".format(self._path))))
+            print("Resuming from checkpoint: {} result pages, {} pages rendered, finished: {}".format(
+                self.state['resultPages'], len(self.state['rendered']), self.state['finished']))
+        except ClientError as e:
+            if e.response['Error']['Code'] != "NoSuchKey":
+                raise
 
-    time.sleep(5)
+    def save(self):
+        S3Helper.writeToS3(json.dumps(self.state), self._bucketName, "{}checkpoint.json".format(self._path))
+        self._lastSaved = time.time()
+
+    def resultPages(self):
+        pages = []
+        for i in range(self.state['resultPages']):
+            pages.append(json.loads(S3Helper.readFromS3(self._bucketName, "{}result-{}.json".format(self._path, i))))
+        return pages
+
+    def addResultPage(self, response):
+        S3Helper.writeToS3(json.dumps(response), self._bucketName, "{}result-{}.json".format(self._path, self.state['resultPages']))
+        self.state['resultPages'] = self.state['resultPages'] + 1
+        self.state['nextToken'] = response.get('NextToken')
+        self.state['fetched'] = self.state['nextToken'] is None
+        self.save()
+
+    def renderedPages(self):
+        return set(self.state['rendered'])
+
+    def pageRendered(self, p):
+        # Saved every few seconds; a page rendered again after a crash is only overwritten
+        self.state['rendered'].append(p)
+        if(time.time() - self._lastSaved > 5):
+            self.save()
+
+    def finish(self):
+        # Only the small checkpoint is kept, so a redelivery still finds the job finished;
+        # the bucket's lifecycle rule expires it later
+        self.state['finished'] = True
+        self.save()
+        client = AwsHelper().getClient('s3')
+        for i in range(0, self.state['resultPages'], 1000):
+            keys = ["{}result-{}.json".format(self._path, n) for n in range(i, min(i + 1000, self.state['resultPages']))]
+            client.delete_objects(Bucket=self._bucketName, Delete={'Objects': [{'Key': k} for k in keys], 'Quiet': True})
+
+def getJobResults(api, jobId, checkpoint):
+
+    pages = checkpoint.resultPages()
+    if(checkpoint.state['fetched']):
+        print("Result pages from checkpoint: {}".format(len(pages)))
+        return pages
 
     client = AwsHelper().getClient('textract')
-    if(api == "StartDocumentTextDetection"):
-        response = client.get_document_text_detection(JobId=jobId)
-    else:
-        response = client.get_document_analysis(JobId=jobId)
-    pages.append(response)
-    print("Resultset page recieved: {}".format(len(pages)))
-    nextToken = None
-    if('NextToken' in response):
-        nextToken = response['NextToken']
-        print("Next token: {}".format(nextToken))
+    nextToken = checkpoint.state['nextToken']
+    if(not pages):
+        time.sleep(5)
+        if(api == "StartDocumentTextDetection"):
+            response = client.get_document_text_detection(JobId=jobId)
+        else:
+            response = client.get_document_analysis(JobId=jobId)
+        pages.append(response)
+        checkpoint.addResultPage(response)
+        print("Resultset page recieved: {}".format(len(pages)))
+        nextToken = None
+        if('NextToken' in response):
+            nextToken = response['NextToken']
+            print("Next token: {}".format(nextToken))
 
     while(nextToken):
         time.sleep(2)
@@ -36,6 +97,7 @@ def getJobResults(api, jobId):
             response = client.get_document_analysis(JobId=jobId, NextToken=nextToken)
 
         pages.append(response)
+        checkpoint.addResultPage(response)
         print("Resultset page recieved: {}".format(len(pages)))
         nextToken = None
         if('NextToken' in response):
@@ -44,6 +106,70 @@ def getJobResults(api, jobId):
 
     return pages
 
+def readNativePages(bucketName, routingPath):
+
+    routing = json.loads(S3Helper.readFromS3(bucketName, routingPath))
+    return {int(p): text for p, text in routing['native'].items()}
+
+def processPart(ds, request, document, pages, ddb, detectForms, detectTables, nativePages, checkpoint, bundle):
+
+    jobTag = request['jobTag']
+    jobStatus = request['jobStatus']
+    bucketName = request['bucketName']
+    objectName = document['objectName']
+
+    parts = json.loads(S3Helper.readFromS3(bucketName, document['textractParts']))['parts']
+    part = [p['name'] for p in parts].index(request['objectName'])
+
+    if(jobStatus != "SUCCEEDED"):
+        ds.updateDocumentStatus(jobTag, jobStatus)
+        ds.advancePipelineStage(jobTag, ["Extracting"], "Failed")
+        return {
+            'statusCode': 200,
+            'body': "Part {} of document {} {}".format(part, jobTag, jobStatus)
+        }
+
+    # Each part is written out as its job completes, with its pages' numbers in the whole document
+    opg = OutputGenerator(jobTag, pages, bucketName, objectName, detectForms, detectTables, ddb,
+                          pageNumbers=parts[part]['pages'], part=part,
+                          renderedPages=checkpoint.renderedPages(), pageRendered=checkpoint.pageRendered, bundle=bundle,
+                          columnar=os.environ.get('COLUMNAR_OUTPUT') or None)
+    S3Helper.writeToS3(json.dumps(opg.runPages()), bucketName, "{}part-{}-text.json".format(opg.outputPath, part))
+    if(bundle):
+        S3Helper.writeToS3(json.dumps(opg.bundleIndex), bucketName, "{}part-{}-index.json".format(opg.outputPath, part))
+
+    completed = ds.completeDocumentPart(jobTag, part)
+    print("Part {} of document {} done, {} of {} parts complete".format(part, jobTag, completed, len(parts)))
+    if(completed < len(parts)):
+        return {
+            'statusCode': 200,
+            'body': "Processed part {} of document {}".format(part, jobTag)
+        }
+
+    # The last part to finish merges all of them in page order
+    merger = OutputGenerator(jobTag, [], bucketName, objectName, False, False, ddb, nativePages, bundle=bundle)
+    pageTexts = merger.runPages()
+    for i in range(len(parts)):
+        partTexts = json.loads(S3Helper.readFromS3(bucketName, "{}part-{}-text.json".format(merger.outputPath, i)))
+        pageTexts.update({int(p): text for p, text in partTexts.items()})
+        if(bundle):
+            partIndex = json.loads(S3Helper.readFromS3(bucketName, "{}part-{}-index.json".format(merger.outputPath, i)))
+            merger.bundleIndex.update({int(p): entry for p, entry in partIndex.items()})
+    merger.outputOrderedText(pageTexts)
+    if(bundle):
+        merger.outputBundleManifest(merger.bundleIndex)
+
+    ds.updateDocumentStatus(jobTag, jobStatus)
+    startPipeline(jobTag, bucketName, "{}response.txt".format(merger.outputPath))
+
+    output = "Merged {} parts of document {}".format(len(parts), jobTag)
+    print(output)
+
+    return {
+        'statusCode': 200,
+        'body': output
+    }
+
 def processRequest(request):
 
     output = ""
@@ -59,7 +185,17 @@ def processRequest(request):
     outputTable = request["outputTable"]
     documentsTable = request["documentsTable"]
 
-    pages = getJobResults(jobAPI, jobId)
+    # A redelivered message picks up from the last attempt's checkpoint
+    checkpoint = JobCheckpoint(bucketName, jobId)
+    if(checkpoint.state['finished']):
+        output = "Job {} of document {} already processed".format(jobId, jobTag)
+        print(output)
+        return {
+            'statusCode': 200,
+            'body': output
+        }
+
+    pages = getJobResults(jobAPI, jobId, checkpoint)
 
     print("Result pages recieved: {}".format(len(pages)))
 
@@ -75,14 +211,36 @@ def processRequest(request):
     dynamodb = AwsHelper().getResource('dynamodb')
     ddb = dynamodb.Table(outputTable)
 
-    opg = OutputGenerator(jobTag, pages, bucketName, objectName, detectForms, detectTables, ddb)
+    ds = datastore.DocumentStore(documentsTable, outputTable)
+    bundle = os.environ.get('OUTPUT_BUNDLE', 'false').lower() == 'true'
+
+    # Textract only read the pages without a text layer; the others come from the routing record
+    nativePages = None
+    document = ds.getDocument(jobTag)
+    if(document and 'pageRouting' in document):
+        nativePages = readNativePages(bucketName, document['pageRouting'])
+        objectName = document['objectName']
+
+    if(document and 'textractParts' in document):
+        result = processPart(ds, request, document, pages, ddb, detectForms, detectTables, nativePages, checkpoint, bundle)
+        checkpoint.finish()
+        return result
+
+    opg = OutputGenerator(jobTag, pages, bucketName, objectName, detectForms, detectTables, ddb, nativePages,
+                          renderedPages=checkpoint.renderedPages(), pageRendered=checkpoint.pageRendered, bundle=bundle,
+                          columnar=os.environ.get('COLUMNAR_OUTPUT') or None)
     opg.run()
 
     print("DocumentId: {}".format(jobTag))
 
-    ds = datastore.DocumentStore(documentsTable, outputTable)
     ds.updateDocumentStatus(jobTag, jobStatus)
 
+    if(jobStatus == "SUCCEEDED" and (opg.document.pages or nativePages)):
+        startPipeline(jobTag, bucketName, "{}response.txt".format(opg.outputPath))
+    else:
+        ds.advancePipelineStage(jobTag, ["Extracting"], "Failed")
+    checkpoint.finish()
+
     output = "Processed -> Document: {}, Object: {}/{} processed.".format(jobTag, bucketName, objectName)
 
     print(output)
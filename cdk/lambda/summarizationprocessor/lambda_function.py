@@ -49,6 +49,8 @@ def lambda_handler(event, context):
         top_k = payload['top_k']
         num_beams = payload['num_beams']
         temperature = payload['temperature']
+        # Pipelined documents are embedded by the summarization task as it reads them
+        pipeline = payload.get('pipeline', False)
 
         queueUrl = os.environ['QUEUE_URL']
         jobTable = os.environ['JOB_TABLE']
@@ -63,13 +65,18 @@ def lambda_handler(event, context):
             'top_p': top_p,
             'top_k': top_k,
             'num_beams': num_beams,
-            'temperature': temperature}
+            'temperature': temperature,
+            'pipeline': pipeline}
 
         try:
             client = AwsHelper().getClient('sqs')
             postMessage(client, queueUrl, jsonMessage)
             ds = datastore.DocumentStore("", "", jobTable)
             ds.createSummaryJob(docId, "Started", docId)
+            if pipeline:
+                ds = datastore.DocumentStore("", "", embeddingTableName = os.environ['EMBED_TABLE'])
+                ds.createEmbeddingJob(docId, "Started", docId)
+                return respond(None, {'msg': "Summarization and embedding started", 'job': docId, 'ejob': docId})
             
             return respond(None, {'msg': "Summarization started", 'job': docId})
         except Exception as e:
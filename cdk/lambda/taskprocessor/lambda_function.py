@@ -24,6 +24,7 @@ def lambda_handler(event, context):
     top_k = message['top_k']
     num_beams = message['num_beams']
     temperature = message['temperature']
+    pipeline = message.get('pipeline', False)
 
     clusterArn = os.environ['target']
     taskDefinitionArn = os.environ['taskDefinitionArn']
@@ -70,6 +71,10 @@ def lambda_handler(event, context):
                                 'name': 'chunk_overlap',
                                 'value': str(chunk_overlap)
                             },
+                            {
+                                'name': 'pipeline',
+                                'value': str(pipeline).lower()
+                            },
                         ],
                     }
                 ]
@@ -2,12 +2,17 @@
 # SPDX-License-Identifier: MIT-0
 
 import json
-from helper import FileHelper, S3Helper
+import gzip
+import os
+import time
+import uuid
+from helper import AwsHelper, FileHelper, S3Helper
 from trp import Document
 import boto3
 
 class OutputGenerator:
-    def __init__(self, documentId, response, bucketName, objectName, forms, tables, ddb):
+    def __init__(self, documentId, response, bucketName, objectName, forms, tables, ddb, nativePages = None, pageNumbers = None, part = None,
+                 renderedPages = None, pageRendered = None, bundle = False, columnar = None):
         self.documentId = documentId
         self.response = response
         self.bucketName = bucketName
@@ -15,6 +20,22 @@ class OutputGenerator:
         self.forms = forms
         self.tables = tables
         self.ddb = ddb
+        # Text of pages read from the PDF's own text layer, by page number.
+        # Textract's pages fill in the other page numbers in order.
+        self.nativePages = nativePages or {}
+        # Or the page numbers of Textract's pages, when it read one part of a split document
+        self.pageNumbers = pageNumbers
+        self.part = part
+        # Page numbers whose outputs an earlier attempt already wrote, 0 standing for response.json,
+        # and a callback told of each one this attempt writes
+        self.renderedPages = renderedPages or set()
+        self.pageRendered = pageRendered
+        # Writes one compressed bundle of every page instead of separate objects per page
+        self.bundle = bundle
+        self.bundleIndex = {}
+        # 'parquet' or 'arrow' also writes every table cell and form field of the document to one columnar file
+        self.columnar = columnar
+        self.stats = {'objects': 0, 'bytes': 0, 'items': 0, 'seconds': 0.0}
 
         self.outputPath = "{}-analysis/{}/".format(objectName, documentId)
 
@@ -28,20 +49,37 @@ class OutputGenerator:
         jsonItem['outputPath'] = output
 
         self.ddb.put_item(Item=jsonItem)
+        self.stats['items'] += 1
+
+    def _write(self, content, opath):
+        S3Helper.writeToS3(content, self.bucketName, opath)
+        self._counted(len(content.encode('utf-8') if isinstance(content, str) else content))
+
+    def _counted(self, size):
+        self.stats['objects'] += 1
+        self.stats['bytes'] += size
 
     def _outputText(self, page, p):
         text = page.text
         opath = "{}page-{}-text.txt".format(self.outputPath, p)
-        S3Helper.writeToS3(text, self.bucketName, opath)
+        self._write(text, opath)
         self.saveItem(self.documentId, "page-{}-Text".format(p), opath)
 
         textInReadingOrder = page.getTextInReadingOrder()
         opath = "{}page-{}-text-inreadingorder.txt".format(self.outputPath, p)
-        S3Helper.writeToS3(textInReadingOrder, self.bucketName, opath)
+        self._write(textInReadingOrder, opath)
         self.saveItem(self.documentId, "page-{}-TextInReadingOrder".format(p), opath)
 
-    def _outputForm(self, page, p):
-        csvData = []
+    def _outputNativeText(self, text, p):
+        opath = "{}page-{}-text.txt".format(self.outputPath, p)
+        self._write(text, opath)
+        self.saveItem(self.documentId, "page-{}-Text".format(p), opath)
+
+        opath = "{}page-{}-text-inreadingorder.txt".format(self.outputPath, p)
+        self._write(text, opath)
+        self.saveItem(self.documentId, "page-{}-TextInReadingOrder".format(p), opath)
+
+    def _formRows(self, page):
         for field in page.form.fields:
             csvItem  = []
             if(field.key):
@@ -52,71 +90,278 @@ class OutputGenerator:
                 csvItem.append(field.value.text)
             else:
                 csvItem.append("")
-            csvData.append(csvItem)
+            yield csvItem
+
+    def _outputForm(self, page, p):
         csvFieldNames = ['Key', 'Value']
         opath = "{}page-{}-forms.csv".format(self.outputPath, p)
-        S3Helper.writeCSV(csvFieldNames, csvData, self.bucketName, opath)
+        # Rows are generated as they are written
+        self._counted(S3Helper.writeCSV(csvFieldNames, self._formRows(page), self.bucketName, opath))
         self.saveItem(self.documentId, "page-{}-Forms".format(p), opath)
 
-    def _outputTable(self, page, p):
-
-        csvData = []
+    def _tableRows(self, page):
         for table in page.tables:
             csvRow = []
             csvRow.append("Table")
-            csvData.append(csvRow)
+            yield csvRow
             for row in table.rows:
                 csvRow  = []
                 for cell in row.cells:
                     csvRow.append(cell.text)
-                csvData.append(csvRow)
-            csvData.append([])
-            csvData.append([])
+                yield csvRow
+            yield []
+            yield []
+
+    def _outputTable(self, page, p):
 
         opath = "{}page-{}-tables.csv".format(self.outputPath, p)
-        S3Helper.writeCSVRaw(csvData, self.bucketName, opath)
+        self._counted(S3Helper.writeCSVRaw(self._tableRows(page), self.bucketName, opath))
         self.saveItem(self.documentId, "page-{}-Tables".format(p), opath)
 
     def run(self):
 
-        if(not self.document.pages):
+        if(not self.document.pages and not self.nativePages):
             return
 
-        opath = "{}response.json".format(self.outputPath)
-        S3Helper.writeToS3(json.dumps(self.response), self.bucketName, opath)
-        self.saveItem(self.documentId, 'Response', opath)
+        start = time.time()
+        self.outputOrderedText(self.runPages())
+        if(self.bundle):
+            self.outputBundleManifest(self.bundleIndex)
+        self.stats['seconds'] = time.time() - start
+        print("Wrote {} objects, {} bytes and {} items in {:.2f}s".format(
+            self.stats['objects'], self.stats['bytes'], self.stats['items'], self.stats['seconds']))
+
+    def runPages(self):
 
-        print("Total Pages in Document: {}".format(len(self.document.pages)))
+        if(self.columnar and (self.forms or self.tables) and self.document.pages):
+            self.outputColumnar(self._pageNumbers())
 
-        docText = ""
+        if(self.bundle):
+            return self._runBundle()
+
+        if(self.document.pages and 0 not in self.renderedPages):
+            if(self.part is None):
+                opath = "{}response.json".format(self.outputPath)
+                self.saveItem(self.documentId, 'Response', opath)
+            else:
+                opath = "{}response-part-{}.json".format(self.outputPath, self.part)
+                self.saveItem(self.documentId, 'Response-part-{}'.format(self.part), opath)
+            # Streamed, so the encoded response never has to fit in memory next to the parsed one
+            self._counted(S3Helper.writeJSON(self.response, self.bucketName, opath))
+            self._rendered(0)
 
-        p = 1
+        pageNumbers = self._pageNumbers()
+
+        for p, text in self.nativePages.items():
+            if(p not in self.renderedPages):
+                self._outputNativeText(text, p)
+                self._rendered(p)
+
+        i = 0
         for page in self.document.pages:
 
+            p = pageNumbers[i]
+            i = i + 1
+            if(p in self.renderedPages):
+                continue
+
             opath = "{}page-{}-response.json".format(self.outputPath, p)
-            S3Helper.writeToS3(json.dumps(page.blocks), self.bucketName, opath)
+            self._write(json.dumps(page.blocks), opath)
             self.saveItem(self.documentId, "page-{}-Response".format(p), opath)
 
             self._outputText(page, p)
 
-            docText = docText + page.text + "\n"
-
             if(self.forms):
                 self._outputForm(page, p)
 
             if(self.tables):
                 self._outputTable(page, p)
 
-            p = p + 1
+            self._rendered(p)
+
+        pageTexts = dict(self.nativePages)
+        for page in self.document.getPagesInReadingOrder():
+            pageTexts[pageNumbers[page._pageNumber - 1]] = page.getTextInReadingOrder()
+
+        return pageTexts
+
+    def _columnarBatches(self, pageNumbers, batchRows):
+
+        # Straight from the trp objects; forms leave the table columns empty and tables the key
+        columns = ['page', 'kind', 'tableId', 'tableIndex', 'row', 'column', 'rowSpan', 'columnSpan',
+                   'key', 'value', 'confidence', 'keyConfidence']
+        batch = {c: [] for c in columns}
+
+        def add(**values):
+            for c in columns:
+                batch[c].append(values.get(c))
+
+        i = 0
+        for page in self.document.pages:
+            p = pageNumbers[i]
+            i = i + 1
+            if(self.tables):
+                t = 0
+                for table in page.tables:
+                    for row in table.rows:
+                        for cell in row.cells:
+                            add(page=p, kind='table', tableId=table.id, tableIndex=t, row=cell.rowIndex, column=cell.columnIndex,
+                                rowSpan=cell.rowSpan, columnSpan=cell.columnSpan, value=cell.text.rstrip(', '),
+                                confidence=cell.confidence)
+                    t = t + 1
+            if(self.forms):
+                for field in page.form.fields:
+                    add(page=p, kind='form',
+                        key=field.key.text if field.key else None,
+                        value=field.value.text if field.value else None,
+                        confidence=field.value.confidence if field.value else None,
+                        keyConfidence=field.key.confidence if field.key else None)
+            if(len(batch['page']) >= batchRows):
+                yield batch
+                batch = {c: [] for c in columns}
+        if(batch['page']):
+            yield batch
+
+    def outputColumnar(self, pageNumbers):
+
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Columnar output needs the pyarrow package")
+
+        schema = pa.schema([
+            ('documentId', pa.string()),
+            ('page', pa.int32()),
+            ('kind', pa.string()),
+            ('tableId', pa.string()),
+            ('tableIndex', pa.int32()),
+            ('row', pa.int32()),
+            ('column', pa.int32()),
+            ('rowSpan', pa.int32()),
+            ('columnSpan', pa.int32()),
+            ('key', pa.string()),
+            ('value', pa.string()),
+            ('confidence', pa.float32()),
+            ('keyConfidence', pa.float32())
+        ])
+        ext = 'arrow' if self.columnar == 'arrow' else 'parquet'
+        if(self.part is None):
+            opath = "{}tables-forms.{}".format(self.outputPath, ext)
+        else:
+            opath = "{}tables-forms-part-{}.{}".format(self.outputPath, self.part, ext)
+
+        # Written a batch at a time to local storage, then uploaded
+        localPath = "/tmp/{}.{}".format(uuid.uuid4().hex, ext)
+        if(ext == 'arrow'):
+            writer = pa.ipc.new_file(localPath, schema)
+        else:
+            writer = pq.ParquetWriter(localPath, schema, compression='zstd')
+        rows = 0
+        try:
+            for batch in self._columnarBatches(pageNumbers, 50000):
+                batch['documentId'] = [self.documentId] * len(batch['page'])
+                writer.write_table(pa.Table.from_pydict(batch, schema=schema))
+                rows = rows + len(batch['page'])
+        finally:
+            writer.close()
+
+        AwsHelper().getClient('s3').upload_file(localPath, self.bucketName, opath)
+        self._counted(os.path.getsize(localPath))
+        os.remove(localPath)
+        if(self.part is None):
+            self.saveItem(self.documentId, 'Columnar', opath)
+        else:
+            self.saveItem(self.documentId, 'Columnar-part-{}'.format(self.part), opath)
+        print("Wrote {} table cells and form fields to {}".format(rows, opath))
+
+    def _pageNumbers(self):
+
+        totalPages = len(self.document.pages) + len(self.nativePages)
+        print("Total Pages in Document: {}, from text layer: {}".format(totalPages, len(self.nativePages)))
+
+        # Page numbers in the original document of the pages Textract read
+        pageNumbers = self.pageNumbers
+        if(pageNumbers is None):
+            pageNumbers = [n for n in range(1, totalPages + 1) if n not in self.nativePages]
+        return pageNumbers
+
+    def _runBundle(self):
+
+        # One JSON line per page, each compressed as its own gzip member. Together they are
+        # still one valid gzip file, and any page can be read alone with a ranged GET.
+        pageNumbers = self._pageNumbers()
+        records = {}
+        pageTexts = {}
+        for p, text in self.nativePages.items():
+            records[p] = {'page': p, 'native': True, 'text': text, 'textInReadingOrder': text}
+            pageTexts[p] = text
+
+        i = 0
+        for page in self.document.pages:
+            p = pageNumbers[i]
+            i = i + 1
+            record = {'page': p, 'blocks': page.blocks, 'text': page.text,
+                      'textInReadingOrder': page.getTextInReadingOrder()}
+            if(self.forms):
+                record['forms'] = [[field.key.text if field.key else "", field.value.text if field.value else ""]
+                                   for field in page.form.fields]
+            if(self.tables):
+                record['tables'] = [[[cell.text for cell in row.cells] for row in table.rows] for table in page.tables]
+            records[p] = record
+            pageTexts[p] = record['textInReadingOrder']
+
+        if(not records):
+            return pageTexts
+
+        if(self.part is None):
+            opath = "{}bundle.jsonl.gz".format(self.outputPath)
+        else:
+            opath = "{}bundle-part-{}.jsonl.gz".format(self.outputPath, self.part)
+        with S3Helper.openWriter(self.bucketName, opath) as bundle:
+            for p in sorted(records):
+                member = gzip.compress((json.dumps(records.pop(p)) + "\n").encode('utf-8'))
+                self.bundleIndex[p] = {'key': opath, 'offset': bundle.bytesWritten, 'length': len(member)}
+                bundle.write(member)
+        self._counted(bundle.bytesWritten)
+
+        return pageTexts
+
+    def outputBundleManifest(self, index):
+
+        # The only output table item for the document; readers find every page through the index
+        opath = "{}bundle-index.json".format(self.outputPath)
+        self._write(json.dumps({'pages': {str(p): index[p] for p in sorted(index)}}), opath)
+        self.ddb.put_item(Item={
+            'documentId': self.documentId,
+            'outputType': 'Bundle',
+            'outputPath': opath,
+            'textPath': "{}response.txt".format(self.outputPath),
+            'bundleKeys': sorted(set(entry['key'] for entry in index.values())),
+            'pages': len(index)
+        })
+        self.stats['items'] += 1
+
+    def _rendered(self, p):
+        if(self.pageRendered):
+            self.pageRendered(p)
+
+    def outputOrderedText(self, pageTexts):
 
-        orderedDocText = ""
         cnt = 0
         chunkSize = 5
-        for page in self.document.getPagesInReadingOrder():
-            orderedDocText = orderedDocText + page.getTextInReadingOrder() + "\n<PAGE>\n"
-            cnt = cnt + 1
-            if cnt % chunkSize == 0:
-                orderedDocText = orderedDocText + "\n<CHUNK>\n"
         opath = "{}response.txt".format(self.outputPath)
-        S3Helper.writeToS3(orderedDocText, self.bucketName, opath)
-        self.saveItem(self.documentId, 'ResponseOrderedText', opath)
+        with S3Helper.openWriter(self.bucketName, opath) as orderedDocText:
+            for p in sorted(pageTexts):
+                orderedDocText.write(pageTexts[p] + "\n<PAGE>\n")
+                cnt = cnt + 1
+                if cnt % chunkSize == 0:
+                    orderedDocText.write("\n<CHUNK>\n")
+        self._counted(orderedDocText.bytesWritten)
+        if(not self.bundle):
+            self.saveItem(self.documentId, 'ResponseOrderedText', opath)
+
+# Reads one page's record from a bundle, given its entry in bundle-index.json
+def readBundlePage(bucketName, entry):
+    member = S3Helper.readRangeFromS3(bucketName, entry['key'], entry['offset'], entry['length'])
+    return json.loads(gzip.decompress(member).decode('utf-8'))
@@ -2,7 +2,7 @@
 # SPDX-License-Identifier: MIT-0
 
 import json
-from collections import OrderedDict
+from bisect import bisect_right
 
 class BoundingBox:
     def __init__(self, width, height, left, top):
@@ -316,11 +316,34 @@ class Form:
     def __init__(self):
         self._fields = []
         self._fieldsMap = {}
+        # Built on the first lookup that needs them, and caught up with fields added
+        # since, so pages that are never searched do not pay for them:
+        # normalized key -> fields, key token -> field positions, and every
+        # lowercase key joined into one string for substring searches
+        self._normalizedMap = {}
+        self._tokenIndex = {}
+        self._lowerKeys = []
+        self._keyText = None
+        self._keyStarts = []
+
+    @staticmethod
+    def normalizeKey(key):
+        return ' '.join(key.lower().split()).rstrip(':').strip()
 
     def addField(self, field):
         self._fields.append(field)
         self._fieldsMap[field.key.text] = field
 
+    def _index(self):
+        for position in range(len(self._lowerKeys), len(self._fields)):
+            field = self._fields[position]
+            lowerKey = field.key.text.lower()
+            self._lowerKeys.append(lowerKey)
+            self._normalizedMap.setdefault(Form.normalizeKey(lowerKey), []).append(field)
+            for token in set(lowerKey.split()):
+                self._tokenIndex.setdefault(token, []).append(position)
+            self._keyText = None
+
     def __str__(self):
         s = ""
         for field in self._fields:
@@ -336,15 +359,50 @@ class Form:
         if(key in self._fieldsMap):
             field = self._fieldsMap[key]
         return field
-    
+
+    def getFieldByNormalizedKey(self, key):
+        # Ignores case, spacing and a trailing colon; the last field added wins, as in getFieldByKey
+        self._index()
+        field = None
+        fields = self._normalizedMap.get(Form.normalizeKey(key))
+        if(fields):
+            field = fields[-1]
+        return field
+
     def searchFieldsByKey(self, key):
+        self._index()
         searchKey = key.lower()
+        if(not searchKey or '\0' in searchKey):
+            return [self._fields[i] for i in range(len(self._fields)) if searchKey in self._lowerKeys[i]]
+        if(self._keyText is None):
+            # Keys are separated by a character they never contain, so a match lies in one key
+            self._keyText = '\0'.join(self._lowerKeys)
+            self._keyStarts = []
+            offset = 0
+            for lowerKey in self._lowerKeys:
+                self._keyStarts.append(offset)
+                offset = offset + len(lowerKey) + 1
         results = []
-        for field in self._fields:
-            if(field.key and searchKey in field.key.text.lower()):
-                results.append(field)
+        i = self._keyText.find(searchKey)
+        while(i >= 0):
+            position = bisect_right(self._keyStarts, i) - 1
+            results.append(self._fields[position])
+            if(position + 1 == len(self._keyStarts)):
+                break
+            i = self._keyText.find(searchKey, self._keyStarts[position + 1])
         return results
 
+    def searchFieldsByTokens(self, key):
+        # Fields whose keys have every word of key, in any order
+        self._index()
+        postings = sorted((self._tokenIndex.get(token, []) for token in set(key.lower().split())), key=len)
+        if(not postings):
+            return []
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+        return [self._fields[i] for i in sorted(candidates)]
+
 class Cell:
 
     def __init__(self, block, blockMap):
@@ -607,6 +665,17 @@ class Document:
 
         self._responsePages = responsePages
         self._pages = []
+        # Built in one pass over the blocks on the first lookup that needs them,
+        # so parsing alone does not pay for them:
+        # block type -> blocks, (page number, block type) -> blocks,
+        # block id -> {relationship type -> ids}, and child id -> parent ids
+        self._blocksByType = {}
+        self._blocksByPageAndType = {}
+        self._relationships = {}
+        self._parents = {}
+        self._indexed = False
+        self._pagesByNumber = {}
+        self._pagesInReadingOrder = []
 
         self._parse()
 
@@ -638,12 +707,38 @@ class Document:
             documentPages.append({"Blocks" : documentPage})
         return documentPages, blockMap
 
+    def _indexBlocks(self):
+        if(self._indexed):
+            return
+        pageNumber = 0
+        for documentPage in self._responseDocumentPages:
+            # Each document page starts with its PAGE block
+            pageNumber = documentPage["Blocks"][0].get('Page', pageNumber + 1)
+            for block in documentPage["Blocks"]:
+                self._indexBlock(block, pageNumber)
+        self._indexed = True
+
+    def _indexBlock(self, block, pageNumber):
+        blockType = block['BlockType']
+        self._blocksByType.setdefault(blockType, []).append(block)
+        self._blocksByPageAndType.setdefault((block.get('Page', pageNumber), blockType), []).append(block)
+        if('Relationships' in block and block['Relationships']):
+            relationships = {}
+            for rs in block['Relationships']:
+                relationships.setdefault(rs['Type'], []).extend(rs['Ids'])
+                if(rs['Type'] == 'CHILD'):
+                    for cid in rs['Ids']:
+                        self._parents.setdefault(cid, []).append(block['Id'])
+            self._relationships[block['Id']] = relationships
+
     def _parse(self):
 
         self._responseDocumentPages, self._blockMap = self._parseDocumentPagesAndBlockMap()
         for documentPage in self._responseDocumentPages:
             page = Page(documentPage["Blocks"], self._blockMap)
             self._pages.append(page)
+            self._pagesByNumber[page._pageNumber] = page
+        self._pagesInReadingOrder = [self._pagesByNumber[n] for n in sorted(self._pagesByNumber)]
 
     @property
     def blocks(self):
@@ -664,11 +759,31 @@ class Document:
         return block
 
     def getPagesInReadingOrder(self):
-        pageDict = {}
-        for p in self._pages:
-            pageDict[p._pageNumber] = p
-        sortedDict = OrderedDict(sorted(pageDict.items()))
-        return list(sortedDict.values())
+        # Sorted once at parse time; a copy, so callers cannot reorder the index
+        return list(self._pagesInReadingOrder)
+
+    def getPageByNumber(self, pageNumber):
+        return self._pagesByNumber.get(pageNumber)
+
+    def getBlocksByType(self, blockType, pageNumber=None):
+        self._indexBlocks()
+        if(pageNumber is None):
+            return list(self._blocksByType.get(blockType, []))
+        return list(self._blocksByPageAndType.get((pageNumber, blockType), []))
+
+    def getRelatedIds(self, blockId, relationshipType):
+        self._indexBlocks()
+        relationships = self._relationships.get(blockId)
+        if(not relationships):
+            return []
+        return list(relationships.get(relationshipType, []))
+
+    def getChildren(self, blockId):
+        return [self._blockMap[cid] for cid in self.getRelatedIds(blockId, 'CHILD') if cid in self._blockMap]
+
+    def getParents(self, blockId):
+        self._indexBlocks()
+        return [self._blockMap[pid] for pid in self._parents.get(blockId, [])]
 
     def getLineHeights(self):
         heights = []
@@ -6,6 +6,7 @@ import { Construct } from 'constructs';
 import iam = require('aws-cdk-lib/aws-iam');
 import {ObjectOwnership} from "aws-cdk-lib/aws-s3";
 import { SqsEventSource } from 'aws-cdk-lib/aws-lambda-event-sources';
+import destinations = require('aws-cdk-lib/aws-lambda-destinations');
 import sns = require('aws-cdk-lib/aws-sns');
 import snsSubscriptions = require("aws-cdk-lib/aws-sns-subscriptions");
 import sqs = require('aws-cdk-lib/aws-sqs');
@@ -25,6 +26,8 @@ import elb = require('aws-cdk-lib/aws-elasticloadbalancingv2');
 import kms = require('aws-cdk-lib/aws-kms');
 import ssm = require('aws-cdk-lib/aws-ssm');
 import wafv2 = require ('aws-cdk-lib/aws-wafv2');
+import cloudwatch = require('aws-cdk-lib/aws-cloudwatch');
+import appscaling = require('aws-cdk-lib/aws-applicationautoscaling');
 
 export class CdkStack extends cdk.Stack {
   constructor(scope: Construct, id: string, props?: cdk.StackProps) {
@@ -90,7 +93,8 @@ export class CdkStack extends cdk.Stack {
       serverAccessLogsPrefix: 'accesslogs',
       enforceSSL: true,
       objectOwnership: ObjectOwnership.BUCKET_OWNER_PREFERRED,
-
+      // Checkpoints of finished Textract jobs, and of jobs that never finished
+      lifecycleRules: [{ prefix: 'textract-results/', expiration: cdk.Duration.days(7) }],
     });
     const appBucket = new s3.Bucket(this, 'AppBucket', {
       blockPublicAccess: s3.BlockPublicAccess.BLOCK_ALL,
@@ -179,6 +183,35 @@ export class CdkStack extends cdk.Stack {
       description: 'Textractor layer.',
     });
 
+    // pypdf, for splitting small PDFs into pages for synchronous text detection
+    const pdfLayer = new lambda.LayerVersion(this, 'PdfLayer', {
+      code: lambda.Code.fromAsset('lambda/pdf', {
+        bundling: {
+          image: lambda.Runtime.PYTHON_3_9.bundlingImage,
+          command: ['bash', '-c', 'pip install -r requirements.txt -t /asset-output/python'],
+        },
+      }),
+      compatibleRuntimes: [lambda.Runtime.PYTHON_3_9],
+      license: 'BSD-3-Clause',
+      description: 'PDF layer.',
+    });
+
+    // 'parquet' or 'arrow' (cdk deploy -c columnarOutput=parquet) writes the tables and forms of
+    // analysis jobs to one columnar file. Off by default, since this stack only starts text detection jobs.
+    const columnarOutput = this.node.tryGetContext('columnarOutput') || '';
+    // pyarrow, for writing Textract tables and forms as Parquet or Arrow; only built when columnar output is on
+    const arrowLayer = !columnarOutput ? undefined : new lambda.LayerVersion(this, 'ArrowLayer', {
+      code: lambda.Code.fromAsset('lambda/arrow', {
+        bundling: {
+          image: lambda.Runtime.PYTHON_3_9.bundlingImage,
+          command: ['bash', '-c', 'pip install -r requirements.txt -t /asset-output/python'],
+        },
+      }),
+      compatibleRuntimes: [lambda.Runtime.PYTHON_3_9],
+      license: 'Apache-2.0',
+      description: 'Arrow layer.',
+    });
+
     //------------------------------------------------------------
     // Async Job Processor (Start jobs using Async APIs)
     const asyncProcessor = new lambda.Function(this, 'ASyncProcessor', {
@@ -193,6 +226,10 @@ export class CdkStack extends cdk.Stack {
         SNS_ROLE_ARN: textractServiceRole.roleArn,
         OUTPUT_TABLE: outputTable.tableName,
         DOCUMENTS_TABLE: documentsTable.tableName,
+        // Set to 'true' to summarize and embed every document once its text is extracted
+        AUTO_PIPELINE: 'false',
+        // Documents up to this many bytes take the synchronous fast path; '0' turns it off
+        SMALL_DOC_MAX_BYTES: '5242880',
       }
     });
 
@@ -229,11 +266,22 @@ export class CdkStack extends cdk.Stack {
       environment: {
         OUTPUT_TABLE: outputTable.tableName,
         DOCUMENTS_TABLE: documentsTable.tableName,
+        SUMMARIZATION_QUEUE_URL: summarizationResultsQueue.queueUrl,
+        JOB_TABLE: summarizationTable.tableName,
+        EMBED_TABLE: embeddingTable.tableName,
+        // 'false' queues embedding after summarization instead of running them together
+        PIPELINE_OVERLAP: 'true',
+        // 'true' writes one compressed bundle per document instead of objects per page
+        OUTPUT_BUNDLE: 'false',
+        COLUMNAR_OUTPUT: columnarOutput,
       }
     });
     //Layer
     jobResultProcessor.addLayers(helperLayer)
     jobResultProcessor.addLayers(textractorLayer)
+    if (arrowLayer) {
+      jobResultProcessor.addLayers(arrowLayer)
+    }
     //Triggers
     jobResultProcessor.addEventSource(new SqsEventSource(jobResultsQueue, {
       batchSize: 1
@@ -242,6 +290,9 @@ export class CdkStack extends cdk.Stack {
     outputTable.grantReadWriteData(jobResultProcessor)
     documentsTable.grantReadWriteData(jobResultProcessor)
     contentBucket.grantReadWrite(jobResultProcessor)
+    summarizationResultsQueue.grantSendMessages(jobResultProcessor)
+    summarizationTable.grantReadWriteData(jobResultProcessor)
+    embeddingTable.grantReadWriteData(jobResultProcessor)
     jobResultProcessor.addToRolePolicy(
       new iam.PolicyStatement({
         actions: ["textract:GetDocumentTextDetection", "textract:GetDocumentAnalysis"],
@@ -261,11 +312,13 @@ export class CdkStack extends cdk.Stack {
       environment: {
         QUEUE_URL: summarizationResultsQueue.queueUrl,
         JOB_TABLE: summarizationTable.tableName,
+        EMBED_TABLE: embeddingTable.tableName,
       }
     });
     summarizationProcessor.addLayers(helperLayer)
     summarizationResultsQueue.grantSendMessages(summarizationProcessor)
     summarizationTable.grantReadWriteData(summarizationProcessor)
+    embeddingTable.grantReadWriteData(summarizationProcessor)
 
     // Embedding handler 
     const embeddingProcessor = new lambda.Function(this, 'EmbeddingProcessor', {
@@ -372,6 +425,11 @@ export class CdkStack extends cdk.Stack {
     });
     const endpointSum = this.node.tryGetContext('sumEndpoint');
     const endpointEmbed = this.node.tryGetContext('embedEndpoint');
+    // Each endpoint context value may be a comma separated list of endpoints
+    // serving the same model; the workers balance calls across them.
+    const endpointArns = (endpoints: string) => String(endpoints).split(',').map(
+      endpoint => "arn:aws:sagemaker:" + this.region + ":" + this.account + ":endpoint/" + endpoint.trim()
+    );
     const cluster = new ecs.Cluster(this, 'Cluster', {
       vpc,
       enableFargateCapacityProviders: true,
@@ -387,14 +445,13 @@ export class CdkStack extends cdk.Stack {
       // }
     });
     fargateTaskDefinition.grantRun(summarizationProcessor)
-    contentBucket.grantRead(fargateTaskDefinition.taskRole)
+    // Large summaries are written next to the extracted text
+    contentBucket.grantReadWrite(fargateTaskDefinition.taskRole)
     summarizationTable.grantReadWriteData(fargateTaskDefinition.taskRole)
     fargateTaskDefinition.taskRole.addToPrincipalPolicy(
       new iam.PolicyStatement({
         actions: ["sagemaker:InvokeEndpoint"],
-        resources: [
-          "arn:aws:sagemaker:" + this.region + ":" + this.account + ":endpoint/" + endpointSum
-        ]
+        resources: endpointArns(endpointSum)
       })
     );
     const regionParam = new ssm.StringParameter(this, 'RegionParameter', {
@@ -412,8 +469,8 @@ export class CdkStack extends cdk.Stack {
       stringValue: summarizationTable.tableName,
       tier: ssm.ParameterTier.ADVANCED,
     });
-    fargateTaskDefinition.addContainer('worker', {
-      image: ecs.ContainerImage.fromAsset('fargate/summarizationWorker'),
+    const summarizationContainer = fargateTaskDefinition.addContainer('worker', {
+      image: ecs.ContainerImage.fromAsset('fargate', { file: 'summarizationWorker/Dockerfile' }),
       logging: ecs.LogDrivers.awsLogs({ streamPrefix: 'summarization-log-group', logRetention: 30 }),
       secrets: { 
         endpoint: ecs.Secret.fromSsmParameter(endpointSumParam),
@@ -511,9 +568,7 @@ export class CdkStack extends cdk.Stack {
     fargateTaskDefinitionEmbed.taskRole.addToPrincipalPolicy(
       new iam.PolicyStatement({
         actions: ["sagemaker:InvokeEndpoint"],
-        resources: [
-          "arn:aws:sagemaker:" + this.region + ":" + this.account + ":endpoint/" + endpointEmbed
-        ]
+        resources: endpointArns(endpointEmbed)
       })
     );
     const endpointEmbedParam = new ssm.StringParameter(this, 'EndpointEmbedParameter', {
@@ -532,7 +587,7 @@ export class CdkStack extends cdk.Stack {
       tier: ssm.ParameterTier.ADVANCED,
     });
     const embedContainer = fargateTaskDefinitionEmbed.addContainer('worker', {
-      image: ecs.ContainerImage.fromAsset('fargate/embeddingWorker'),
+      image: ecs.ContainerImage.fromAsset('fargate', { file: 'embeddingWorker/Dockerfile' }),
       logging: ecs.LogDrivers.awsLogs({ streamPrefix: 'embed-log-group', logRetention: 30 }),
       secrets: { 
         endpoint: ecs.Secret.fromSsmParameter(endpointEmbedParam),
@@ -541,6 +596,8 @@ export class CdkStack extends cdk.Stack {
         mountpoint: ecs.Secret.fromSsmParameter(mountParam)
       }
     });
+    embedContainer.addEnvironment('documents_table', documentsTable.tableName);
+    documentsTable.grantReadWriteData(fargateTaskDefinitionEmbed.taskRole)
     embedContainer.addMountPoints(
       {
         containerPath: '/efs/data',
@@ -565,6 +622,41 @@ export class CdkStack extends cdk.Stack {
         resources: ['*']
       })
     );
+    // Pipelined documents are summarized and embedded by the same summarization task
+    fargateTaskDefinition.addVolume(embedVolume);
+    summarizationContainer.addMountPoints(
+      {
+        containerPath: '/efs/data',
+        readOnly: false,
+        sourceVolume: 'datavolume',
+      }
+    );
+    summarizationContainer.addSecret('endpoint_embed', ecs.Secret.fromSsmParameter(endpointEmbedParam));
+    summarizationContainer.addSecret('embed_table', ecs.Secret.fromSsmParameter(embedTableParam));
+    summarizationContainer.addSecret('mountpoint', ecs.Secret.fromSsmParameter(mountParam));
+    embeddingTable.grantReadWriteData(fargateTaskDefinition.taskRole)
+    // Pipeline mode: stage updates, and queuing embedding when it is not overlapped
+    summarizationContainer.addEnvironment('documents_table', documentsTable.tableName);
+    summarizationContainer.addEnvironment('embed_queue_url', embeddingQueue.queueUrl);
+    documentsTable.grantReadWriteData(fargateTaskDefinition.taskRole)
+    embeddingQueue.grantSendMessages(fargateTaskDefinition.taskRole)
+    fargateTaskDefinition.taskRole.addToPrincipalPolicy(
+      new iam.PolicyStatement({
+        actions: ["sagemaker:InvokeEndpoint"],
+        resources: endpointArns(endpointEmbed)
+      })
+    );
+    fargateTaskDefinition.addToTaskRolePolicy(
+      new iam.PolicyStatement({
+        actions: [
+          'elasticfilesystem:ClientRootAccess',
+          'elasticfilesystem:ClientWrite',
+          'elasticfilesystem:ClientMount',
+          'elasticfilesystem:DescribeMountTargets'
+        ],
+        resources: [fileSystem.fileSystemArn]
+      })
+    );
     fileSystem.connections.allowDefaultPortFrom(ec2.Peer.ipv4(vpc.vpcCidrBlock));
     const embeddingWorker = new lambda.Function(this, 'EmbeddingWorker', {
       runtime: lambda.Runtime.PYTHON_3_9,
@@ -597,6 +689,242 @@ export class CdkStack extends cdk.Stack {
       })
     );
 
+    //**********Small document fast path*************************
+    // Summarizes and embeds a small document in one Lambda invocation, writing its index straight to EFS
+    const smallDocWorker = new lambda.DockerImageFunction(this, 'SmallDocWorker', {
+      code: lambda.DockerImageCode.fromImageAsset('fargate', { file: 'smallDocWorker/Dockerfile' }),
+      tracing: lambda.Tracing.ACTIVE,
+      memorySize: 4096,
+      ephemeralStorageSize: cdk.Size.gibibytes(4),
+      timeout: cdk.Duration.seconds(900),
+      vpc: vpc,
+      vpcSubnets: {
+        subnetType: ec2.SubnetType.PRIVATE_WITH_EGRESS,
+      },
+      filesystem: lambda.FileSystem.fromEfsAccessPoint(accessPoint, '/mnt/efs'),
+      environment: {
+        region: this.region,
+        endpoint: endpointSum,
+        endpoint_embed: endpointEmbed,
+        table: summarizationTable.tableName,
+        embed_table: embeddingTable.tableName,
+        documents_table: documentsTable.tableName,
+        mountpoint: '/mnt/efs',
+      }
+    });
+    contentBucket.grantReadWrite(smallDocWorker)
+    summarizationTable.grantReadWriteData(smallDocWorker)
+    embeddingTable.grantReadWriteData(smallDocWorker)
+    documentsTable.grantReadWriteData(smallDocWorker)
+    smallDocWorker.addToRolePolicy(
+      new iam.PolicyStatement({
+        actions: ["sagemaker:InvokeEndpoint"],
+        resources: endpointArns(endpointSum).concat(endpointArns(endpointEmbed))
+      })
+    );
+
+    // Reads PDFs' own text layer and extracts small documents with synchronous Textract calls.
+    // Pages it cannot handle go to an async Textract job.
+    const ingestProcessor = new lambda.Function(this, 'IngestProcessor', {
+      runtime: lambda.Runtime.PYTHON_3_9,
+      code: lambda.Code.fromAsset('lambda/ingestprocessor'),
+      handler: 'lambda_function.lambda_handler',
+      memorySize: 4096,
+      ephemeralStorageSize: cdk.Size.gibibytes(4),
+      tracing: lambda.Tracing.ACTIVE,
+      timeout: cdk.Duration.seconds(900),
+      // Invocations beyond this wait in Lambda's async event queue instead of all waiting for Textract tokens
+      reservedConcurrentExecutions: 10,
+      environment: {
+        OUTPUT_TABLE: outputTable.tableName,
+        DOCUMENTS_TABLE: documentsTable.tableName,
+        JOB_TABLE: summarizationTable.tableName,
+        EMBED_TABLE: embeddingTable.tableName,
+        SNS_TOPIC_ARN: jobCompletionTopic.topicArn,
+        SNS_ROLE_ARN: textractServiceRole.roleArn,
+        WORKER_FUNCTION: smallDocWorker.functionName,
+        SMALL_DOC_MAX_PAGES: '5',
+        SYNC_PARALLEL: '4',
+        NATIVE_TEXT: 'true',
+        NATIVE_MIN_CHARS: '50',
+        TEXTRACT_SECONDS_PER_PAGE: '1',
+        TEXTRACT_SPLIT_PAGES: '100',
+        TEXTRACT_MAX_PARTS: '20',
+        OUTPUT_BUNDLE: 'false',
+        SUMMARIZATION_QUEUE_URL: summarizationResultsQueue.queueUrl,
+        PIPELINE_OVERLAP: 'true',
+      }
+    });
+    ingestProcessor.addLayers(helperLayer)
+    ingestProcessor.addLayers(textractorLayer)
+    ingestProcessor.addLayers(pdfLayer)
+    contentBucket.grantReadWrite(ingestProcessor)
+    outputTable.grantReadWriteData(ingestProcessor)
+    documentsTable.grantReadWriteData(ingestProcessor)
+    summarizationTable.grantReadWriteData(ingestProcessor)
+    embeddingTable.grantReadWriteData(ingestProcessor)
+    smallDocWorker.grantInvoke(ingestProcessor)
+    summarizationResultsQueue.grantSendMessages(ingestProcessor)
+    ingestProcessor.addToRolePolicy(
+      new iam.PolicyStatement({
+        actions: ["iam:PassRole"],
+        resources: [textractServiceRole.roleArn]
+      })
+    );
+    ingestProcessor.addToRolePolicy(
+      new iam.PolicyStatement({
+        actions: ["textract:DetectDocumentText", "textract:StartDocumentTextDetection"],
+        resources: ["*"]
+      })
+    );
+    asyncProcessor.addEnvironment('INGEST_FUNCTION', ingestProcessor.functionName);
+    ingestProcessor.grantInvoke(asyncProcessor)
+
+    //**********Bulk ingestion*************************
+    // Token buckets that keep every Lambda together under the account's Textract TPS quotas
+    const rateLimitTable = new dynamodb.Table(this, 'RateLimitTable', {
+      partitionKey: { name: 'bucketId', type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST
+    });
+    // Fields = bulk id, source, listing status, pages listed, truncated, documents queued, handed off, started, skipped, throttled and failed
+    const bulkJobTable = new dynamodb.Table(this, 'BulkJobTable', {
+      partitionKey: { name: 'bulkId', type: dynamodb.AttributeType.STRING },
+      pointInTimeRecovery: true,
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST
+    });
+    // Throttled documents are retried from here, so they get more receives than one document needs
+    const ingestQueue = new sqs.Queue(this, 'IngestQueue', {
+      visibilityTimeout: cdk.Duration.seconds(360), enforceSSL: true,
+      retentionPeriod: cdk.Duration.seconds(1209600), deadLetterQueue: { queue: dlq, maxReceiveCount: 50 }
+    });
+
+    // Set to the account's quotas for each API
+    const textractQuotas = {
+      TOKEN_BUCKET_TABLE: rateLimitTable.tableName,
+      TPS_STARTDOCUMENTTEXTDETECTION: '2',
+      TPS_DETECTDOCUMENTTEXT: '1',
+    };
+    for (const fn of [asyncProcessor, ingestProcessor]) {
+      for (const [key, value] of Object.entries(textractQuotas)) {
+        fn.addEnvironment(key, value);
+      }
+      rateLimitTable.grantReadWriteData(fn)
+    }
+    // Invoked asynchronously, so it can wait out a busy minute rather than fail
+    ingestProcessor.addEnvironment('TOKEN_WAIT_SECONDS', '300');
+    ingestProcessor.addEnvironment('BULK_TABLE', bulkJobTable.tableName);
+    bulkJobTable.grantReadWriteData(ingestProcessor)
+
+    // Marks a document FAILED once its ingest processor invocation has used up its retries,
+    // so it is not left Started and the next run over it starts it again
+    const ingestFailureProcessor = new lambda.Function(this, 'IngestFailureProcessor', {
+      runtime: lambda.Runtime.PYTHON_3_9,
+      code: lambda.Code.fromAsset('lambda/ingestfailureprocessor'),
+      handler: 'lambda_function.lambda_handler',
+      tracing: lambda.Tracing.ACTIVE,
+      timeout: cdk.Duration.seconds(30),
+      environment: {
+        OUTPUT_TABLE: outputTable.tableName,
+        DOCUMENTS_TABLE: documentsTable.tableName,
+        BULK_TABLE: bulkJobTable.tableName,
+      }
+    });
+    ingestFailureProcessor.addLayers(helperLayer)
+    documentsTable.grantReadWriteData(ingestFailureProcessor)
+    bulkJobTable.grantReadWriteData(ingestFailureProcessor)
+    ingestProcessor.configureAsyncInvoke({
+      retryAttempts: 2,
+      onFailure: new destinations.LambdaDestination(ingestFailureProcessor)
+    });
+
+    // Creates bulk jobs for the API, then lists a prefix or reads a manifest and queues every
+    // document in it from asynchronous invocations of itself, so listing is not bound by the API timeout
+    const bulkProcessor = new lambda.Function(this, 'BulkProcessor', {
+      runtime: lambda.Runtime.PYTHON_3_9,
+      code: lambda.Code.fromAsset('lambda/bulkprocessor'),
+      handler: 'lambda_function.lambda_handler',
+      tracing: lambda.Tracing.ACTIVE,
+      memorySize: 1024,
+      timeout: cdk.Duration.seconds(300),
+      environment: {
+        BULK_TABLE: bulkJobTable.tableName,
+        INGEST_QUEUE_URL: ingestQueue.queueUrl,
+        AUTO_PIPELINE: 'false',
+        MAX_LIST_PAGES: '100',
+        // A listing invocation hands over to the next one with this much time left
+        LIST_MARGIN_SECONDS: '60',
+      }
+    });
+    bulkProcessor.addLayers(helperLayer)
+    contentBucket.grantRead(bulkProcessor)
+    bulkJobTable.grantReadWriteData(bulkProcessor)
+    ingestQueue.grantSendMessages(bulkProcessor)
+    // By name pattern, since granting the function's own ARN would be a circular dependency
+    bulkProcessor.addToRolePolicy(
+      new iam.PolicyStatement({
+        actions: ["lambda:InvokeFunction"],
+        resources: ["arn:aws:lambda:" + this.region + ":" + this.account + ":function:*BulkProcessor*"]
+      })
+    );
+    // A retried listing would queue its pages twice; a failed one is recorded on the job instead
+    bulkProcessor.configureAsyncInvoke({
+      retryAttempts: 0
+    });
+
+    // Starts queued documents the same way the async processor does
+    const bulkIngestor = new lambda.Function(this, 'BulkIngestor', {
+      runtime: lambda.Runtime.PYTHON_3_9,
+      code: lambda.Code.fromAsset('lambda/bulkingestor'),
+      handler: 'lambda_function.lambda_handler',
+      tracing: lambda.Tracing.ACTIVE,
+      timeout: cdk.Duration.seconds(300),
+      environment: {
+        ...textractQuotas,
+        SNS_TOPIC_ARN: jobCompletionTopic.topicArn,
+        SNS_ROLE_ARN: textractServiceRole.roleArn,
+        OUTPUT_TABLE: outputTable.tableName,
+        DOCUMENTS_TABLE: documentsTable.tableName,
+        BULK_TABLE: bulkJobTable.tableName,
+        INGEST_FUNCTION: ingestProcessor.functionName,
+        SMALL_DOC_MAX_BYTES: '5242880',
+        TOKEN_WAIT_SECONDS: '10',
+        MAX_RECEIVE_COUNT: '50',
+      }
+    });
+    bulkIngestor.addLayers(helperLayer)
+    bulkIngestor.addEventSource(new SqsEventSource(ingestQueue, {
+      batchSize: 10,
+      reportBatchItemFailures: true,
+      maxConcurrency: 5
+    }));
+    contentBucket.grantRead(bulkIngestor)
+    outputTable.grantReadWriteData(bulkIngestor)
+    documentsTable.grantReadWriteData(bulkIngestor)
+    bulkJobTable.grantReadWriteData(bulkIngestor)
+    rateLimitTable.grantReadWriteData(bulkIngestor)
+    ingestProcessor.grantInvoke(bulkIngestor)
+    bulkIngestor.addToRolePolicy(
+      new iam.PolicyStatement({
+        actions: ["iam:PassRole"],
+        resources: [textractServiceRole.roleArn]
+      })
+    );
+    bulkIngestor.addToRolePolicy(
+      new iam.PolicyStatement({
+        actions: ["textract:StartDocumentTextDetection"],
+        resources: ["*"]
+      })
+    );
+
+    const bulkResource = api.root.addResource('bulk');
+    const bulkIntegration = new apigw.LambdaIntegration(bulkProcessor);
+    bulkResource.addMethod('POST', bulkIntegration, {
+      authorizationType: apigw.AuthorizationType.IAM
+    });
+    bulkResource.addMethod('GET', bulkIntegration, {
+      authorizationType: apigw.AuthorizationType.IAM
+    });
+
     //***********Cognito ************************/
     const userPool = new cognito.UserPool(this, 'userpool', {
       userPoolName: 'fsiqasumuserpool',
@@ -666,10 +994,7 @@ export class CdkStack extends cdk.Stack {
     fargateTaskDefinitionQa.taskRole.addToPrincipalPolicy(
       new iam.PolicyStatement({
         actions: ["sagemaker:InvokeEndpoint"],
-        resources: [
-          "arn:aws:sagemaker:" + this.region + ":" + this.account + ":endpoint/" + endpointEmbed,
-          "arn:aws:sagemaker:" + this.region + ":" + this.account + ":endpoint/" + endpointQa
-        ]
+        resources: endpointArns(endpointEmbed).concat(endpointArns(endpointQa))
       })
     );
     const endpointQaParam = new ssm.StringParameter(this, 'EndpointQaParameter', {
@@ -678,7 +1003,7 @@ export class CdkStack extends cdk.Stack {
       tier: ssm.ParameterTier.ADVANCED,
     });
     const qaContainer = fargateTaskDefinitionQa.addContainer('qaworker', {
-      image: ecs.ContainerImage.fromAsset('fargate/qaWorker'),
+      image: ecs.ContainerImage.fromAsset('fargate', { file: 'qaWorker/Dockerfile' }),
       containerName: 'qaworker',
       logging: ecs.LogDrivers.awsLogs({ streamPrefix: 'qa-log-group', logRetention: 30 }),
       portMappings: [
@@ -687,6 +1012,10 @@ export class CdkStack extends cdk.Stack {
           hostPort: 5000
         }
       ],
+      environment: {
+        // Most of the task's ephemeral storage holds local copies of vector stores
+        local_cache_max_gb: '80'
+      },
       secrets: { 
         endpoint_embed: ecs.Secret.fromSsmParameter(endpointEmbedParam),
         endpoint_qa: ecs.Secret.fromSsmParameter(endpointQaParam),
@@ -735,6 +1064,28 @@ export class CdkStack extends cdk.Stack {
       taskDefinition: fargateTaskDefinitionQa,
       healthCheckGracePeriod: cdk.Duration.seconds(300)
     })
+    // Scale on the admission queue the QA workers report, rather than CPU,
+    // since the workers mostly wait on endpoints and EFS.
+    const qaScaling = qaService.autoScaleTaskCount({
+      minCapacity: 1,
+      maxCapacity: 10,
+    });
+    qaScaling.scaleOnMetric('QaQueueDepthScaling', {
+      metric: new cloudwatch.Metric({
+        namespace: 'FsiQaSummarization',
+        metricName: 'queueDepth',
+        dimensionsMap: { Admission: 'qa' },
+        statistic: 'Average',
+        period: cdk.Duration.minutes(1),
+      }),
+      scalingSteps: [
+        { upper: 0, change: -1 },
+        { lower: 4, change: +1 },
+        { lower: 16, change: +3 },
+      ],
+      adjustmentType: appscaling.AdjustmentType.CHANGE_IN_CAPACITY,
+      cooldown: cdk.Duration.minutes(3),
+    });
     const qaNLB = new elb.NetworkLoadBalancer(this, 'qaNLB', {
         loadBalancerName: 'qaNLB',
         vpc: vpc,
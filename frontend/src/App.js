@@ -84,6 +84,9 @@ function App({ signOut, user }) {
   // Summarization text
   const [numBeams, setNumBeams] = useState(2);
 
+  // Embed while summarizing
+  const [pipeline, setPipeline] = useState(false);
+
   // S3 bucket name
   const bucket = config.content.bucket;
 
@@ -128,6 +131,7 @@ function App({ signOut, user }) {
     setTopP(0.9);
     setMaxLength(10000);
     setNumBeams(2);
+    setPipeline(true);
   }
 
   async function pdf2txt() {
@@ -185,12 +189,17 @@ function App({ signOut, user }) {
           'top_k': topK,
           'num_beams': numBeams,
           'temperature': temperature,
+          'pipeline': pipeline,
         }
       });
       console.log("Summarization job ID: " + result.job)
       setSjobid(result.job)
       toast.success("Summarization started");
       setTimeout(() => {  checkSummarizationStatus(result.job); }, 30000);
+      if (result.ejob) {
+        setEjobid(result.ejob)
+        setTimeout(() => {  checkEJobStatus(); }, 30000);
+      }
     }
     catch(error) {
       console.log("Error starting summarization: ", error);
@@ -330,7 +339,8 @@ function App({ signOut, user }) {
     });
   }
 
-  function getOutputPath() {
+  // Documents written as a bundle have one Bundle item, with the text's path in textPath
+  function getOutputPath(otype = "ResponseOrderedText") {
     Auth.currentCredentials()
     .then(credentials => {
       const db= new DynamoDB({
@@ -346,7 +356,7 @@ function App({ signOut, user }) {
         },
         ExpressionAttributeValues: {
           ":docid": { "S" : docid},
-          ":otype": { "S" : "ResponseOrderedText"}
+          ":otype": { "S" : otype}
         }
      };
       db.query(params, function(err, data) {
@@ -358,9 +368,13 @@ function App({ signOut, user }) {
           console.log('Got data');
           console.log(data);
 
+          if (data['Items'].length === 0 && otype !== "Bundle") {
+            getOutputPath("Bundle");
+            return;
+          }
           for (var i in data['Items']) {
               // read the values from the dynamodb JSON packet
-              var opath = data['Items'][i]['outputPath']['S'];
+              var opath = data['Items'][i][otype === "Bundle" ? 'textPath' : 'outputPath']['S'];
               console.log("Output path: " + opath);        
               setEname(opath);
               downloadExtract(opath);
@@ -370,6 +384,35 @@ function App({ signOut, user }) {
   });
   }
 
+  // Large summaries are kept in S3, compressed, and read through a presigned URL
+  async function downloadSummary(skey) {
+    var key = skey.replace(config.content.prefix, '')
+    console.log("Getting signed url for summary " + key);
+    const signedURL = await Storage.get(key);
+    const response = await fetch(signedURL);
+    setSummaryText(await response.text());
+  }
+
+  function getSummaryText(db, sumjobid) {
+    var params = {
+      TableName: config.tables.sumtable,
+      Key: {
+        "documentId": { "S" : docid},
+        "jobId": { "S" : sumjobid}
+      },
+      ProjectionExpression: 'summaryText'
+    };
+    db.getItem(params, function(err, data) {
+      if (err) {
+        console.log(err);
+      } else {
+        var stext = data['Item']['summaryText']['S'];
+        console.log("Summary: " + stext)
+        setSummaryText(stext);
+      }
+    });
+  }
+
   function checkSummarizationStatus(sumjobid) {
     Auth.currentCredentials()
       .then(credentials => {
@@ -387,7 +430,9 @@ function App({ signOut, user }) {
           ExpressionAttributeValues: {
             ":docid": { "S" : docid},
             ":jobidvalue": { "S" : sumjobid},
-          }
+          },
+          // Status polls leave the summary itself out
+          ProjectionExpression: 'jobStatus, chunksSummarized, summaryLocation'
        };
         db.query(params, function(err, data) {
             if (err) {
@@ -404,9 +449,12 @@ function App({ signOut, user }) {
                 jobStatus = data['Items'][i]['jobStatus']['S'];
                 console.log(jobStatus);        
                 if (jobStatus.includes("Complete")) {
-                  var stext = data['Items'][i]['summaryText']['S'];
-                  console.log("Summary: " + stext)
-                  setSummaryText(stext);
+                  if ('summaryLocation' in data['Items'][i]) {
+                    downloadSummary(data['Items'][i]['summaryLocation']['S']);
+                  }
+                  else {
+                    getSummaryText(db, sumjobid);
+                  }
                   setIsSjobdone(true);
                 }
             }
@@ -447,6 +495,9 @@ function App({ signOut, user }) {
   function changeMaxLength(e) {
     setMaxLength(e.target.value);
   }
+  function changePipeline(e) {
+    setPipeline(e.target.checked);
+  }
 
   return (
     <Container fluid>
@@ -522,6 +573,10 @@ function App({ signOut, user }) {
               <label>Num beams (between 0 and 10)):
                 <input type="number" id="numbeams" name="numbeams" min="0" max="10" value={numBeams} onChange={changeNumBeams}/> 
               </label>
+              <br></br>
+              <label>Generate embeddings while summarizing:
+                <input type="checkbox" id="pipeline" name="pipeline" checked={pipeline} onChange={changePipeline}/>
+              </label>
             </div>
           </Collapse>
         </div>
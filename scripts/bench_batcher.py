@@ -0,0 +1,79 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Compares one-text-per-call query embedding with the QA worker's
+# micro-batcher against a fake embedding endpoint whose latency is a fixed
+# per-call cost plus a small per-item cost.
+#
+#   python scripts/bench_batcher.py --concurrency 32 --max-batch-size 16 --max-wait-ms 5
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..', 'cdk', 'fargate', 'common'))
+sys.path.insert(0, os.path.join(here, '..', 'cdk', 'fargate', 'qaWorker'))
+
+from batcher import MicroBatcher
+
+class FakeEmbeddingEndpoint:
+    def __init__(self, call_latency, item_latency, capacity):
+        self.call_latency = call_latency
+        self.item_latency = item_latency
+        # Concurrent invocations the endpoint instance can serve
+        self.capacity = threading.Semaphore(capacity)
+        self.calls = 0
+
+    def embed(self, texts):
+        with self.capacity:
+            self.calls = self.calls + 1
+            time.sleep(self.call_latency + self.item_latency * len(texts))
+            return [[float(len(t))] for t in texts]
+
+def run(embed_one, requests, concurrency):
+    latencies = []
+
+    def one(i):
+        start = time.monotonic()
+        embed_one(f"question {i}")
+        latencies.append(time.monotonic() - start)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.monotonic() - start
+    latencies.sort()
+    return requests / elapsed, latencies[len(latencies) // 2], latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--call-latency-ms', type=float, default=20)
+    parser.add_argument('--item-latency-ms', type=float, default=0.5)
+    parser.add_argument('--endpoint-capacity', type=int, default=4)
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'calls':>8}")
+    endpoint = FakeEmbeddingEndpoint(args.call_latency_ms / 1000, args.item_latency_ms / 1000, args.endpoint_capacity)
+    rps, p50, p99 = run(lambda t: endpoint.embed([t])[0], args.requests, args.concurrency)
+    print(f"{'single':<10}{rps:>10.0f}{p50 * 1000:>10.1f}{p99 * 1000:>10.1f}{endpoint.calls:>8}")
+
+    endpoint = FakeEmbeddingEndpoint(args.call_latency_ms / 1000, args.item_latency_ms / 1000, args.endpoint_capacity)
+    batcher = MicroBatcher(endpoint.embed, max_batch_size=args.max_batch_size,
+                           max_wait=args.max_wait_ms / 1000,
+                           max_concurrent_batches=args.endpoint_capacity)
+    rps, p50, p99 = run(batcher, args.requests, args.concurrency)
+    print(f"{'batched':<10}{rps:>10.0f}{p50 * 1000:>10.1f}{p99 * 1000:>10.1f}{endpoint.calls:>8}")
+    stats = batcher.stats()
+    print(f"  batch sizes: {stats['batchSizeHistogram']}")
+    print(f"  mean batch size {stats['batchSizeMean']:.1f}, queue wait p99 {stats['queueWaitP99'] * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
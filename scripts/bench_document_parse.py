@@ -0,0 +1,78 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Measures what trp.Document's block indexes cost and save, on a synthetic
+# Textract response with forms and tables: the parse, the index build on
+# the first lookup, and the index lookups against the scans over page
+# blocks they replace, checking both find the same blocks.
+#
+#   python scripts/bench_document_parse.py --pages 300 --lines 40 --repeat 5
+
+import argparse
+import os
+import random
+import sys
+import time
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..', 'cdk', 'lambda', 'textractor', 'python'))
+
+import trp
+from bench_output_bundle import make_response
+
+def best_of(repeat, fn):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+def scan_by_type(doc, block_type, page_number):
+    page = doc.pages[page_number - 1]
+    return [b for b in page.blocks if b['BlockType'] == block_type]
+
+def scan_parents(doc, block_id):
+    return [b for page in doc.pageBlocks for b in page['Blocks']
+            for rs in b.get('Relationships') or [] if rs['Type'] == 'CHILD' and block_id in rs['Ids']]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=300)
+    parser.add_argument('--lines', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--lookups', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    response = make_response(rng, args.pages, args.lines, True, True)
+    blocks = sum(len(r['Blocks']) for r in response)
+
+    parse_seconds, doc = best_of(args.repeat, lambda: trp.Document(response))
+
+    def first_lookup():
+        doc._indexed = False
+        doc._blocksByType, doc._blocksByPageAndType, doc._relationships, doc._parents = {}, {}, {}, {}
+        return doc.getBlocksByType('PAGE')
+    index_seconds, _ = best_of(args.repeat, first_lookup)
+    print(f"Parse of {args.pages} pages, {blocks} blocks: {parse_seconds:.2f}s, "
+          f"index build on the first lookup: {index_seconds:.2f}s ({index_seconds / parse_seconds * 100:.0f}% of the parse)")
+
+    pages = [rng.randint(1, args.pages) for _ in range(args.lookups)]
+    words = [b['Id'] for b in doc.getBlocksByType('WORD')]
+    children = [rng.choice(words) for _ in range(args.lookups)]
+    cases = [('blocks by type', lambda: [scan_by_type(doc, 'TABLE', p) for p in pages],
+              lambda: [doc.getBlocksByType('TABLE', p) for p in pages]),
+             ('parents', lambda: [scan_parents(doc, c) for c in children],
+              lambda: [doc.getParents(c) for c in children])]
+    print(f"{'lookup':>15} {'scan ms':>9} {'indexed ms':>11} {'speedup':>8}")
+    for name, scan, indexed in cases:
+        scan_seconds, expected = best_of(args.repeat, scan)
+        indexed_seconds, results = best_of(args.repeat, indexed)
+        assert results == expected, name
+        print(f"{name:>15} {scan_seconds * 1000:>9.1f} {indexed_seconds * 1000:>11.2f} "
+              f"{scan_seconds / indexed_seconds:>7.0f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Times trp.Form on pages with many fields. Lookups are compared with what
+# Form did before it kept indexes: getFieldByKey against the same dict
+# lookup, searchFieldsByKey against its old scan, and the new
+# getFieldByNormalizedKey and searchFieldsByTokens against the scans a
+# caller would otherwise write. Both sides must return the same fields.
+# Also times building the forms with addField, before and now, and the
+# indexes, which are built on a form's first indexed lookup.
+#
+#   python scripts/bench_form_lookup.py --fields 50 200 1000 --pages 200 --lookups 40
+
+import argparse
+import os
+import random
+import sys
+import time
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..', 'cdk', 'lambda', 'textractor', 'python'))
+
+from trp import Field, Form
+
+WORDS = ['account', 'number', 'date', 'of', 'birth', 'name', 'address', 'total', 'amount', 'due', 'policy',
+         'holder', 'premium', 'tax', 'id', 'phone', 'email', 'city', 'state', 'zip', 'code', 'balance',
+         'interest', 'rate', 'loan', 'term', 'employer', 'income', 'signature', 'beneficiary']
+
+def geometry():
+    return {'BoundingBox': {'Width': 0.1, 'Height': 0.01, 'Left': 0.1, 'Top': 0.1}, 'Polygon': []}
+
+class PlainForm:
+    # Form as it was before the indexes: a list and an exact key dict
+    def __init__(self):
+        self.fields = []
+        self.fieldsMap = {}
+
+    def addField(self, field):
+        self.fields.append(field)
+        self.fieldsMap[field.key.text] = field
+
+def make_fields(rng, fields):
+    made = []
+    for f in range(fields):
+        key_text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))) + f" {f}:"
+        block_map = {}
+        key_children = []
+        for w, word in enumerate(key_text.split()):
+            block_map[f"w{w}"] = {'BlockType': 'WORD', 'Id': f"w{w}", 'Text': word, 'Confidence': 99.0,
+                                  'Geometry': geometry()}
+            key_children.append(f"w{w}")
+        block_map['vw'] = {'BlockType': 'WORD', 'Id': 'vw', 'Text': str(rng.randint(0, 99999)),
+                           'Confidence': 99.0, 'Geometry': geometry()}
+        block_map['v'] = {'BlockType': 'KEY_VALUE_SET', 'Id': 'v', 'EntityTypes': ['VALUE'], 'Confidence': 99.0,
+                          'Geometry': geometry(), 'Relationships': [{'Type': 'CHILD', 'Ids': ['vw']}]}
+        key = {'BlockType': 'KEY_VALUE_SET', 'Id': 'k', 'EntityTypes': ['KEY'], 'Confidence': 99.0,
+               'Geometry': geometry(), 'Relationships': [{'Type': 'CHILD', 'Ids': key_children},
+                                                         {'Type': 'VALUE', 'Ids': ['v']}]}
+        made.append(Field(key, block_map))
+    return made
+
+def build(form_class, fields):
+    form = form_class()
+    for field in fields:
+        form.addField(field)
+    return form
+
+# The lookups as Form did them before it kept indexes, or as a caller would scan
+def dict_by_key(form, key):
+    return form._fieldsMap.get(key)
+
+def scan_normalized(form, key):
+    found = None
+    for field in form.fields:
+        if Form.normalizeKey(field.key.text) == Form.normalizeKey(key):
+            found = field
+    return found
+
+def scan_search(form, key):
+    search_key = key.lower()
+    return [field for field in form.fields if field.key and search_key in field.key.text.lower()]
+
+def scan_tokens(form, key):
+    tokens = set(key.lower().split())
+    return [field for field in form.fields if tokens <= set(field.key.text.lower().split())]
+
+def timed(lookup, forms, keys):
+    start = time.perf_counter()
+    results = [[lookup(form, key) for key in keys] for form in forms]
+    return time.perf_counter() - start, results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fields', type=int, nargs='+', default=[50, 200, 1000])
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--lookups', type=int, default=40)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for fields in args.fields:
+        page_fields = [make_fields(rng, fields) for _ in range(args.pages)]
+        start = time.perf_counter()
+        for made in page_fields:
+            build(PlainForm, made)
+        plain_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        forms = [build(Form, made) for made in page_fields]
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for form in forms:
+            form._index()
+        index_seconds = time.perf_counter() - start
+        count = fields * args.pages
+        print(f"{fields} fields per page, per field: addField before {plain_seconds / count * 1e6:.2f} us, "
+              f"now {build_seconds / count * 1e6:.2f} us, index build on first lookup {index_seconds / count * 1e6:.2f} us")
+
+        print(f"{'fields':>7} {'case':>10} {'before ms':>10} {'indexed ms':>11} {'speedup':>8}")
+
+        exact = [forms[0].fields[rng.randrange(fields)].key.text for _ in range(args.lookups)]
+        normalized = [" ".join(key.upper().split()).rstrip(':') + " " for key in exact]
+        partial = [" ".join(rng.sample(WORDS, 2))[1:-1] if i % 2 else rng.choice(WORDS)[:5] for i in range(args.lookups)]
+        tokens = [" ".join(rng.sample(WORDS, 2)) for _ in range(args.lookups)]
+        cases = [('key', exact, dict_by_key, Form.getFieldByKey),
+                 ('normalized', normalized, scan_normalized, Form.getFieldByNormalizedKey),
+                 ('search', partial, scan_search, Form.searchFieldsByKey),
+                 ('tokens', tokens, scan_tokens, Form.searchFieldsByTokens)]
+        for name, keys, scan, indexed in cases:
+            scan_seconds, expected = timed(scan, forms, keys)
+            indexed_seconds, results = timed(indexed, forms, keys)
+            assert results == expected, name
+            print(f"{fields:>7} {name:>10} {scan_seconds * 1000:>10.1f} {indexed_seconds * 1000:>11.1f} "
+                  f"{scan_seconds / indexed_seconds:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Exercises the shared endpoint invoker against a local fake endpoint with
+# injected latency, slow replicas, throttling and errors, and prints the tail
+# latency with and without hedging. With --endpoints, calls are balanced over
+# several fake endpoints, and --failing makes some of them return errors so
+# ejection can be observed.
+#
+#   python scripts/bench_invoker.py --calls 500 --slow-rate 0.05 --throttle-rate 0.02
+#   python scripts/bench_invoker.py --endpoints 3 --failing 1
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'cdk', 'fargate', 'common'))
+
+from botocore.exceptions import ClientError
+from invoker import EndpointInvoker, EndpointUnavailableError, DeadlineExceededError
+
+class FakeSageMakerClient:
+    """Stands in for a runtime.sagemaker client with injected latency and errors."""
+
+    def __init__(self, latency, slow_latency, slow_rate, throttle_rate, error_rate, failing=()):
+        self.failing = set(failing)
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.slow_rate = slow_rate
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.requests = 0
+
+    def _error(self, code, status):
+        return ClientError({'Error': {'Code': code, 'Message': code},
+                            'ResponseMetadata': {'HTTPStatusCode': status}}, 'InvokeEndpoint')
+
+    def invoke_endpoint(self, EndpointName, ContentType, Body):
+        self.requests = self.requests + 1
+        r = random.random()
+        if EndpointName in self.failing:
+            raise self._error('ServiceUnavailable', 503)
+        if r < self.throttle_rate:
+            raise self._error('ThrottlingException', 429)
+        if r < self.throttle_rate + self.error_rate:
+            raise self._error('ServiceUnavailable', 503)
+        slow = random.random() < self.slow_rate
+        time.sleep(self.slow_latency if slow else random.uniform(0.5, 1.5) * self.latency)
+        return {'Body': io.BytesIO(b'{"embedding": [[0.0]]}')}
+
+def run(invoker, target, calls, concurrency):
+    def one(_):
+        start = time.monotonic()
+        try:
+            invoker.invoke(target, b'{}')
+            return time.monotonic() - start, None
+        except (EndpointUnavailableError, DeadlineExceededError, ClientError) as e:
+            return time.monotonic() - start, type(e).__name__
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(calls)))
+    latencies = sorted(r[0] for r in results if r[1] is None)
+    failures = len([r for r in results if r[1] is not None])
+    return latencies, failures
+
+def pct(latencies, q):
+    if not latencies:
+        return float('nan')
+    return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--slow-latency', type=float, default=0.5)
+    parser.add_argument('--slow-rate', type=float, default=0.05)
+    parser.add_argument('--throttle-rate', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    parser.add_argument('--deadline', type=float, default=2.0)
+    parser.add_argument('--endpoints', type=int, default=1)
+    parser.add_argument('--failing', type=int, default=0)
+    parser.add_argument('--policy', default='least_outstanding')
+    args = parser.parse_args()
+
+    names = [f"fake-endpoint-{i}" for i in range(args.endpoints)]
+    target = ','.join(names)
+
+    print(f"{'mode':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'failed':>8}{'requests':>10}")
+    for hedge in (False, True):
+        client = FakeSageMakerClient(args.latency, args.slow_latency, args.slow_rate,
+                                     args.throttle_rate, args.error_rate, names[:args.failing])
+        invoker = EndpointInvoker(client=client, deadline=args.deadline, base_backoff=0.01,
+                                  hedge=hedge, failure_threshold=50,
+                                  pool_options={'policy': args.policy})
+        # Warm up the latency window so the p95 hedge delay is known
+        run(invoker, target, 50, args.concurrency)
+        client.requests = 0
+        latencies, failures = run(invoker, target, args.calls, args.concurrency)
+        # Hedge losers keep running after their caller returned; wait for them before reading stats
+        invoker.close()
+        print(f"{'hedged' if hedge else 'plain':<10}{pct(latencies, 0.5):>10.1f}{pct(latencies, 0.95):>10.1f}"
+              f"{pct(latencies, 0.99):>10.1f}{pct(latencies, 1.0):>10.1f}{failures:>8}{client.requests:>10}")
+        for name, stats in invoker.stats().items():
+            print(f"  {name}: {stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Compares the per-page output layout of OutputGenerator with the single
+# compressed bundle, on a synthetic Textract response. S3 and DynamoDB are
+# replaced with in-memory stores, so write time is the time spent building
+# the outputs, not network time; every object and item is still counted.
+# Also reads a few pages back from the bundle through its index.
+#
+#   python scripts/bench_output_bundle.py --pages 500 --lines 40 --forms --tables
+
+import argparse
+import os
+import random
+import sys
+import time
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..', 'cdk', 'lambda', 'helper', 'python'))
+sys.path.insert(0, os.path.join(here, '..', 'cdk', 'lambda', 'textractor', 'python'))
+
+import helper
+import og
+
+objects = {}
+
+def write(content, bucketName, s3FileName, awsRegion=None):
+    objects[s3FileName] = content.encode('utf-8') if isinstance(content, str) else content
+
+class MemoryS3:
+    # The calls S3StreamWriter makes, keeping objects in memory
+    def __init__(self):
+        self.parts = {}
+
+    def put_object(self, Bucket, Key, Body):
+        write(Body, Bucket, Key)
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.parts[Key] = []
+        return {'UploadId': Key}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.parts[Key].append(Body)
+        return {'ETag': str(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        write(b"".join(self.parts.pop(Key)), Bucket, Key)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.parts.pop(Key)
+
+def read_range(bucketName, s3FileName, offset, length, awsRegion=None):
+    return objects[s3FileName][offset:offset + length]
+
+class Table:
+    def __init__(self):
+        self.items = []
+
+    def put_item(self, Item):
+        self.items.append(Item)
+
+def geometry(left, top, width, height):
+    return {'BoundingBox': {'Width': width, 'Height': height, 'Left': left, 'Top': top},
+            'Polygon': [{'X': left, 'Y': top}, {'X': left + width, 'Y': top},
+                        {'X': left + width, 'Y': top + height}, {'X': left, 'Y': top + height}]}
+
+def block(blocks, block_type, page, geo, text=None, children=None, **extra):
+    b = {'BlockType': block_type, 'Id': f"{block_type[0]}{len(blocks)}", 'Page': page,
+         'Confidence': 99.0, 'Geometry': geo}
+    if text is not None:
+        b['Text'] = text
+    if children:
+        b['Relationships'] = [{'Type': 'CHILD', 'Ids': children}]
+    b.update(extra)
+    blocks.append(b)
+    return b['Id']
+
+def make_response(rng, pages, lines, forms, tables):
+    words = ['revenue', 'total', 'assets', 'liabilities', 'quarter', 'income', 'net', 'cash', 'equity', 'period']
+    blocks = []
+    for p in range(1, pages + 1):
+        page_start = len(blocks)
+        children = []
+        for l in range(lines):
+            top = (l + 1) / (lines + 2)
+            word_ids = [block(blocks, 'WORD', p, geometry(0.1 + 0.1 * w, top, 0.08, 0.01), rng.choice(words))
+                        for w in range(8)]
+            text = " ".join(b['Text'] for b in blocks[-8:])
+            children.append(block(blocks, 'LINE', p, geometry(0.1, top, 0.8, 0.01), text, word_ids))
+        if forms:
+            for f in range(5):
+                key_word = block(blocks, 'WORD', p, geometry(0.1, 0.9, 0.1, 0.01), f"field{f}")
+                value_word = block(blocks, 'WORD', p, geometry(0.3, 0.9, 0.1, 0.01), rng.choice(words))
+                value = block(blocks, 'KEY_VALUE_SET', p, geometry(0.3, 0.9, 0.1, 0.01), children=[value_word],
+                              EntityTypes=['VALUE'])
+                key = block(blocks, 'KEY_VALUE_SET', p, geometry(0.1, 0.9, 0.1, 0.01), children=[key_word],
+                            EntityTypes=['KEY'])
+                blocks[-1]['Relationships'].append({'Type': 'VALUE', 'Ids': [value]})
+                children.append(key)
+                children.append(value)
+        if tables:
+            cells = []
+            for r in range(1, 6):
+                for c in range(1, 5):
+                    cell_word = block(blocks, 'WORD', p, geometry(0.1 * c, 0.8, 0.05, 0.01), str(rng.randint(0, 9999)))
+                    cells.append(block(blocks, 'CELL', p, geometry(0.1 * c, 0.8, 0.05, 0.01), children=[cell_word],
+                                       RowIndex=r, ColumnIndex=c, RowSpan=1, ColumnSpan=1))
+            children.append(block(blocks, 'TABLE', p, geometry(0.1, 0.8, 0.5, 0.1), children=cells))
+        # Each page's PAGE block comes before its children
+        blocks.insert(page_start, {'BlockType': 'PAGE', 'Id': f"P{p}", 'Page': p, 'Geometry': geometry(0, 0, 1, 1),
+                       'Relationships': [{'Type': 'CHILD', 'Ids': children}]})
+    # Textract returns pages of up to 1000 blocks
+    return [{'Blocks': blocks[i:i + 1000]} for i in range(0, len(blocks), 1000)]
+
+def run(response, forms, tables, bundle):
+    objects.clear()
+    table = Table()
+    start = time.perf_counter()
+    opg = og.OutputGenerator('doc', response, 'bucket', 'book.pdf', forms, tables, table, bundle=bundle)
+    opg.run()
+    seconds = time.perf_counter() - start
+    stored = sum(len(content) for content in objects.values())
+    return opg, len(objects), stored, len(table.items), seconds
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--lines', type=int, default=40)
+    parser.add_argument('--forms', action='store_true')
+    parser.add_argument('--tables', action='store_true')
+    parser.add_argument('--reads', type=int, default=20)
+    args = parser.parse_args()
+
+    helper.S3Helper.writeToS3 = staticmethod(write)
+    helper.S3Helper.openWriter = staticmethod(
+        lambda bucketName, s3FileName, awsRegion=None: helper.S3StreamWriter(bucketName, s3FileName, client=MemoryS3()))
+    helper.S3Helper.readRangeFromS3 = staticmethod(read_range)
+
+    rng = random.Random(0)
+    response = make_response(rng, args.pages, args.lines, args.forms, args.tables)
+
+    print(f"{'layout':>8} {'objects':>8} {'MB':>8} {'items':>7} {'write s':>8}")
+    for bundle in [False, True]:
+        opg, count, stored, items, seconds = run(response, args.forms, args.tables, bundle)
+        print(f"{'bundle' if bundle else 'pages':>8} {count:>8} {stored / 2**20:>8.2f} {items:>7} {seconds:>8.2f}")
+
+    # opg is the bundle run; read pages back with ranged reads, as a reader with the index would
+    start = time.perf_counter()
+    for p in rng.sample(sorted(opg.bundleIndex), min(args.reads, len(opg.bundleIndex))):
+        record = og.readBundlePage('bucket', opg.bundleIndex[p])
+        assert record['page'] == p
+    print(f"{args.reads} single page reads from the bundle: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
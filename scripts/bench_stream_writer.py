@@ -0,0 +1,142 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Measures the memory used to write a Textract response as JSON and a
+# document's tables as CSV, encoding the whole object before the upload as
+# the job result processor used to, against S3StreamWriter's multipart
+# uploads. Uploads go to a client that only counts bytes. Memory is the
+# peak allocated while writing, above what the response itself takes. The
+# script fails if a streamed peak grows past a few parts, or grows with
+# the document rather than staying flat.
+#
+#   python scripts/bench_stream_writer.py --pages 250 1000 4000 --part-mb 5
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..', 'cdk', 'lambda', 'helper', 'python'))
+
+import helper
+from helper import S3StreamWriter
+
+class CountingS3:
+    # The calls S3StreamWriter makes; bodies are counted and dropped
+    def __init__(self):
+        self.bytes = 0
+
+    def put_object(self, Bucket, Key, Body):
+        self.bytes = self.bytes + len(Body)
+
+    def create_multipart_upload(self, Bucket, Key):
+        return {'UploadId': Key}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.bytes = self.bytes + len(Body)
+        return {'ETag': str(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        pass
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        pass
+
+def make_response(pages, lines):
+    blocks = []
+    for p in range(1, pages + 1):
+        for l in range(lines):
+            blocks.append({'BlockType': 'LINE', 'Id': f"{p}-{l}", 'Page': p, 'Confidence': 99.5,
+                           'Text': f"Line {l} of page {p}, total assets and liabilities for the period",
+                           'Geometry': {'BoundingBox': {'Width': 0.8, 'Height': 0.01, 'Left': 0.1, 'Top': l / lines}}})
+    return [{'Blocks': blocks[i:i + 1000]} for i in range(0, len(blocks), 1000)]
+
+def table_rows(pages, rows):
+    for p in range(pages):
+        yield ["Table"]
+        for r in range(rows):
+            yield [f"{p}", f"row {r}", f"{r * 1000.5:.2f}", f"{r * 7 % 13}", "account description"]
+        yield []
+        yield []
+
+def measure(write):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    size = write()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, size, seconds
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, nargs='+', default=[250, 1000, 4000])
+    parser.add_argument('--lines', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=40)
+    parser.add_argument('--part-mb', type=float, default=5)
+    args = parser.parse_args()
+    part_size = int(args.part_mb * 2**20)
+
+    def buffered_json(response):
+        client = CountingS3()
+        client.put_object(Bucket='bucket', Key='response.json', Body=json.dumps(response).encode('utf-8'))
+        return client.bytes
+
+    def streamed_json(response):
+        client = CountingS3()
+        helper.S3Helper.openWriter = staticmethod(
+            lambda bucketName, s3FileName, awsRegion=None: S3StreamWriter(bucketName, s3FileName, part_size, client=client))
+        helper.S3Helper.writeJSON(response, 'bucket', 'response.json')
+        return client.bytes
+
+    def buffered_csv(pages):
+        csv_file = io.StringIO()
+        writer = csv.writer(csv_file)
+        for row in list(table_rows(pages, args.rows)):
+            writer.writerow(row)
+        client = CountingS3()
+        client.put_object(Bucket='bucket', Key='tables.csv', Body=csv_file.getvalue().encode('utf-8'))
+        return client.bytes
+
+    def streamed_csv(pages):
+        client = CountingS3()
+        helper.S3Helper.openWriter = staticmethod(
+            lambda bucketName, s3FileName, awsRegion=None: S3StreamWriter(bucketName, s3FileName, part_size, client=client))
+        helper.S3Helper.writeCSVRaw(table_rows(pages, args.rows), 'bucket', 'tables.csv')
+        return client.bytes
+
+    streamed_peaks = {'json': [], 'csv': []}
+    print(f"{'pages':>6} {'output':>7} {'MB':>7} {'buffered MB':>12} {'streamed MB':>12} {'buffered s':>11} {'streamed s':>11}")
+    for pages in args.pages:
+        response = make_response(pages, args.lines)
+        peak_b, size, seconds_b = measure(lambda: buffered_json(response))
+        peak_s, _, seconds_s = measure(lambda: streamed_json(response))
+        streamed_peaks['json'].append((size, peak_s))
+        print(f"{pages:>6} {'json':>7} {size / 2**20:>7.1f} {peak_b / 2**20:>12.1f} {peak_s / 2**20:>12.1f} "
+              f"{seconds_b:>11.2f} {seconds_s:>11.2f}")
+        del response
+        peak_b, size, seconds_b = measure(lambda: buffered_csv(pages))
+        peak_s, _, seconds_s = measure(lambda: streamed_csv(pages))
+        streamed_peaks['csv'].append((size, peak_s))
+        print(f"{pages:>6} {'csv':>7} {size / 2**20:>7.1f} {peak_b / 2**20:>12.1f} {peak_s / 2**20:>12.1f} "
+              f"{seconds_b:>11.2f} {seconds_s:>11.2f}")
+
+    # A buffer of one part, the part being sent, and one encoded item or row of slack.
+    # Outputs under two parts are still filling the first one, so only larger ones must be flat.
+    for output, runs in streamed_peaks.items():
+        for size, peak in runs:
+            assert peak <= 3 * part_size, f"{output} streamed peak {peak / 2**20:.1f} MB is over 3 parts"
+        peaks = [peak for size, peak in runs if size >= 2 * part_size]
+        if len(peaks) > 1:
+            assert max(peaks) <= 1.25 * min(peaks), \
+                f"{output} streamed peak grew from {min(peaks) / 2**20:.1f} MB to {max(peaks) / 2**20:.1f} MB"
+    print("Streamed peaks stay flat")
+
+if __name__ == "__main__":
+    main()
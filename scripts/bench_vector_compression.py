@@ -0,0 +1,98 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Compares the flat index with float32, float16 and int8 vector storage,
+# with and without exact re-ranking, against the uncompressed index. Reports
+# disk size (the re-rank file is listed separately because it is only read
+# for the candidates, and the total is compared with float32), load time,
+# heap allocated by loading, recall@k against exact search and query
+# latency. A float32 index is memory mapped, so its vectors are page cache
+# rather than heap; compressed ones are dequantized to float32 on the heap.
+#
+#   python scripts/bench_vector_compression.py --size 100000 --dim 384 --k 4 --rerank 4
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..', 'cdk', 'fargate', 'common'))
+
+from vector_index import VectorIndex, FLAT
+
+def make_vectors(rng, n, dim, clusters):
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return centers[labels] + 0.35 * rng.normal(size=(n, dim)).astype(np.float32)
+
+def disk_usage(directory):
+    index_bytes = 0
+    rerank_bytes = 0
+    for name in os.listdir(directory):
+        size = os.path.getsize(os.path.join(directory, name))
+        if name == 'full_vectors.npy':
+            rerank_bytes = rerank_bytes + size
+        elif name.endswith('.npy'):
+            index_bytes = index_bytes + size
+    return index_bytes, rerank_bytes
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--k', type=int, default=4)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--clusters', type=int, default=256)
+    parser.add_argument('--rerank', type=int, default=4, help='candidates re-scored per result')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(rng, args.size, args.dim, args.clusters)
+    queries = make_vectors(rng, args.queries, args.dim, args.clusters)
+    texts = [str(i) for i in range(args.size)]
+
+    configs = [('float32', 0), ('float16', 0), ('float16', args.rerank), ('int8', 0), ('int8', args.rerank)]
+    truth = None
+    print(f"{'storage':>8} {'rerank':>6} {'index MB':>9} {'rerank MB':>10} {'total MB':>9} {'vs f32':>7} "
+          f"{'load s':>7} {'heap MB':>8} {'recall':>7} {'p50 ms':>7} {'p99 ms':>7}")
+    float32_bytes = None
+    for compression, rerank in configs:
+        with tempfile.TemporaryDirectory() as directory:
+            VectorIndex.build(directory, vectors, texts, index_type=FLAT, compression=compression, rerank=rerank)
+            index_bytes, rerank_bytes = disk_usage(directory)
+            if float32_bytes is None:
+                float32_bytes = index_bytes + rerank_bytes
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            index = VectorIndex.load(directory)
+            load_seconds = time.perf_counter() - start
+            memory, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            results = []
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                results.append({int(text) for text, _, _ in index.search(query, args.k)})
+                latencies.append(time.perf_counter() - start)
+            # The uncompressed index is exact, so it is the reference
+            if truth is None:
+                truth = results
+            recall = sum(len(r & t) for r, t in zip(results, truth)) / (args.k * len(queries))
+            total = index_bytes + rerank_bytes
+            print(f"{compression:>8} {rerank:>6} {index_bytes / 2**20:9.1f} {rerank_bytes / 2**20:10.1f} "
+                  f"{total / 2**20:9.1f} {total / float32_bytes:6.2f}x "
+                  f"{load_seconds:7.2f} {memory / 2**20:8.1f} {recall:7.3f} "
+                  f"{percentile(latencies, 0.5) * 1000:7.2f} {percentile(latencies, 0.99) * 1000:7.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Measures recall@k against exact search and query latency of the ANN index
+# types the embedding worker can build, at several index sizes. Vectors are
+# drawn from a Gaussian mixture so they cluster roughly like text embeddings.
+# The hnsw index type is skipped if hnswlib is not installed.
+#
+#   python scripts/bench_vector_index.py --sizes 10000,100000,500000 --dim 384 --k 4
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..', 'cdk', 'fargate', 'common'))
+
+from vector_index import VectorIndex, squared_l2, HNSW, IVF
+
+def make_vectors(rng, n, dim, clusters):
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return centers[labels] + 0.35 * rng.normal(size=(n, dim)).astype(np.float32)
+
+def exact_search(vectors, norms, query, k):
+    distances = squared_l2(vectors, query, norms)
+    idx = np.argpartition(distances, k - 1)[:k]
+    return idx[np.argsort(distances[idx])]
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def report(name, size, build_seconds, latencies, recall):
+    print(f"{name:>6} n={size:<8} build {build_seconds:8.2f}s  recall {recall:.3f}  "
+          f"p50 {percentile(latencies, 0.5) * 1000:7.3f} ms  p99 {percentile(latencies, 0.99) * 1000:7.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10000,50000,200000')
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--k', type=int, default=4)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--clusters', type=int, default=256)
+    parser.add_argument('--index-types', default='hnsw,ivf')
+    parser.add_argument('--hnsw-m', type=int, default=16)
+    parser.add_argument('--hnsw-ef-construction', type=int, default=200)
+    parser.add_argument('--hnsw-ef-search', type=int, default=64)
+    parser.add_argument('--ivf-nprobe', type=int, default=0, help='0 picks nlist / 8')
+    args = parser.parse_args()
+
+    params = {
+        HNSW: {'M': args.hnsw_m, 'ef_construction': args.hnsw_ef_construction, 'ef_search': args.hnsw_ef_search},
+        IVF: {'nprobe': args.ivf_nprobe},
+    }
+    index_types = args.index_types.split(',')
+    if HNSW in index_types:
+        try:
+            import hnswlib
+        except ImportError:
+            print("hnswlib is not installed, skipping hnsw")
+            index_types.remove(HNSW)
+
+    rng = np.random.default_rng(0)
+    for size in [int(s) for s in args.sizes.split(',')]:
+        vectors = make_vectors(rng, size, args.dim, args.clusters)
+        queries = make_vectors(rng, args.queries, args.dim, args.clusters)
+        texts = [str(i) for i in range(size)]
+
+        norms = np.einsum('ij,ij->i', vectors, vectors)
+        truth = []
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            truth.append(set(exact_search(vectors, norms, query, args.k).tolist()))
+            latencies.append(time.perf_counter() - start)
+        report('exact', size, 0, latencies, 1.0)
+
+        for index_type in index_types:
+            with tempfile.TemporaryDirectory() as directory:
+                meta = VectorIndex.build(directory, vectors, texts, index_type=index_type, **params[index_type])
+                index = VectorIndex.load(directory)
+                hits = 0
+                latencies = []
+                for query, expected in zip(queries, truth):
+                    start = time.perf_counter()
+                    found = index.search(query, args.k)
+                    latencies.append(time.perf_counter() - start)
+                    hits = hits + len(expected & {int(text) for text, _, _ in found})
+                report(index_type, size, meta['buildSeconds'], latencies, hits / (args.k * len(queries)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Checks OutputGenerator.outputColumnar on a synthetic Textract analysis
+# response with tables and forms. Every output is written to in-memory
+# stores; the columnar file is read back with pyarrow, and its rows are
+# compared with the table cells and form fields of the trp document, for
+# both Parquet and Arrow IPC and for a whole document and one part of a
+# split one. Needs pyarrow installed.
+#
+#   python scripts/check_columnar_output.py --pages 30
+
+import argparse
+import os
+import random
+import shutil
+import sys
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..', 'cdk', 'lambda', 'helper', 'python'))
+sys.path.insert(0, os.path.join(here, '..', 'cdk', 'lambda', 'textractor', 'python'))
+
+import helper
+import og
+from bench_output_bundle import MemoryS3, Table, make_response, write
+
+uploads = {}
+
+class UploadingS3(MemoryS3):
+    # outputColumnar uploads its local file; keep a copy to read back
+    def upload_file(self, Filename, Bucket, Key):
+        copy = "{}.check".format(Filename)
+        shutil.copyfile(Filename, copy)
+        uploads[Key] = copy
+
+def read_rows(path, ext):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if ext == 'arrow':
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).read_all().to_pylist()
+    return pq.read_table(path).to_pylist()
+
+def expected_rows(opg, pageNumbers):
+    rows = []
+    for p, page in zip(pageNumbers, opg.document.pages):
+        for t, table in enumerate(page.tables):
+            for row in table.rows:
+                for cell in row.cells:
+                    rows.append(('table', p, table.id, t, cell.rowIndex, cell.columnIndex, None,
+                                 cell.text.rstrip(', ')))
+        for field in page.form.fields:
+            rows.append(('form', p, None, None, None, None, field.key.text, field.value.text))
+    return rows
+
+def response_pages(response):
+    return sorted(set(b['Page'] for r in response for b in r['Blocks']))
+
+def check(response, columnar, part):
+    uploads.clear()
+    table = Table()
+    pageNumbers = None
+    if part is not None:
+        # As if this response were the second part of a split document
+        pageNumbers = [p + 1000 for p in range(1, len(response_pages(response)) + 1)]
+    opg = og.OutputGenerator('doc', response, 'bucket', 'book.pdf', True, True, table,
+                             pageNumbers=pageNumbers, part=part, columnar=columnar)
+    opg.run()
+
+    ext = 'arrow' if columnar == 'arrow' else 'parquet'
+    name = 'tables-forms.{}'.format(ext) if part is None else 'tables-forms-part-{}.{}'.format(part, ext)
+    key = "{}{}".format(opg.outputPath, name)
+    assert list(uploads) == [key], uploads
+    items = [i for i in table.items if i['outputType'].startswith('Columnar')]
+    assert len(items) == 1 and items[0]['outputPath'] == key, items
+
+    rows = read_rows(uploads[key], ext)
+    os.remove(uploads[key])
+    assert all(r['documentId'] == 'doc' for r in rows)
+    found = [(r['kind'], r['page'], r['tableId'], r['tableIndex'], r['row'], r['column'], r['key'], r['value'])
+             for r in rows]
+    expected = expected_rows(opg, opg.pageNumbers or list(range(1, len(opg.document.pages) + 1)))
+    assert found == expected, "rows differ from the trp document"
+    for r in rows:
+        if r['kind'] == 'table':
+            assert r['rowSpan'] == 1 and r['columnSpan'] == 1 and r['confidence'] is not None
+            assert r['key'] is None and r['keyConfidence'] is None
+        else:
+            assert r['tableId'] is None and r['row'] is None and r['keyConfidence'] is not None
+    print(f"{ext:>8} {'part ' + str(part) if part is not None else 'document':>9} {len(rows):>7} rows ok")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=30)
+    parser.add_argument('--lines', type=int, default=10)
+    args = parser.parse_args()
+
+    helper.S3Helper.writeToS3 = staticmethod(write)
+    client = UploadingS3()
+    helper.S3Helper.openWriter = staticmethod(
+        lambda bucketName, s3FileName, awsRegion=None: helper.S3StreamWriter(bucketName, s3FileName, client=client))
+    helper.AwsHelper.getClient = lambda self, name, awsRegion=None: client
+
+    response = make_response(random.Random(0), args.pages, args.lines, True, True)
+    for columnar in ['parquet', 'arrow']:
+        for part in [None, 1]:
+            check(response, columnar, part)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Checks which path the ingest processor sends small PDFs down. PDFs are
+# generated with a text layer on some or all pages and run through
+# lambda_handler with S3, DynamoDB, Textract and the output generator
+# replaced by in-memory fakes. A PDF with at most SMALL_DOC_MAX_PAGES pages
+# must go to the small document worker; a longer one must go to the async
+# pipeline even when every page has a text layer, and even when its few
+# scanned pages are detected synchronously. Needs pypdf installed.
+#
+#   python scripts/check_ingest_routing.py
+
+import importlib.util
+import os
+import sys
+
+here = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(here, '..', 'cdk', 'lambda', 'helper', 'python'))
+sys.path.insert(0, os.path.join(here, '..', 'cdk', 'lambda', 'textractor', 'python'))
+
+spec = importlib.util.spec_from_file_location(
+    'ingestprocessor', os.path.join(here, '..', 'cdk', 'lambda', 'ingestprocessor', 'lambda_function.py'))
+ingest = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ingest)
+
+LINE = "The quick brown fox jumps over the lazy dog, page {} of a born-digital report."
+
+def make_pdf(pages, scanned=()):
+    """Returns a PDF with a line of text on every page except the scanned ones."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for p in range(1, pages + 1):
+        text = b"" if p in scanned else "BT /F1 10 Tf 72 720 Td ({}) Tj ET".format(LINE.format(p)).encode()
+        objects.append(b"<< /Length " + str(len(text)).encode() + b" >>\nstream\n" + text + b"\nendstream")
+        objects.append("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+                       "/Contents {} 0 R >>".format(len(objects)).encode())
+        kids.append("{} 0 R".format(len(objects)))
+    objects[1] = "<< /Type /Pages /Kids [{}] /Count {} >>".format(" ".join(kids), pages).encode()
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf = pdf + str(i).encode() + b" 0 obj\n" + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf = pdf + "xref\n0 {}\n0000000000 65535 f \n".format(len(objects) + 1).encode()
+    for offset in offsets:
+        pdf = pdf + "{:010d} 00000 n \n".format(offset).encode()
+    pdf = pdf + "trailer\n<< /Size {} /Root 1 0 R >>\nstartxref\n{}\n%%EOF\n".format(len(objects) + 1, xref).encode()
+    return pdf
+
+calls = []
+
+class FakeClient:
+    def __init__(self, document):
+        self.document = document
+
+    def download_file(self, Bucket, Key, Filename):
+        with open(Filename, 'wb') as f:
+            f.write(self.document)
+
+class FakeDocumentStore:
+    # Records every call; advancePipelineStage returns no error
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            calls.append(name)
+            return None
+        return call
+
+class FakeOutputGenerator:
+    def __init__(self, docId, responses, bucket, name, forms, tables, ddb, nativePages=None, **kwargs):
+        self.outputPath = "{}-analysis/{}/".format(name, docId)
+        self.pages = len(responses) + len(nativePages or {})
+
+    def run(self):
+        calls.append('outputs')
+
+def detect(page):
+    calls.append('detectText')
+    return {'Blocks': [{'BlockType': 'PAGE', 'Id': 'page'}]}
+
+def route(pages, scanned=()):
+    calls.clear()
+    document = make_pdf(pages, scanned)
+    ingest.AwsHelper.getClient = lambda self, name, awsRegion=None: FakeClient(document)
+    ingest.AwsHelper.getResource = lambda self, name, awsRegion=None: type('Resource', (), {'Table': lambda self, name: None})()
+    result = ingest.lambda_handler({'docId': 'doc', 'bucket': 'bucket', 'name': 'report.pdf'}, None)
+    assert result['statusCode'] == 200, result
+    return list(calls)
+
+def main():
+    os.environ.update({'OUTPUT_TABLE': 'outputs', 'DOCUMENTS_TABLE': 'documents', 'SMALL_DOC_MAX_PAGES': '5'})
+    ingest.datastore.DocumentStore = FakeDocumentStore
+    ingest.OutputGenerator = FakeOutputGenerator
+    ingest.S3Helper.writeToS3 = staticmethod(lambda content, bucketName, s3FileName, awsRegion=None: None)
+    ingest.TextractHelper.detectText = staticmethod(detect)
+    ingest.TextractHelper.startTextDetection = staticmethod(
+        lambda *args, **kwargs: calls.append('startTextDetection') or 'job')
+    ingest.startSummaryAndEmbedding = lambda docId, bucket, name: calls.append('smallDocWorker')
+    ingest.startPipeline = lambda docId, bucket, name: calls.append('asyncPipeline')
+
+    checks = [
+        ("3 text pages", route(3), 'smallDocWorker'),
+        ("5 text pages", route(5), 'smallDocWorker'),
+        ("2 text and 2 scanned pages", route(4, scanned=(2, 4)), 'smallDocWorker'),
+        ("6 text pages", route(6), 'asyncPipeline'),
+        ("300 text pages", route(300), 'asyncPipeline'),
+        ("10 text and 2 scanned pages", route(12, scanned=(3, 7)), 'asyncPipeline'),
+    ]
+    for label, found, expected in checks:
+        assert expected in found, f"{label}: expected {expected}, got {found}"
+        assert 'startTextDetection' not in found, f"{label}: started an async Textract job"
+        print(f"{label:>28}: {expected} ok")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Checks that a half-open circuit breaker is settled when its probe loses to
+# a hedged request. Endpoint a is opened, cooled down and then sent a slow
+# probe; endpoint b answers the hedge first. Once the probe completes, a's
+# breaker must be closed if the probe succeeded and open again if it failed,
+# never stuck half-open, and no request may be left in flight.
+#
+#   python scripts/check_invoker_breaker.py
+
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'cdk', 'fargate', 'common'))
+
+from botocore.exceptions import ClientError
+from invoker import CircuitBreaker, EndpointInvoker
+
+RESET_TIMEOUT = 0.2
+PROBE_LATENCY = 0.3
+HEDGE_LATENCY = 0.01
+
+class ProbeClient:
+    """Answers slowly from endpoint a, failing if asked to, and quickly from endpoint b."""
+
+    def __init__(self, probe_fails):
+        self.probe_fails = probe_fails
+        self.requests = []
+
+    def invoke_endpoint(self, EndpointName, ContentType, Body):
+        self.requests.append(EndpointName)
+        if EndpointName == 'a':
+            time.sleep(PROBE_LATENCY)
+            if self.probe_fails:
+                raise ClientError({'Error': {'Code': 'ServiceUnavailable', 'Message': 'ServiceUnavailable'},
+                                   'ResponseMetadata': {'HTTPStatusCode': 503}}, 'InvokeEndpoint')
+        else:
+            time.sleep(HEDGE_LATENCY)
+        return {'Body': io.BytesIO(b'{"endpoint": "' + EndpointName.encode() + b'"}')}
+
+def check(probe_fails):
+    client = ProbeClient(probe_fails)
+    invoker = EndpointInvoker(client=client, deadline=2.0, hedge=True, min_hedge_delay=0.05,
+                              hedge_min_samples=1, failure_threshold=1, reset_timeout=RESET_TIMEOUT)
+    pool = invoker.pool('a,b')
+    # a has no latency estimate yet, so the pool picks it over b for the probe
+    pool.acquire('b')
+    pool.release('b', HEDGE_LATENCY)
+    invoker.stats_for('a').record(HEDGE_LATENCY)
+    breaker = invoker.breaker_for('a')
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(RESET_TIMEOUT)
+
+    body = invoker.invoke('a,b', b'{}')
+    assert body == b'{"endpoint": "b"}', body
+    assert client.requests == ['a', 'b'], client.requests
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    invoker.close()
+    expected = CircuitBreaker.OPEN if probe_fails else CircuitBreaker.CLOSED
+    assert breaker.state == expected, f"breaker is {breaker.state} after the probe, expected {expected}"
+    stats = invoker.stats()
+    assert stats['a']['hedgeWins'] == 1, stats['a']
+    assert all(s['inFlight'] == 0 for s in stats.values()), stats
+    if not probe_fails:
+        assert breaker.allow()
+    print(f"probe {'failed' if probe_fails else 'succeeded'}: breaker {breaker.state} ok")
+
+def main():
+    check(False)
+    check(True)
+
+if __name__ == "__main__":
+    main()
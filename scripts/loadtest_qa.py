@@ -0,0 +1,83 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# Closed-loop load test for the QA worker. Run it once against the container
+# started with serving_mode=dev (Flask development server) and once with the
+# default gunicorn mode, using the same document and questions, and compare
+# requests per second per vCPU.
+#
+#   python scripts/loadtest_qa.py --url http://localhost:5000/ --doc-id <docId> \
+#       --question "What was the net revenue?" --concurrency 32 --duration 60 --vcpus 4
+
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+
+def ask(url, docId, question, timeout):
+    body = json.dumps({'docId': docId, 'question': question}).encode('utf-8')
+    req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            payload = json.loads(resp.read())
+            return str(payload.get('code', resp.status))
+    except urllib.error.HTTPError as e:
+        return str(e.code)
+    except Exception as e:
+        return type(e).__name__
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:5000/')
+    parser.add_argument('--doc-id', required=True)
+    parser.add_argument('--question', action='append', required=True,
+                        help='may be given several times; questions are used round robin')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--vcpus', type=float, default=4, help='vCPUs of the task under test')
+    args = parser.parse_args()
+
+    lock = threading.Lock()
+    latencies = []
+    outcomes = Counter()
+    stop_at = time.monotonic() + args.duration
+
+    def client(n):
+        i = n
+        while time.monotonic() < stop_at:
+            question = args.question[i % len(args.question)]
+            # Vary the text so single-flight coalescing does not hide server throughput
+            question = f"{question} ({n}-{i})" if len(args.question) == 1 else question
+            start = time.monotonic()
+            outcome = ask(args.url, args.doc_id, question, args.timeout)
+            elapsed = time.monotonic() - start
+            with lock:
+                outcomes[outcome] += 1
+                if outcome == '200':
+                    latencies.append(elapsed)
+            i = i + args.concurrency
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+
+    latencies.sort()
+    ok = len(latencies)
+    rps = ok / elapsed
+    print(f"duration {elapsed:.1f}s, concurrency {args.concurrency}")
+    print(f"outcomes: {dict(outcomes)}")
+    print(f"successful req/s: {rps:.2f}, per vCPU: {rps / args.vcpus:.2f}")
+    if ok:
+        print(f"latency p50 {latencies[ok // 2] * 1000:.0f} ms, "
+              f"p99 {latencies[min(ok - 1, int(0.99 * ok))] * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()